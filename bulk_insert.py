@@ -1,14 +1,20 @@
 import logging
-from pymilvus import connections, FieldSchema, CollectionSchema, DataType, Collection, utility
+from pymilvus import FieldSchema, CollectionSchema, DataType
 import numpy as np
-from pymilvus.bulk_writer import bulk_import, list_import_jobs, RemoteBulkWriter, BulkFileType
+from pymilvus import bulk_writer as pymilvus_bulk_writer
+from pymilvus.bulk_writer import RemoteBulkWriter, BulkFileType
 import json, time
 import os
+import hashlib
+import concurrent.futures
 import pandas as pd
 import pyarrow.parquet as pq
 from minio import Minio 
 from minio.error import S3Error
 
+import milvus_backend
+from milvus_backend import connections, Collection, utility
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -16,24 +22,473 @@ logging.basicConfig(
     datefmt='%Y-%m-%d %H:%M:%S'
 )
 
+# Third-party constants
+MINIO_ENDPOINT = os.environ.get('MINIO_ENDPOINT', 'localhost:9000')
+ACCESS_KEY="minioadmin"
+SECRET_KEY="minioadmin"
+BUCKET_NAME="a-bucket"
+
+
+class ImportJournal:
+    """Append-only JSON-lines checkpoint of a bulk import run
+
+    Every finished step is one line, so a crashed run can be resumed by replaying
+    the journal and skipping whatever is already recorded:
+        {"event": "run", "collection": ..., "remote_path": ...}
+        {"event": "rewritten", "source": ..., "files": [[...]]}
+        {"event": "uploaded", "source": ..., "object": ..., "etag": ...}
+        {"event": "import_submitted", "job_id": ..., "files": [[...]]}
+        {"event": "import_done", "job_id": ..., "files": [[...]]}
+        {"event": "import_failed", "job_id": ..., "files": [[...]], "reason": ...}
+        {"event": "finished"}
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.events = []
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    line = line.strip()
+                    if line:
+                        self.events.append(json.loads(line))
+
+    def record(self, event: str, **kwargs):
+        entry = dict(event=event, **kwargs)
+        with open(self.path, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.events.append(entry)
+
+    def reset(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.events = []
+
+    def _find(self, event: str) -> list:
+        return [e for e in self.events if e["event"] == event]
+
+    @property
+    def resumable(self) -> bool:
+        return bool(self._find("run")) and not self._find("finished")
+
+    @property
+    def remote_path(self) -> str:
+        return self._find("run")[-1]["remote_path"]
+
+    def rewritten(self, source: str):
+        for e in self._find("rewritten"):
+            if e["source"] == source:
+                return e["files"]
+        return None
+
+    def uploaded(self, source: str):
+        for e in reversed(self._find("uploaded")):
+            if e["source"] == source:
+                return e
+        return None
+
+    def imported_files(self) -> set:
+        return {f for e in self._find("import_done") for group in e["files"] for f in group}
+
+    def pending_jobs(self) -> list:
+        done = {e["job_id"] for e in self._find("import_done") + self._find("import_failed")}
+        return [e for e in self._find("import_submitted") if e["job_id"] not in done]
+
+
+# Milvus rejects import requests with more files than dataCoord.import.maxImportFileNumPerReq
+MAX_FILES_PER_IMPORT = 1024
+
+
+def split_import_jobs(files: list, num_jobs: int) -> list:
+    """Split the `files` list of bulk_import into at most `num_jobs` even shards"""
+    if not files:
+        return []
+    shard_size = min(-(-len(files) // num_jobs), MAX_FILES_PER_IMPORT)
+    return [files[i:i + shard_size] for i in range(0, len(files), shard_size)]
+
+
+def submit_import_job(url: str, collection_name: str, files: list, journal: ImportJournal, import_api=pymilvus_bulk_writer) -> str:
+    resp = import_api.bulk_import(
+        url,
+        collection_name,
+        files=files,
+    )
+    job_id = resp.json()['data']['jobId']
+    journal.record("import_submitted", job_id=job_id, files=files)
+    logging.info(f"Bulk import job started: {job_id}, files: {len(files)}")
+    return job_id
+
+
+def monitor_import_jobs(
+    url: str,
+    job_ids: list,
+    import_api=pymilvus_bulk_writer,
+    min_interval: float = 1,
+    max_interval: float = 30,
+) -> tuple:
+    """Poll import jobs by jobId until all of them completed or failed
+
+    Polling starts at `min_interval` and backs off exponentially up to `max_interval`
+    while no job makes progress.
+
+    return: {job_id: job_data} of completed jobs, {job_id: reason} of failed jobs
+    """
+    unfinished = set(job_ids)
+    status = {}
+    interval = min_interval
+    last_snapshot = None
+
+    while unfinished:
+        for job_id in list(unfinished):
+            job_data = import_api.get_import_progress(url, job_id).json().get('data') or {}
+            if not job_data.get('state'):
+                job_data = dict(state='Failed', reason=f"job {job_id} not found")
+            status[job_id] = job_data
+            if job_data['state'] in ('Completed', 'Failed'):
+                unfinished.discard(job_id)
+
+        snapshot = tuple((job_id, status[job_id]['state'], status[job_id].get('progress', 0)) for job_id in job_ids)
+        if snapshot != last_snapshot:
+            interval = min_interval
+            progress = sum(status[job_id].get('progress', 0) for job_id in job_ids) / len(job_ids)
+            imported_rows = sum(status[job_id].get('importedRows', 0) for job_id in job_ids)
+            failed = sum(status[job_id]['state'] == 'Failed' for job_id in job_ids)
+            logging.info(
+                f"Import progress: {progress:.1f}%, jobs done {len(job_ids) - len(unfinished)}/{len(job_ids)}, "
+                f"failed {failed}, imported rows {imported_rows}"
+            )
+        else:
+            interval = min(interval * 2, max_interval)
+        last_snapshot = snapshot
+
+        if unfinished:
+            time.sleep(interval)
+
+    completed = {job_id: data for job_id, data in status.items() if data['state'] == 'Completed'}
+    failed = {job_id: data.get('reason', '') for job_id, data in status.items() if data['state'] == 'Failed'}
+    return completed, failed
+
+
+def import_files(
+    url: str,
+    collection_name: str,
+    files: list,
+    journal: ImportJournal,
+    import_api=pymilvus_bulk_writer,
+    num_jobs: int = 4,
+    max_retries: int = 2,
+    running: dict = None,
+) -> int:
+    """Import `files` as up to `num_jobs` parallel jobs, resubmitting failed shards
+
+    `running` holds {job_id: files} of jobs already submitted which are tracked
+    together with the new ones. return: total imported rows
+    """
+    jobs = dict(running or {})
+    for shard in split_import_jobs(files, num_jobs):
+        jobs[submit_import_job(url, collection_name, shard, journal, import_api)] = shard
+
+    imported_rows = 0
+    for attempt in range(max_retries + 1):
+        if not jobs:
+            break
+        completed, failed = monitor_import_jobs(url, list(jobs), import_api)
+        for job_id, job_data in completed.items():
+            journal.record("import_done", job_id=job_id, files=jobs[job_id])
+            imported_rows += job_data.get('importedRows', 0)
+        for job_id, reason in failed.items():
+            journal.record("import_failed", job_id=job_id, files=jobs[job_id], reason=reason)
+            logging.warning(f"Bulk import job {job_id} failed: {reason}")
+
+        if not failed:
+            break
+        if attempt == max_retries:
+            reasons = "; ".join(f"{job_id}: {reason}" for job_id, reason in failed.items())
+            raise Exception(f"Bulk import failed after {max_retries} retries: {reasons}")
+
+        logging.info(f"Retrying {len(failed)} failed import jobs, attempt {attempt + 1}/{max_retries}")
+        jobs = {
+            submit_import_job(url, collection_name, jobs[job_id], journal, import_api): jobs[job_id]
+            for job_id in failed
+        }
+
+    logging.info(f"Bulk import finished, imported rows: {imported_rows}")
+    return imported_rows
+
+
+def multipart_etag(file_path: str, part_size: int) -> str:
+    """ETag S3 reports for `file_path` uploaded with `part_size`
+
+    Single part uploads get the md5 of the content, multipart uploads get the md5 of
+    the concatenated part md5s suffixed with the number of parts.
+    """
+    part_md5s = []
+    with open(file_path, "rb") as f:
+        while True:
+            chunk = f.read(part_size)
+            if not chunk:
+                break
+            part_md5s.append(hashlib.md5(chunk))
+
+    if len(part_md5s) <= 1:
+        return part_md5s[0].hexdigest() if part_md5s else hashlib.md5(b"").hexdigest()
+    combined = hashlib.md5(b"".join(m.digest() for m in part_md5s))
+    return f"{combined.hexdigest()}-{len(part_md5s)}"
+
+
+def stat_remote_object(minio_client, object_name: str):
+    """stat_object, None if the object does not exist, any other error is raised"""
+    try:
+        return minio_client.stat_object(BUCKET_NAME, object_name)
+    except S3Error as e:
+        if e.code in ("NoSuchKey", "NoSuchObject"):
+            return None
+        raise
+
+
+def upload_one_file(minio_client, file_path: str, object_name: str, part_size: int) -> tuple:
+    """Upload a single file unless the remote object has the same size and ETag
+
+    return: etag, bytes uploaded (0 if skipped)
+    """
+    size = os.path.getsize(file_path)
+    etag = multipart_etag(file_path, part_size)
+    remote = stat_remote_object(minio_client, object_name)
+    if remote is not None and remote.size == size and remote.etag == etag:
+        return etag, 0
+
+    result = minio_client.fput_object(
+        BUCKET_NAME,
+        object_name,
+        file_path,
+        part_size=part_size,
+    )
+    return result.etag, size
+
+
+def upload_files(
+    minio_client,
+    files: list,
+    journal: ImportJournal,
+    workers: int = 8,
+    part_size: int = 64*1024*1024,
+):
+    """Upload [(source, file_path, object_name)] with at most `workers` in flight
+
+    Files larger than `part_size` are sent as multipart uploads, objects already
+    present remotely with a matching size and ETag are skipped.
+    """
+    if not files:
+        return
+
+    total_size = sum(os.path.getsize(file_path) for _, file_path, _ in files)
+    sent_bytes = 0
+    start_time = time.perf_counter()
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(upload_one_file, minio_client, file_path, object_name, part_size): (source, object_name)
+            for source, file_path, object_name in files
+        }
+        for done, future in enumerate(concurrent.futures.as_completed(futures), start=1):
+            source, object_name = futures[future]
+            etag, num_bytes = future.result()
+            journal.record("uploaded", source=source, object=object_name, etag=etag)
+            sent_bytes += num_bytes
+
+            cost = time.perf_counter() - start_time
+            action = "Uploaded" if num_bytes else "Skip uploading, same object exists:"
+            logging.info(
+                f"[{done}/{len(files)}] {action} {source}, "
+                f"{sent_bytes/1024/1024:.1f}/{total_size/1024/1024:.1f}MB, {sent_bytes/1024/1024/cost:.1f} MB/s"
+            )
+
+    cost = time.perf_counter() - start_time
+    logging.info(f"Uploaded {sent_bytes/1024/1024:.1f}MB in {cost:.2f}s, {sent_bytes/1024/1024/cost:.1f} MB/s")
+
+
+def run_import_pipeline(
+    parquet_directory: str,
+    schema: CollectionSchema,
+    journal: ImportJournal,
+    rewrite: bool = True,
+    collection_name: str = "bulk_import_test",
+    host: str = os.environ.get('MILVUS_HOST', '127.0.0.1'),
+    minio_client=None,
+    import_api=None,
+    upload_workers: int = 8,
+    part_size: int = 64*1024*1024,
+    import_jobs: int = 4,
+    import_retries: int = 2,
+):
+    """Rewrite or upload the parquet files and import them, checkpointing every step
+
+    Steps already recorded in `journal` are skipped, so calling this again after a
+    crash only redoes the missing work.
+    """
+    url = f"http://{host}:19530"
+    # defaults follow MILVUS_BACKEND, fake MinIO and import services for the local one
+    import_api = import_api or milvus_backend.get_import_api()
+    minio_client = minio_client or milvus_backend.get_minio_client()
+
+    if journal.resumable:
+        remote_path = journal.remote_path
+        logging.info(f"Resuming bulk import from journal {journal.path}, remote path: {remote_path}")
+    else:
+        journal.reset()
+        remote_path = "/bulk_data/" + time.strftime("%Y-%m-%d-%H-%M-%S")
+        journal.record("run", collection=collection_name, remote_path=remote_path)
+
+    file_list = []
+    filenames = sorted(f for f in os.listdir(parquet_directory) if f.endswith('.parquet'))
+
+    if rewrite:
+        # 3. Setup MinIO connection
+        conn = RemoteBulkWriter.S3ConnectParam(
+            endpoint=MINIO_ENDPOINT,
+            access_key=ACCESS_KEY,
+            secret_key=SECRET_KEY,
+            bucket_name=BUCKET_NAME,
+            secure=False
+        )
+
+        # 4. Process Parquet files, one commit per source file so each can be checkpointed
+        writer = None
+        for filename in filenames:
+            done_files = journal.rewritten(filename)
+            if done_files is not None:
+                logging.info(f"Skip rewriting {filename}, already done")
+                file_list.extend(done_files)
+                continue
+
+            if writer is None:
+                writer = RemoteBulkWriter(
+                    schema=schema,
+                    remote_path=remote_path,
+                    connect_param=conn,
+                    file_type=BulkFileType.PARQUET
+                )
+
+            file_path = os.path.join(parquet_directory, filename)
+            df = pq.ParquetDataset(file_path).read().to_pandas()
+            committed = len(writer.batch_files)
+
+            for _, row in df.iterrows():
+                writer.append_row({
+                    "_id": str(row['_id']),
+                    "url": str(row['url']),
+                    "title": str(row['title']),
+                    "text": str(row['text']),
+                    "emb": row['emb'].astype(np.float32).tolist()
+                })
+
+                if (_ + 1) % 10000 == 0:
+                    writer.commit()
+                    logging.info(f"Processed {_ + 1} rows from {filename}")
+
+            writer.commit()
+            new_files = writer.batch_files[committed:]
+            journal.record("rewritten", source=filename, files=new_files)
+            file_list.extend(new_files)
+        logging.info(f"Total files generated: {file_list}")
+    else:
+        # Direct upload to MinIO
+        if minio_client is None:
+            minio_client = Minio(
+                endpoint=MINIO_ENDPOINT,
+                access_key=ACCESS_KEY,
+                secret_key=SECRET_KEY,
+                secure=False
+            )
+
+        # Ensure bucket exists
+        if not minio_client.bucket_exists(BUCKET_NAME):
+            minio_client.make_bucket(BUCKET_NAME)
+
+        # Upload all parquet files which are not uploaded yet
+        pending = []
+        for filename in filenames:
+            object_name = f"{remote_path}/{filename}"
+            file_path = os.path.join(parquet_directory, filename)
+            file_list.append([object_name])
+
+            uploaded = journal.uploaded(filename)
+            if uploaded is not None and uploaded["object"] == object_name:
+                remote = stat_remote_object(minio_client, object_name)
+                if remote is None:
+                    logging.warning(f"Journaled object {object_name} is not found remotely, re-upload it")
+                elif remote.etag == uploaded["etag"]:
+                    logging.info(f"Skip uploading {filename}, already uploaded")
+                    continue
+            pending.append((filename, file_path, object_name))
+
+        upload_files(
+            minio_client,
+            pending,
+            journal,
+            workers=upload_workers,
+            part_size=part_size,
+        )
+        logging.info(f"Total files uploaded: {file_list}")
+
+    # 5. Keep tracking import jobs submitted by an interrupted run
+    running = {}
+    for job in journal.pending_jobs():
+        state = (import_api.get_import_progress(url, job["job_id"]).json().get('data') or {}).get('state')
+        if state in ('Failed', None):
+            logging.info(f"Import job {job['job_id']} from the previous run is lost or failed, resubmit its files")
+            journal.record("import_failed", job_id=job["job_id"], files=job["files"], reason="lost before resume")
+            continue
+        logging.info(f"Tracking import job {job['job_id']} from the previous run")
+        running[job["job_id"]] = job["files"]
+
+    # 6. Execute bulk import for the files not imported yet, in parallel jobs
+    imported = journal.imported_files()
+    imported.update(f for files in running.values() for group in files for f in group)
+    missing = [group for group in file_list if not all(f in imported for f in group)]
+    if not missing and not running:
+        logging.info("All files are already imported")
+    else:
+        # 7. Monitor import progress
+        import_files(
+            url,
+            collection_name,
+            missing,
+            journal,
+            import_api,
+            num_jobs=import_jobs,
+            max_retries=import_retries,
+            running=running,
+        )
+
+    journal.record("finished")
+    return file_list
+
+
 def bulk_insert_from_parquet(
     parquet_directory: str,
     rewrite: bool = True,
     collection_name: str = "bulk_import_test",
     vector_dim: int = 1024,
-    host: str = os.environ.get('MILVUS_HOST', '127.0.0.1')
+    host: str = os.environ.get('MILVUS_HOST', '127.0.0.1'),
+    journal_path: str = "bulk_insert_journal.jsonl",
+    minio_client=None,
+    import_api=None,
+    upload_workers: int = 8,
+    part_size: int = 64*1024*1024,
+    import_jobs: int = 4,
+    import_retries: int = 2,
 ):
     try:
         host = os.environ.get('MILVUS_HOST', '127.0.0.1')
         collection_name = "bulk_import_test"
-        
+        journal = ImportJournal(journal_path)
+
         # 1. Connect to Milvus
         logging.info("Connecting to Milvus server...")
         connections.connect(host=host, port='19530')
-        
-        # Collection management
-        if utility.has_collection(collection_name):
-            utility.drop_collection(collection_name)
 
         # 2. Create collection schema
         schema = CollectionSchema([
@@ -43,117 +498,34 @@ def bulk_insert_from_parquet(
             FieldSchema("text", DataType.VARCHAR, max_length=65535),
             FieldSchema("emb", DataType.FLOAT_VECTOR, dim=1024),
         ])
-        
-        collection = Collection(collection_name, schema, consistency_level="Strong")
-        logging.info(f"Collection created: {collection.name}")
-
-        remote_path = "/bulk_data/" + time.strftime("%Y-%m-%d-%H-%M-%S")
-        file_list = []
-        
-        # Third-party constants
-        minio_endpoint = os.environ.get('MINIO_ENDPOINT', 'localhost:9000')
-        ACCESS_KEY="minioadmin"
-        SECRET_KEY="minioadmin"
-        BUCKET_NAME="a-bucket"
-        
-        if rewrite:
-            # 3. Setup MinIO connection
-            conn = RemoteBulkWriter.S3ConnectParam(
-                endpoint=minio_endpoint,
-                access_key=ACCESS_KEY,
-                secret_key=SECRET_KEY,
-                bucket_name=BUCKET_NAME,
-                secure=False
-            )
 
-            # 4. Process Parquet files
-            writer = RemoteBulkWriter(
-                schema=schema,
-                remote_path="/bulk_data/" + time.strftime("%Y-%m-%d-%H-%M-%S"),
-                connect_param=conn,
-                file_type=BulkFileType.PARQUET
-            )
-            
-            for filename in os.listdir(parquet_directory):
-                if not filename.endswith('.parquet'):
-                    continue
-                    
-                file_path = os.path.join(parquet_directory, filename)
-                df = pq.ParquetDataset(file_path).read().to_pandas()
-                
-                for _, row in df.iterrows():
-                    writer.append_row({
-                        "_id": str(row['_id']),
-                        "url": str(row['url']),
-                        "title": str(row['title']),
-                        "text": str(row['text']),
-                        "emb": row['emb'].astype(np.float32).tolist()
-                    })
-                    
-                    if (_ + 1) % 10000 == 0:
-                        writer.commit()
-                        logging.info(f"Processed {_ + 1} rows from {filename}")
-            
-            writer.commit()
-            logging.info(f"Total files generated: {writer.batch_files}")
-            file_list.append(writer.batch_files)
+        # Collection management, keep the collection of an interrupted run
+        if journal.resumable and utility.has_collection(collection_name):
+            collection = Collection(collection_name)
+            logging.info(f"Collection reused: {collection.name}")
         else:
-             # Direct upload to MinIO
-            minio_client = Minio(
-                endpoint=minio_endpoint,
-                access_key=ACCESS_KEY,
-                secret_key=SECRET_KEY,
-                secure=False
-            )
-            
-            # Ensure bucket exists
-            if not minio_client.bucket_exists("bulk-insert-bucket"):
-                minio_client.make_bucket("bulk-insert-bucket")
-
-            # Upload all parquet files
-            for filename in os.listdir(parquet_directory):
-                if not filename.endswith('.parquet'):
-                    continue
-                
-                object_name = f"{remote_path}/{filename}"
-                file_path = os.path.join(parquet_directory, filename)
-                
-                minio_client.fput_object(
-                    BUCKET_NAME,
-                    object_name,
-                    file_path
-                )
-                logging.info(f"Uploaded {filename} to MinIO")
-                file_list.append([f"{object_name}"])
-            logging.info(f"Total files uploaded: {file_list}")
+            journal.reset()
+            if utility.has_collection(collection_name):
+                utility.drop_collection(collection_name)
+            collection = Collection(collection_name, schema, consistency_level="Strong")
+            logging.info(f"Collection created: {collection.name}")
 
-        # 5. Execute bulk import
-        resp = bulk_import(
-            f"http://{host}:19530",
-            collection_name,
-            files=file_list,
+        run_import_pipeline(
+            parquet_directory,
+            schema,
+            journal,
+            rewrite=rewrite,
+            collection_name=collection_name,
+            host=host,
+            minio_client=minio_client,
+            import_api=import_api,
+            upload_workers=upload_workers,
+            part_size=part_size,
+            import_jobs=import_jobs,
+            import_retries=import_retries,
         )
-        job_id = resp.json()['data']['jobId']
-        logging.info(f"Bulk import job started: {job_id}")
-
-        # 6. Monitor import progress
-        progress = 0
-        while True:
-            resp = list_import_jobs(f"http://{host}:19530", collection_name)
-            job_data = resp.json()['data']['records'][0]
-            
-            if job_data['state'] == 'Failed':
-                raise Exception(f"Bulk import job failed: {job_data['reason']}")
-            
-            if job_data['progress'] > progress:
-                progress = job_data['progress']
-                logging.info(f"Import progress: {progress}%")
-                
-            if job_data['jobId'] == job_id and progress == 100:
-                break
-            time.sleep(5)
 
-        # 7. Final verification
+        # 8. Final verification
         logging.info("Creating index...")
         index_params = [
             ("emb", {"index_type": "HNSW", "metric_type": "L2", "params": {"M": 64, "efConstruction": 128}})
@@ -0,0 +1,247 @@
+"""Delete entities by primary keys in bulk.
+
+Contiguous runs of int64 pks are coalesced into range predicates
+(`pk >= a and pk < b`), the rest is chunked into `pk in [...]` expressions below
+a size limit. Expressions are sent concurrently, flush is controlled by FlushPolicy
+instead of following every batch.
+
+    engine = DeleteEngine(Collection("test1"), flush_policy=FlushPolicy(every_rows=1_000_000))
+    engine.delete(np.array(pks))
+"""
+
+import concurrent.futures
+import json
+import threading
+import time
+from pathlib import Path
+from typing import Optional, Union
+
+import numpy as np
+from pydantic import BaseModel
+
+from milvus_backend import Collection, Partition
+
+
+class FlushPolicy(BaseModel):
+    """When to flush while deleting, only at the end if nothing is set"""
+    every_rows: Optional[int] = None
+    every_seconds: Optional[float] = None
+    at_end: bool = True
+
+
+def coalesce_ranges(pks: np.ndarray, min_run: int = 64) -> tuple:
+    """Split int64 pks into [start, end) ranges of contiguous runs and the rest
+
+    Runs shorter than `min_run` are cheaper as `in` lists and go to the rest.
+    """
+    pks = np.unique(np.asarray(pks, dtype=np.int64))
+    if len(pks) == 0:
+        return [], pks
+
+    # run boundaries are where the next pk is not the previous one plus one
+    breaks = np.flatnonzero(np.diff(pks) != 1) + 1
+    starts = np.concatenate(([0], breaks))
+    ends = np.concatenate((breaks, [len(pks)]))
+    long_runs = (ends - starts) >= min_run
+
+    ranges = [(int(pks[s]), int(pks[e - 1]) + 1) for s, e in zip(starts[long_runs], ends[long_runs])]
+    keep = np.ones(len(pks), dtype=bool)
+    for s, e in zip(starts[long_runs], ends[long_runs]):
+        keep[s:e] = False
+    return ranges, pks[keep]
+
+
+def _chunk_by_length(items: np.ndarray, lengths: np.ndarray, max_len: int, overhead: int = 0) -> list:
+    """Greedily split `items` so `overhead` plus the summed `lengths` of each chunk fit in `max_len`
+
+    lengths: per item, separator included
+    """
+    if len(items) == 0:
+        return []
+    cumulative = np.cumsum(lengths)
+    budget = max_len - overhead
+    chunks = []
+    start, base = 0, 0
+    while start < len(items):
+        end = int(np.searchsorted(cumulative, base + budget, side="right"))
+        if end == start:
+            raise ValueError(f"item {items[start]} does not fit in an expression of {max_len} chars")
+        chunks.append(items[start:end])
+        base = cumulative[end - 1]
+        start = end
+    return chunks
+
+
+def build_delete_exprs(
+    pks: np.ndarray,
+    pk_field: str = "pk",
+    max_expr_len: int = 256 * 1024,
+    min_run: int = 64,
+) -> list:
+    """return: [(expr, num pks covered)]"""
+    pks = np.asarray(pks)
+    exprs = []
+
+    if np.issubdtype(pks.dtype, np.integer):
+        ranges, rest = coalesce_ranges(pks, min_run)
+        range_exprs = [f"({pk_field} >= {a} and {pk_field} < {b})" for a, b in ranges]
+        range_lens = np.array([len(e) + len(" or ") for e in range_exprs])
+        range_sizes = np.array([b - a for a, b in ranges])
+        for chunk in _chunk_by_length(np.arange(len(ranges)), range_lens, max_expr_len):
+            exprs.append((" or ".join(range_exprs[i] for i in chunk), int(range_sizes[chunk].sum())))
+        values = rest.astype(str)
+    else:
+        values = np.array([json.dumps(str(pk)) for pk in np.unique(pks)])
+
+    lengths = np.char.str_len(values) + len(",")
+    overhead = len(f"{pk_field} in []")
+    for chunk in _chunk_by_length(values, lengths, max_expr_len, overhead):
+        exprs.append((f"{pk_field} in [{','.join(chunk.tolist())}]", len(chunk)))
+
+    too_long = [len(expr) for expr, _ in exprs if len(expr) > max_expr_len]
+    if too_long:
+        raise ValueError(f"built {len(too_long)} expressions over {max_expr_len} chars, longest {max(too_long)}")
+    return exprs
+
+
+class DeletePlan:
+    """On-disk delete plan: a `plan.json` header plus one `.npy` array of pks per segment
+
+    The header records the collection, partition, pk field, sampling seed and, per
+    file, the origin segment and number of pks. Arrays are int64, or fixed width
+    unicode for VARCHAR pks, and are memory mapped on load so nothing is copied
+    until a chunk is sent.
+    """
+
+    HEADER_FILE = "plan.json"
+
+    def __init__(self, plan_dir: Union[str, Path], header: dict):
+        self.plan_dir = Path(plan_dir)
+        self.header = header
+
+    @classmethod
+    def write(
+        cls,
+        plan_dir: Union[str, Path],
+        samples: list,
+        collection: str,
+        partition: str = "_default",
+        pk_field: str = "pk",
+        seed: Optional[int] = None,
+    ) -> "DeletePlan":
+        """samples: pks to delete of each origin segment
+        seed: the seed the samples were drawn with, recorded so the plan can be regenerated
+        """
+        plan_dir = Path(plan_dir)
+        plan_dir.mkdir(parents=True, exist_ok=True)
+        files = []
+        for segment, pks in enumerate(samples):
+            pks = np.asarray(pks)
+            if not np.issubdtype(pks.dtype, np.integer):
+                pks = pks.astype(str)
+            else:
+                pks = pks.astype(np.int64)
+            filename = f"pks_{segment}.npy"
+            np.save(plan_dir / filename, pks)
+            files.append(dict(file=filename, segment=segment, num_pks=len(pks)))
+
+        header = dict(
+            collection=collection,
+            partition=partition,
+            pk_field=pk_field,
+            seed=seed,
+            num_pks=sum(f["num_pks"] for f in files),
+            files=files,
+        )
+        (plan_dir / cls.HEADER_FILE).write_text(json.dumps(header, indent=2))
+        return cls(plan_dir, header)
+
+    @classmethod
+    def load(cls, plan_dir: Union[str, Path]) -> "DeletePlan":
+        header = json.loads((Path(plan_dir) / cls.HEADER_FILE).read_text())
+        return cls(plan_dir, header)
+
+    def pks(self, file: dict) -> np.ndarray:
+        return np.load(self.plan_dir / file["file"], mmap_mode="r")
+
+    def iter_chunks(self, chunk_size: int = 1_000_000):
+        """Yield (segment, pks) slices of at most `chunk_size` pks, file by file"""
+        for file in self.header["files"]:
+            pks = self.pks(file)
+            for start in range(0, len(pks), chunk_size):
+                yield file["segment"], pks[start:start + chunk_size]
+
+
+class DeleteEngine:
+    def __init__(
+        self,
+        c: Union[Collection, Partition],
+        pk_field: str = "pk",
+        workers: int = 4,
+        max_expr_len: int = 256 * 1024,
+        min_run: int = 64,
+        flush_policy: FlushPolicy = None,
+    ):
+        self.c = c
+        self.pk_field = pk_field
+        self.workers = workers
+        self.max_expr_len = max_expr_len
+        self.min_run = min_run
+        self.flush_policy = flush_policy or FlushPolicy()
+
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._rows_since_flush = 0
+        self._last_flush = time.perf_counter()
+        self.delete_count = 0
+        self.flush_count = 0
+
+    def _maybe_flush(self):
+        policy = self.flush_policy
+        with self._lock:
+            due = (policy.every_rows is not None and self._rows_since_flush >= policy.every_rows) or (
+                policy.every_seconds is not None and time.perf_counter() - self._last_flush >= policy.every_seconds
+            )
+            if not due:
+                return
+            self._rows_since_flush = 0
+            self._last_flush = time.perf_counter()
+        self.flush()
+
+    def flush(self):
+        with self._flush_lock:
+            self.c.flush()
+            self.flush_count += 1
+
+    def _delete_one(self, expr: str, num_pks: int) -> int:
+        ret = self.c.delete(expr)
+        with self._lock:
+            self.delete_count += ret.delete_count
+            self._rows_since_flush += num_pks
+        self._maybe_flush()
+        return ret.delete_count
+
+    def delete(self, pks: np.ndarray, flush: bool = True) -> int:
+        """Delete `pks` concurrently, return the delete count reported by the server
+
+        flush: apply FlushPolicy.at_end after this call
+        """
+        start_time = time.perf_counter()
+        exprs = build_delete_exprs(pks, self.pk_field, self.max_expr_len, self.min_run)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers) as executor:
+            counts = list(executor.map(lambda e: self._delete_one(*e), exprs))
+
+        if flush and self.flush_policy.at_end:
+            self.flush()
+        print(f"deleted {sum(counts)}/{len(pks)} pks with {len(exprs)} expressions, "
+              f"flushed {self.flush_count} times, cost {time.perf_counter() - start_time:.2f}s")
+        return sum(counts)
+
+    def replay(self, plan: DeletePlan, chunk_size: int = 1_000_000) -> int:
+        """Stream a DeletePlan chunk by chunk, flushing per FlushPolicy only"""
+        count = 0
+        for segment, pks in plan.iter_chunks(chunk_size):
+            count += self.delete(pks, flush=False)
+        if self.flush_policy.at_end:
+            self.flush()
+        return count
@@ -0,0 +1,192 @@
+"""Filesystem-backed stand-ins for MinIO and the Milvus bulk import REST endpoints.
+
+They keep their state under a local directory, so a run can be interrupted and
+re-run against the same state, e.g. to exercise the resumable bulk import:
+
+    root = "/tmp/fake_services"
+    run_import_pipeline(
+        "/home/zilliz/data",
+        schema,
+        ImportJournal("/tmp/fake_services/journal.jsonl"),
+        rewrite=False,
+        minio_client=FakeMinio(root),
+        import_api=FakeImportService(root),
+    )
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+
+import pyarrow.parquet as pq
+from minio.error import S3Error
+
+
+class FakeResponse:
+    """Mimic the `requests.Response` returned by pymilvus.bulk_writer"""
+
+    def __init__(self, data: dict, code: int = 0, message: str = ""):
+        self._body = {"code": code, "message": message, "data": data}
+
+    def json(self) -> dict:
+        return self._body
+
+
+class FakeObject:
+    def __init__(self, object_name: str, size: int, etag: str):
+        self.object_name = object_name
+        self.size = size
+        self.etag = etag
+
+
+class FakeMinio:
+    """Store objects as plain files under `root/minio/<bucket>/<object_name>`"""
+
+    def __init__(self, root: str):
+        self.root = os.path.join(root, "minio")
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, bucket_name: str, object_name: str) -> str:
+        return os.path.join(self.root, bucket_name, object_name.lstrip("/"))
+
+    def bucket_exists(self, bucket_name: str) -> bool:
+        return os.path.isdir(os.path.join(self.root, bucket_name))
+
+    def make_bucket(self, bucket_name: str):
+        os.makedirs(os.path.join(self.root, bucket_name), exist_ok=True)
+
+    def fput_object(self, bucket_name: str, object_name: str, file_path: str, part_size: int = 0, **kwargs) -> FakeObject:
+        """Copy the file in, with the ETag S3 would give the upload of this part size"""
+        path = self._path(bucket_name, object_name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        part_md5s = []
+        with open(file_path, "rb") as src, open(path, "wb") as dst:
+            while True:
+                chunk = src.read(part_size or 64 * 1024 * 1024)
+                if not chunk:
+                    break
+                dst.write(chunk)
+                part_md5s.append(hashlib.md5(chunk))
+
+        if len(part_md5s) <= 1:
+            etag = part_md5s[0].hexdigest() if part_md5s else hashlib.md5(b"").hexdigest()
+        else:
+            etag = hashlib.md5(b"".join(m.digest() for m in part_md5s)).hexdigest() + f"-{len(part_md5s)}"
+        with open(path + ".etag", "w") as f:
+            f.write(etag)
+        return self.stat_object(bucket_name, object_name)
+
+    def stat_object(self, bucket_name: str, object_name: str) -> FakeObject:
+        path = self._path(bucket_name, object_name)
+        if not os.path.exists(path):
+            raise S3Error(
+                code="NoSuchKey",
+                message="Object does not exist",
+                resource=f"/{bucket_name}/{object_name}",
+                request_id=None,
+                host_id=None,
+                response=None,
+                bucket_name=bucket_name,
+                object_name=object_name,
+            )
+        with open(path + ".etag") as f:
+            etag = f.read()
+        return FakeObject(object_name, os.path.getsize(path), etag)
+
+
+class FakeImportService:
+    """Fake of `bulk_import` / `get_import_progress` / `list_import_jobs`
+
+    Jobs are persisted in `root/import_jobs.json` and complete `import_seconds` after
+    they are submitted, the first `fail_jobs` jobs submitted fail instead. Imported
+    rows are counted from the parquet files found under `root/minio`, files which
+    cannot be read count as zero rows.
+    """
+
+    def __init__(self, root: str, import_seconds: float = 1.0, bucket_name: str = "a-bucket", fail_jobs: int = 0):
+        self.root = root
+        self.import_seconds = import_seconds
+        self.fail_jobs = fail_jobs
+        self.bucket_name = bucket_name
+        self.jobs_file = os.path.join(root, "import_jobs.json")
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def _load(self) -> dict:
+        if not os.path.exists(self.jobs_file):
+            return {}
+        with open(self.jobs_file) as f:
+            return json.load(f)
+
+    def _save(self, jobs: dict):
+        with open(self.jobs_file, "w") as f:
+            json.dump(jobs, f)
+
+    def _count_rows(self, files: list) -> int:
+        rows = 0
+        for group in files:
+            for object_name in group:
+                path = os.path.join(self.root, "minio", self.bucket_name, object_name.lstrip("/"))
+                if os.path.exists(path):
+                    try:
+                        rows += pq.ParquetFile(path).metadata.num_rows
+                    except Exception:
+                        pass
+        return rows
+
+    def _refresh(self, job: dict) -> dict:
+        elapsed = time.time() - job["createTime"]
+        if job["state"] in ("Completed", "Failed"):
+            return job
+        if elapsed >= self.import_seconds:
+            job["state"] = "Completed"
+            job["progress"] = 100
+            job["importedRows"] = job["totalRows"]
+        else:
+            job["state"] = "Importing"
+            job["progress"] = int(100 * elapsed / self.import_seconds)
+            job["importedRows"] = int(job["totalRows"] * elapsed / self.import_seconds)
+        return job
+
+    def bulk_import(self, url: str, collection_name: str, files: list = None, **kwargs) -> FakeResponse:
+        with self._lock:
+            jobs = self._load()
+            job_id = uuid.uuid4().hex[:16]
+            fail = len(jobs) < self.fail_jobs
+            jobs[job_id] = {
+                "jobId": job_id,
+                "collectionName": collection_name,
+                "files": files,
+                "state": "Failed" if fail else "Pending",
+                "progress": 0,
+                "reason": "injected failure" if fail else "",
+                "totalRows": self._count_rows(files or []),
+                "importedRows": 0,
+                "createTime": time.time(),
+            }
+            self._save(jobs)
+        return FakeResponse({"jobId": job_id})
+
+    def get_import_progress(self, url: str, job_id: str, **kwargs) -> FakeResponse:
+        with self._lock:
+            jobs = self._load()
+            if job_id not in jobs:
+                return FakeResponse({}, code=100, message=f"job {job_id} not found")
+            job = self._refresh(jobs[job_id])
+            self._save(jobs)
+        return FakeResponse({k: v for k, v in job.items() if k != "files"})
+
+    def list_import_jobs(self, url: str, collection_name: str = "", **kwargs) -> FakeResponse:
+        with self._lock:
+            jobs = self._load()
+            records = [
+                {k: v for k, v in self._refresh(job).items() if k != "files"}
+                for job in jobs.values()
+                if not collection_name or job["collectionName"] == collection_name
+            ]
+            self._save(jobs)
+        return FakeResponse({"records": records})
@@ -11,10 +11,17 @@ Notes:
 
 from typing import Union
 from pydantic import BaseModel
-from pymilvus import Collection, connections, utility, DataType, Partition
+from pymilvus import DataType
 import pymilvus
+from milvus_backend import Collection, connections, utility, Partition
 import numpy as np
-import uuid
+import concurrent.futures
+import hashlib
+import json
+import queue
+import threading
+import time
+from pathlib import Path
 from enum import Enum
 
 
@@ -44,7 +51,13 @@ class SegmentDistribution(BaseModel):
         return size * factor
 
 
-def generate_segments(dist: SegmentDistribution):
+def generate_segments(dist: SegmentDistribution, calibrate: bool = False, pipelined: bool = False):
+    """Generate one segment per size in `dist`
+
+    calibrate: load the collection afterwards and store the size correction factor
+        of this schema, see calibrate_size_model. The collection needs an index.
+    pipelined: overlap data generation with inserts, see generate_segments_pipelined
+    """
 
     if not utility.has_collection(dist.collection_name):
         msg = f"Collection {dist.collection_name} does not exist"
@@ -53,9 +66,16 @@ def generate_segments(dist: SegmentDistribution):
     c = Collection(dist.collection_name)
     p = c.partition(dist.partition_name)
 
-    pks = []
-    for size in dist.size_dist:
-        pks.append(generate_one_segment(p, c.schema, dist.as_bytes(size)))
+    if pipelined:
+        pks = generate_segments_pipelined(p, c.schema, [dist.as_bytes(size) for size in dist.size_dist])
+    else:
+        pks = []
+        for size in dist.size_dist:
+            pks.append(generate_one_segment(p, c.schema, dist.as_bytes(size)))
+
+    if calibrate:
+        c.load()
+        calibrate_size_model(dist.collection_name)
 
     return pks
 
@@ -79,10 +99,10 @@ def generate_one_segment(c: Union[Collection, Partition], schema: pymilvus.Colle
     else:
         tail = size
 
-    if tail > 0:
+    if tail > 0 and estimate_count_by_size(tail, schema) > 0:
         count = estimate_count_by_size(tail, schema)
         data = gen_data_by_schema(schema, count)
-        c.insert(data)
+        rt = c.insert(data)
         print(f"inserted entities size: {tail}Bytes, {tail/1024/1024}MB, nun rows: {count}")
         pks.extend(rt.primary_keys)
         total_count += count
@@ -92,47 +112,375 @@ def generate_one_segment(c: Union[Collection, Partition], schema: pymilvus.Colle
     return pks
 
 
-def estimate_count_by_size(size: int, schema: pymilvus.CollectionSchema) -> int:
-    size_per_row = 0
+def segment_batch_counts(size: int, schema: pymilvus.CollectionSchema, max_size: int = 5 * 1024 * 1024) -> list:
+    """Row counts of the insert batches making up one segment of `size` bytes"""
+    sizes = [max_size] * (size // max_size)
+    if size % max_size > 0:
+        sizes.append(size % max_size)
+    counts = [estimate_count_by_size(batch_size, schema) for batch_size in sizes]
+    counts = [count for count in counts if count > 0]
+    if not counts:
+        msg = f"Segment size {size}Bytes is smaller than one row"
+        raise ValueError(msg)
+    return counts
+
+
+def generate_segments_pipelined(
+    c: Union[Collection, Partition],
+    schema: pymilvus.CollectionSchema,
+    sizes: list,
+    gen_workers: int = 2,
+    insert_workers: int = 2,
+    queue_size: int = 8,
+) -> list:
+    """Generate segments with data generation overlapped with the insert RPCs
+
+    Generator threads build the next batches into a bounded queue while insert
+    threads send the current ones. The queue is in segment order, an insert thread
+    holding a batch of the next segment waits until the current one is flushed, so
+    every segment is sealed exactly at its boundary.
+
+    return: the primary keys of each segment
+    """
+    plan = [(seg, count) for seg, size in enumerate(sizes) for count in segment_batch_counts(size, schema)]
+    remaining = [0] * len(sizes)
+    for seg, _ in plan:
+        remaining[seg] += 1
+
+    pks = [[] for _ in sizes]
+    state = {"current": 0, "error": None}
+    cond = threading.Condition()
+    batches = queue.Queue(maxsize=queue_size)
+    start_time = time.perf_counter()
+
+    def insert_worker():
+        while True:
+            try:
+                item = batches.get(timeout=1)
+            except queue.Empty:
+                # the producer stops queueing, sentinels included, once an error is set
+                if state["error"] is not None:
+                    return
+                continue
+            if item is None:
+                return
+            seg, future = item
+            try:
+                data = future.result()
+                with cond:
+                    cond.wait_for(lambda: state["current"] >= seg or state["error"])
+                    if state["error"]:
+                        return
+                rt = c.insert(data)
+
+                with cond:
+                    pks[seg].extend(rt.primary_keys)
+                    remaining[seg] -= 1
+                    sealed = remaining[seg] == 0
+                if sealed:
+                    c.flush()
+                    print(f"Segment {seg} sealed, num rows: {len(pks[seg])}, size: {sizes[seg]/1024/1024}MB, "
+                          f"elapsed: {time.perf_counter() - start_time:.2f}s")
+                    with cond:
+                        state["current"] = seg + 1
+                        cond.notify_all()
+            except Exception as e:
+                with cond:
+                    state["error"] = state["error"] or e
+                    cond.notify_all()
+                return
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=gen_workers) as gen_pool, \
+            concurrent.futures.ThreadPoolExecutor(max_workers=insert_workers) as insert_pool:
+        inserters = [insert_pool.submit(insert_worker) for _ in range(insert_workers)]
+
+        for seg, count in plan:
+            item = (seg, gen_pool.submit(gen_data_by_schema, schema, count))
+            while state["error"] is None:
+                try:
+                    batches.put(item, timeout=1)
+                    break
+                except queue.Full:
+                    continue
+            if state["error"] is not None:
+                break
+
+        for _ in inserters:
+            while state["error"] is None:
+                try:
+                    batches.put(None, timeout=1)
+                    break
+                except queue.Full:
+                    continue
+        concurrent.futures.wait(inserters)
+
+    if state["error"] is not None:
+        raise state["error"]
+
+    duration = time.perf_counter() - start_time
+    total_rows = sum(len(seg_pks) for seg_pks in pks)
+    print(f"Generated {len(sizes)} segments, {total_rows} rows in {duration:.2f}s, {total_rows/duration:.0f} rows/s")
+    return pks
+
+
+# System fields stored with every row: RowID and Timestamp, both int64
+ROW_OVERHEAD = 16
+
+FIXED_FIELD_SIZE = {
+    DataType.BOOL: 1,
+    DataType.INT8: 1,
+    DataType.INT16: 2,
+    DataType.INT32: 4,
+    DataType.INT64: 8,
+    DataType.FLOAT: 4,
+    DataType.DOUBLE: 8,
+}
+
+# Per-row encoding overhead of variable length fields: the offset of each value
+VAR_FIELD_OVERHEAD = 4
+
+CALIBRATION_FILE = "segment_size_calibration.json"
+
+# (calibration file, schema key) -> correction factor, read once per schema
+_correction_factors = {}
+
+
+def schema_key(schema: pymilvus.CollectionSchema) -> str:
+    """Stable identity of a schema layout, the key of its correction factor"""
+    layout = [(fs.name, fs.dtype.name, sorted(fs.params.items())) for fs in schema.fields]
+    return hashlib.sha1(json.dumps(layout, default=str).encode()).hexdigest()[:16]
+
+
+def load_correction_factor(schema: pymilvus.CollectionSchema, calibration_file: str = CALIBRATION_FILE) -> float:
+    key = (calibration_file, schema_key(schema))
+    if key not in _correction_factors:
+        path = Path(calibration_file)
+        factors = json.loads(path.read_text()) if path.exists() else {}
+        _correction_factors[key] = factors.get(key[1], {}).get("factor", 1.0)
+    return _correction_factors[key]
+
+
+def estimate_row_size(schema: pymilvus.CollectionSchema, index_size_factor: float = 0.0) -> float:
+    """Estimated bytes per row, based on the widths gen_data_by_schema actually generates
+
+    index_size_factor: index bytes per vector byte, e.g. 0.1 for IVF_FLAT centroids,
+        0 to model the binlog size only
+    """
+    size_per_row = ROW_OVERHEAD
     for fs in schema.fields:
-        if fs.dtype == DataType.INT64:
+        if fs.is_primary and fs.auto_id:
             size_per_row += 8
+        elif fs.dtype in FIXED_FIELD_SIZE:
+            size_per_row += FIXED_FIELD_SIZE[fs.dtype]
         elif fs.dtype == DataType.VARCHAR:
-            size_per_row += fs.max_length
+            size_per_row += varchar_width(fs) + VAR_FIELD_OVERHEAD
+        elif fs.dtype == DataType.JSON:
+            size_per_row += JSON_WIDTH + VAR_FIELD_OVERHEAD
         elif fs.dtype == DataType.FLOAT_VECTOR:
-            size_per_row += fs.dim * 4
-        elif fs.dtype == DataType.DOUBLE:
-            size_per_row += 8
+            size_per_row += fs.dim * 4 * (1 + index_size_factor)
+        elif fs.dtype == DataType.BINARY_VECTOR:
+            size_per_row += fs.dim // 8 * (1 + index_size_factor)
+        elif fs.dtype == DataType.SPARSE_FLOAT_VECTOR:
+            # (uint32 index, float32 value) pairs plus the row offset
+            size_per_row += (SPARSE_NNZ * 8 + VAR_FIELD_OVERHEAD) * (1 + index_size_factor)
         else:
             msg = f"Unsupported data type: {fs.dtype.name}, please impl in generate_segment.py yourself"
             raise ValueError(msg)
 
+    return size_per_row
+
+
+def estimate_count_by_size(
+    size: int,
+    schema: pymilvus.CollectionSchema,
+    index_size_factor: float = 0.0,
+    calibration_file: str = CALIBRATION_FILE,
+) -> int:
+    size_per_row = estimate_row_size(schema, index_size_factor) * load_correction_factor(schema, calibration_file)
     return int(size / size_per_row)
 
 
+def calibrate_size_model(
+    collection_name: str,
+    index_size_factor: float = 0.0,
+    calibration_file: str = CALIBRATION_FILE,
+) -> float:
+    """Compare the estimated size with the segment sizes reported by the server
+
+    The collection MUST be loaded. The ratio of real to estimated bytes per row is
+    stored per schema in `calibration_file` and applied by estimate_count_by_size.
+    """
+    c = Collection(collection_name)
+    segments = utility.get_query_segment_info(collection_name)
+    num_rows = sum(seg.num_rows for seg in segments)
+    mem_size = sum(seg.mem_size for seg in segments)
+    if num_rows == 0:
+        msg = f"Collection {collection_name} has no loaded rows to calibrate with"
+        raise ValueError(msg)
+
+    estimated = estimate_row_size(c.schema, index_size_factor)
+    actual = mem_size / num_rows
+    factor = actual / estimated
+    for seg in segments:
+        print(f"segment {seg.segmentID}: num rows: {seg.num_rows}, size: {seg.mem_size/1024/1024:.2f}MB, "
+              f"estimated: {seg.num_rows * estimated/1024/1024:.2f}MB")
+    print(f"num_entities: {c.num_entities}, loaded rows: {num_rows}, "
+          f"bytes per row estimated: {estimated:.1f}, actual: {actual:.1f}, correction factor: {factor:.4f}")
+
+    path = Path(calibration_file)
+    factors = json.loads(path.read_text()) if path.exists() else {}
+    factors[schema_key(c.schema)] = {
+        "collection": collection_name,
+        "index_size_factor": index_size_factor,
+        "estimated_row_size": estimated,
+        "actual_row_size": actual,
+        "factor": factor,
+    }
+    path.write_text(json.dumps(factors, indent=2))
+    _correction_factors[(calibration_file, schema_key(c.schema))] = factor
+    return factor
+
+
+_MASK63 = np.uint64((1 << 63) - 1)
+
+
+class PKGenerator:
+    """Collision-free int64 primary keys
+
+    A counter scrambled by a bijective mix on 63 bits, so the keys look random, are
+    always positive and never repeat. Each seed owns a 2^40 wide range of the
+    counter, generators with different seeds do not collide either.
+    """
+
+    def __init__(self, seed: int = None):
+        if seed is None:
+            seed = int(np.random.default_rng().integers(1 << 23))
+        self._next = (seed % (1 << 23)) << 40
+        self._lock = threading.Lock()
+
+    def next(self, count: int) -> np.ndarray:
+        with self._lock:
+            start = self._next
+            self._next += count
+
+        x = np.arange(start, start + count, dtype=np.uint64)
+        x = (x * np.uint64(0x9E3779B97F4A7C15)) & _MASK63
+        x ^= x >> np.uint64(31)
+        x = (x * np.uint64(0xBF58476D1CE4E5B9)) & _MASK63
+        x ^= x >> np.uint64(29)
+        return x.astype(np.int64)
+
+
+_default_pk_generator = PKGenerator()
+
+# Widths of the generated payloads, estimate_count_by_size relies on them too
+MAX_VARCHAR_WIDTH = 128
+VARCHAR_PK_WIDTH = 16
+# approximate serialized width of the generated JSON documents
+JSON_WIDTH = 66
+SPARSE_NNZ = 32
+SPARSE_DIM = 30000
+
+_HEX_DIGITS = np.frombuffer(b"0123456789abcdef", dtype=np.uint8)
+
+
+def varchar_width(fs: pymilvus.FieldSchema) -> int:
+    if fs.is_primary:
+        # every hex digit of the 63-bit keys is needed, fewer would collide
+        if fs.max_length < VARCHAR_PK_WIDTH:
+            msg = (
+                f"VARCHAR primary key {fs.name} needs max_length >= {VARCHAR_PK_WIDTH} "
+                f"to hold unique generated keys, got {fs.max_length}"
+            )
+            raise ValueError(msg)
+        return VARCHAR_PK_WIDTH
+    return min(fs.max_length, MAX_VARCHAR_WIDTH)
+
+
+def _hex_strings(values: np.ndarray, width: int) -> np.ndarray:
+    """Fixed width lower-case hex of int64 values, without a per-row Python loop"""
+    shifts = np.arange(60, -4, -4, dtype=np.uint64)
+    nibbles = (values.astype(np.uint64)[:, None] >> shifts) & np.uint64(0xF)
+    digits = _HEX_DIGITS[nibbles.astype(np.intp)][:, 16 - width:]
+    return np.ascontiguousarray(digits).view(f"S{width}").ravel().astype(f"U{width}")
+
+
+def _random_strings(rng: np.random.Generator, count: int, width: int) -> np.ndarray:
+    chars = rng.integers(ord("a"), ord("z") + 1, size=(count, width), dtype=np.uint8)
+    return chars.view(f"S{width}").ravel().astype(f"U{width}")
+
+
+def _sparse_vectors(rng: np.random.Generator, count: int):
+    # Optional dependency, only needed for SPARSE_FLOAT_VECTOR fields
+    from scipy.sparse import csr_array
+
+    # strictly increasing column indices per row from cumulated positive gaps
+    gaps = rng.integers(1, SPARSE_DIM // SPARSE_NNZ, size=(count, SPARSE_NNZ))
+    indices = np.cumsum(gaps, axis=1).ravel()
+    values = rng.random(count * SPARSE_NNZ, dtype=np.float32)
+    indptr = np.arange(0, (count + 1) * SPARSE_NNZ, SPARSE_NNZ)
+    return csr_array((values, indices, indptr), shape=(count, SPARSE_DIM))
 
-def gen_data_by_schema(schema: pymilvus.CollectionSchema, count: int) -> list:
-    rng = np.random.default_rng()
+
+def gen_data_by_schema(
+    schema: pymilvus.CollectionSchema,
+    count: int,
+    rng: np.random.Generator = None,
+    pk_generator: PKGenerator = None,
+) -> list:
+    """Generate `count` rows in column format, every column is built by NumPy in bulk
+
+    JSON is the exception as pymilvus needs a dict per row.
+    """
+    rng = rng or np.random.default_rng()
+    pk_generator = pk_generator or _default_pk_generator
     data = []
     for fs in schema.fields:
+        if fs.is_primary and fs.auto_id:
+            continue
+
         if fs.dtype == DataType.INT64:
-            if fs.is_primary and not fs.auto_id:
-                data.append([uuid.uuid1().int >> 65  for _ in range(count)])
+            if fs.is_primary:
+                data.append(pk_generator.next(count))
             else:
-                data.append(list(range(count)))
+                data.append(np.arange(count, dtype=np.int64))
 
         elif fs.dtype == DataType.VARCHAR:
-            if fs.is_primary and not fs.auto_id:
-                data.append([str(uuid.uuid4()) for _ in range(count)])
+            width = varchar_width(fs)
+            if fs.is_primary:
+                data.append(_hex_strings(pk_generator.next(count), width))
             else:
-                data.append([str(i) for i in range(count)])
+                data.append(_random_strings(rng, count, width))
 
-        elif fs.dtype == DataType.FLOAT_VECTOR:
-            data.append(rng.random((count, fs.dim)))
+        elif fs.dtype in (DataType.INT8, DataType.INT16, DataType.INT32):
+            dtype = {DataType.INT8: np.int8, DataType.INT16: np.int16, DataType.INT32: np.int32}[fs.dtype]
+            info = np.iinfo(dtype)
+            data.append(rng.integers(info.min, info.max, size=count, dtype=dtype, endpoint=True))
+
+        elif fs.dtype == DataType.BOOL:
+            data.append(rng.random(count) < 0.5)
+
+        elif fs.dtype == DataType.FLOAT:
+            data.append(rng.random(count, dtype=np.float32))
 
         elif fs.dtype == DataType.DOUBLE:
             data.append(rng.random(count))
 
+        elif fs.dtype == DataType.JSON:
+            ids = rng.integers(0, 1 << 31, size=count).tolist()
+            scores = rng.random(count).tolist()
+            tags = _random_strings(rng, count, 8).tolist()
+            data.append([{"id": i, "score": s, "tag": t} for i, s, t in zip(ids, scores, tags)])
+
+        elif fs.dtype == DataType.FLOAT_VECTOR:
+            data.append(rng.random((count, fs.dim), dtype=np.float32))
+
+        elif fs.dtype == DataType.BINARY_VECTOR:
+            data.append(rng.integers(0, 256, size=(count, fs.dim // 8), dtype=np.uint8))
+
+        elif fs.dtype == DataType.SPARSE_FLOAT_VECTOR:
+            data.append(_sparse_vectors(rng, count))
+
         else:
             msg = f"Unsupported data type: {fs.dtype.name}, please impl in generate_segment.py yourself"
             raise ValueError(msg)
@@ -0,0 +1,55 @@
+"""Mergeable latency histogram shared by the benchmarks.
+
+Fixed log buckets with 2% relative error from 1us to 100s, so histograms of
+workers, time windows or runs are merged by adding their counts.
+"""
+
+import numpy as np
+
+
+class LatencyHistogram:
+    """latency histogram over fixed log buckets (2% relative error), mergeable."""
+
+    MIN_US = 1
+    MAX_US = 100_000_000
+    RATIO = 1.02
+    NUM_BUCKETS = int(np.ceil(np.log(MAX_US / MIN_US) / np.log(RATIO))) + 1
+
+    def __init__(self):
+        self.counts = np.zeros(self.NUM_BUCKETS, dtype=np.int64)
+        self.max = 0.0
+
+    @classmethod
+    def bucket(cls, latency_ms: float) -> int:
+        us = max(latency_ms * 1000, cls.MIN_US)
+        return min(int(np.log(us / cls.MIN_US) / np.log(cls.RATIO)), cls.NUM_BUCKETS - 1)
+
+    def record(self, latency_ms: float):
+        self.counts[self.bucket(latency_ms)] += 1
+        self.max = max(self.max, float(latency_ms))
+
+    def merge(self, other: "LatencyHistogram") -> "LatencyHistogram":
+        self.counts += other.counts
+        self.max = max(self.max, other.max)
+        return self
+
+    @property
+    def count(self) -> int:
+        return int(self.counts.sum())
+
+    def percentile(self, p: float) -> float:
+        """ms, the upper bound of the bucket"""
+        if self.count == 0:
+            return 0.0
+        rank = max(int(np.ceil(p / 100 * self.count)), 1)
+        idx = int(np.searchsorted(np.cumsum(self.counts), rank))
+        return min(self.MIN_US * self.RATIO ** (idx + 1) / 1000, self.max)
+
+    def summary(self) -> dict:
+        return dict(
+            count=self.count,
+            latency_p50=round(self.percentile(50), 4),
+            latency_p95=round(self.percentile(95), 4),
+            latency_p99=round(self.percentile(99), 4),
+            latency_max=round(self.max, 4),
+        )
@@ -1,19 +1,21 @@
 """ python load_data.py -c test1 """
 
 import concurrent
+import concurrent.futures
+import multiprocessing as mp
 import threading
 import argparse
 import time
 
 import numpy as np
 from pymilvus import (
-    Collection,
     CollectionSchema,
-    connections,
     DataType,
     FieldSchema,
-    utility,
 )
+from pymilvus.grpc_gen import milvus_pb2, schema_pb2
+
+from milvus_backend import Collection, connections, is_local, utility
 
 
 def delete(name: str, expr: str):
@@ -51,19 +53,155 @@ def prepare_collection(name: str, dim: int, recreate_if_exist: bool=False):
         utility.drop_collection(name)
         create()
 
-class MilvusMultiThreadingInsert:
-    def __init__(self, collection_name: str, total_count: int, num_per_batch: int, dim: int):
+def gen_batch(start: int, count: int, dim: int) -> list:
+    """Entities of the batch starting at pk `start`, deterministic given the batch"""
+    rng = np.random.default_rng(seed=start)
+    return [
+        list(range(start, start + count)),
+        rng.random(count).tolist(),
+        rng.random((count, dim), dtype=np.float32),
+    ]
+
+
+def insert_message_size(collection_name: str, entities: list) -> int:
+    """Serialized size of the InsertRequest carrying a gen_batch batch"""
+    pks, randoms, embeddings = entities
+    request = milvus_pb2.InsertRequest(collection_name=collection_name, num_rows=len(pks))
+    field = request.fields_data.add(type=schema_pb2.Int64, field_name="pk")
+    field.scalars.long_data.data.extend(pks)
+    field = request.fields_data.add(type=schema_pb2.Double, field_name="random")
+    field.scalars.double_data.data.extend(randoms)
+    field = request.fields_data.add(type=schema_pb2.FloatVector, field_name="embeddings")
+    field.vectors.dim = embeddings.shape[1]
+    field.vectors.float_vector.data.extend(embeddings.ravel().tolist())
+    return request.ByteSize()
+
+
+class InsertStats:
+    """Thread-safe per-batch latency, rows and message size of an insert run"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = []
+        self.rows = 0
+        self.message_bytes = 0
+        self.start_time = time.perf_counter()
+
+    def start(self):
+        """Restart the clock, throughput counts from here"""
+        with self.lock:
+            self.start_time = time.perf_counter()
+
+    def add(self, rows: int, message_bytes: int, latency: float):
+        with self.lock:
+            self.latencies.append(latency)
+            self.rows += rows
+            self.message_bytes += message_bytes
+
+    def summary(self) -> dict:
+        with self.lock:
+            latencies = np.array(self.latencies) * 1000
+            duration = time.perf_counter() - self.start_time
+            return dict(
+                batches=len(latencies),
+                rows=self.rows,
+                rows_per_sec=round(self.rows / duration, 2),
+                mb_per_sec=round(self.message_bytes / 1024 / 1024 / duration, 2),
+                latency_p50=round(float(np.percentile(latencies, 50)), 2) if len(latencies) else 0,
+                latency_p95=round(float(np.percentile(latencies, 95)), 2) if len(latencies) else 0,
+                latency_p99=round(float(np.percentile(latencies, 99)), 2) if len(latencies) else 0,
+                avg_message_mb=round(self.message_bytes / 1024 / 1024 / max(len(latencies), 1), 2),
+            )
+
+
+class AdaptiveTuner:
+    """Hill-climb batch size first, then concurrency, on measured rows/s
 
-        batch_count = int(total_count / num_per_batch)
+    Each step doubles the knob being tuned. A step is kept when it gains more than
+    `min_gain` rows/s, otherwise the best setting so far is restored and the next
+    knob is tuned. Tuning stops once both knobs settled.
+    """
 
+    def __init__(self, batch_size: int, concurrency: int, max_batch_size: int, max_concurrency: int, min_gain: float = 0.05):
+        self.batch_size = min(batch_size, max_batch_size)
+        self.concurrency = min(concurrency, max_concurrency)
+        self.max_batch_size = max_batch_size
+        self.max_concurrency = max_concurrency
+        self.min_gain = min_gain
+        self.knob = "batch_size"
+        self.best = (self.batch_size, self.concurrency)
+        self.best_rate = None
+
+    def _step(self):
+        if self.knob == "batch_size":
+            if self.batch_size < self.max_batch_size:
+                self.batch_size = min(self.batch_size * 2, self.max_batch_size)
+                return
+            self.knob = "concurrency"
+        if self.knob == "concurrency":
+            if self.concurrency < self.max_concurrency:
+                self.concurrency = min(self.concurrency * 2, self.max_concurrency)
+                return
+            self.knob = None
+
+    def update(self, rows_per_sec: float) -> tuple:
+        if self.knob is None:
+            return self.batch_size, self.concurrency
+
+        if self.best_rate is None or rows_per_sec > self.best_rate * (1 + self.min_gain):
+            self.best = (self.batch_size, self.concurrency)
+            self.best_rate = rows_per_sec
+        else:
+            self.batch_size, self.concurrency = self.best
+            self.knob = "concurrency" if self.knob == "batch_size" else None
+        self._step()
+        return self.batch_size, self.concurrency
+
+
+class MilvusMultiThreadingInsert:
+    def __init__(
+        self,
+        collection_name: str,
+        total_count: int,
+        num_per_batch: int,
+        dim: int,
+        max_workers: int = 12,
+        adaptive: bool = False,
+        max_message_size: int = 64 * 1024 * 1024,
+    ):
+        """
+        num_per_batch: rows per batch, the initial batch size if adaptive
+        max_workers: insert threads, the upper bound of concurrency if adaptive
+        adaptive: tune batch size and concurrency for rows/s while running
+        max_message_size: server gRPC receive limit (proxy.grpc.serverMaxRecvSize),
+            batches are kept below 80% of it, in both modes
+        """
         self.thread_local = threading.local()
         self.collection_name = collection_name
         self.dim = dim
         self.total_count = total_count
         self.num_per_batch = num_per_batch
-        self.batchs = list(range(batch_count))
+        self.max_workers = max_workers
+        self.adaptive = adaptive
+        self.row_bytes = self.measure_row_message_size(min(num_per_batch, total_count, 1000))
+        self.max_batch_rows = max(1, int(max_message_size * 0.8 / self.row_bytes))
+        if num_per_batch > self.max_batch_rows:
+            print(f"num_per_batch {num_per_batch} exceeds the message size limit, use {self.max_batch_rows}")
+            num_per_batch = self.num_per_batch = self.max_batch_rows
+        # (start pk, num rows), the last batch takes the remainder
+        self.batchs = [
+            (start, min(num_per_batch, total_count - start))
+            for start in range(0, total_count, num_per_batch)
+        ]
+        self.stats = InsertStats()
+
+    def measure_row_message_size(self, count: int) -> float:
+        """Bytes per row of one serialized batch of `count` rows, the size is linear in rows"""
+        count = max(count, 1)
+        return insert_message_size(self.collection_name, gen_batch(0, count, self.dim)) / count
 
     def connect(self, uri: str):
+        self.uri = uri
         connections.connect(uri=uri)
 
     def get_thread_local_collection(self):
@@ -71,44 +209,176 @@ class MilvusMultiThreadingInsert:
             self.thread_local.collection = Collection(self.collection_name)
         return self.thread_local.collection
 
-    def insert_work(self, number: int):
-        print(f"No.{number:2}: Start inserting entities")
-        rng = np.random.default_rng(seed=number)
-        entities = [
-            list(range(self.num_per_batch*number, self.num_per_batch*(number+1))),
-            rng.random(self.num_per_batch).tolist(),
-            rng.random((self.num_per_batch, self.dim)),
-        ]
+    def insert_work(self, batch: tuple):
+        start, count = batch
+        entities = gen_batch(start, count, self.dim)
 
+        start_time = time.perf_counter()
         insert_result = self.get_thread_local_collection().insert(entities)
-        assert len(insert_result.primary_keys) == self.num_per_batch
-        print(f"No.{number:2}: Finish inserting entities")
+        self.stats.add(count, int(count * self.row_bytes), time.perf_counter() - start_time)
+        assert len(insert_result.primary_keys) == count
 
     def _insert_all_batches(self):
-        with concurrent.futures.ThreadPoolExecutor(max_workers=12) as executor:
-            executor.map(self.insert_work, self.batchs)
+        if self.adaptive:
+            self._insert_adaptive()
+            return
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for i, _ in enumerate(executor.map(self.insert_work, self.batchs), start=1):
+                if i % self.max_workers == 0 or i == len(self.batchs):
+                    print(f"[{i}/{len(self.batchs)}] {self.stats.summary()}")
+
+    def _insert_adaptive(self):
+        tuner = AdaptiveTuner(
+            batch_size=self.num_per_batch,
+            concurrency=min(2, self.max_workers),
+            max_batch_size=self.max_batch_rows,
+            max_concurrency=self.max_workers,
+        )
+        batch_size, concurrency = tuner.batch_size, tuner.concurrency
+        cursor = 0
+        self.batchs = []
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while cursor < self.total_count:
+                round_batches = []
+                for _ in range(concurrency):
+                    if cursor >= self.total_count:
+                        break
+                    count = min(batch_size, self.total_count - cursor)
+                    round_batches.append((cursor, count))
+                    cursor += count
+
+                start_time = time.perf_counter()
+                list(executor.map(self.insert_work, round_batches))
+                rows_per_sec = sum(count for _, count in round_batches) / (time.perf_counter() - start_time)
+                self.batchs.extend(round_batches)
+
+                print(f"batch_size={batch_size}, concurrency={concurrency}: {rows_per_sec:.0f} rows/s, {self.stats.summary()}")
+                batch_size, concurrency = tuner.update(rows_per_sec)
+
+        print(f"Tuned batch_size={tuner.best[0]}, concurrency={tuner.best[1]}")
 
     def run(self):
+        self.stats.start()
         start_time = time.time()
         self._insert_all_batches()
         duration = time.time() - start_time
         print(f'Inserted {len(self.batchs)} batches of entities in {duration} seconds')
+        summary = self.stats.summary()
+        print(f"Insert summary: {summary}")
         self.get_thread_local_collection().flush()
         print(f"Inserted num_entities: {self.total_count}. \
                 Actual num_entites: {self.get_thread_local_collection().num_entities}")
+        return summary
+
+
+# Per-process state of MilvusMultiProcessingInsert workers
+_process_collection = None
+_process_dim = None
+
+
+def _init_insert_process(uri: str, collection_name: str, dim: int):
+    global _process_collection, _process_dim
+    connections.connect(uri=uri)
+    _process_collection = Collection(collection_name)
+    _process_dim = dim
+
+
+def _insert_in_process(batch: tuple) -> tuple:
+    """return: rows, insert latency in seconds"""
+    start, count = batch
+    entities = gen_batch(start, count, _process_dim)
+
+    start_time = time.perf_counter()
+    insert_result = _process_collection.insert(entities)
+    latency = time.perf_counter() - start_time
+    assert len(insert_result.primary_keys) == count
+    if is_local():
+        # the local store lives in this process, merge the batch into the shared snapshot
+        _process_collection.flush()
+    return count, latency
+
+
+class MilvusMultiProcessingInsert(MilvusMultiThreadingInsert):
+    """Insert with a process pool to keep generation and serialization off the GIL
+
+    Every worker process owns its connection and Collection handle and generates
+    its batches from the batch start pk. Stats are aggregated in the parent. On the
+    local backend every batch is flushed by its worker, so the parent sees the rows.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.adaptive:
+            raise ValueError("Adaptive tuning is only supported with threads")
+
+    def _insert_all_batches(self):
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=mp.get_context("spawn"),
+            initializer=_init_insert_process,
+            initargs=(self.uri, self.collection_name, self.dim),
+        ) as executor:
+            results = executor.map(_insert_in_process, self.batchs)
+            for i, (count, latency) in enumerate(results, start=1):
+                self.stats.add(count, int(count * self.row_bytes), latency)
+                if i % self.max_workers == 0 or i == len(self.batchs):
+                    print(f"[{i}/{len(self.batchs)}] {self.stats.summary()}")
+
+
+def benchmark_insert_modes(
+    uri: str,
+    name: str,
+    dims: tuple = (128, 768, 1024),
+    batch_sizes: tuple = (1000, 5000),
+    total_count: int = 100_000,
+    workers: int = 12,
+) -> list:
+    """Insert the same data with threads and with processes, compare rows/s and latency"""
+    results = []
+    for dim in dims:
+        for batch_size in batch_sizes:
+            for mode, cls in (("threads", MilvusMultiThreadingInsert), ("processes", MilvusMultiProcessingInsert)):
+                prepare_collection(name, dim, recreate_if_exist=True)
+                inserter = cls(name, total_count, batch_size, dim, max_workers=workers)
+                inserter.connect(uri)
+                summary = inserter.run()
+                results.append(dict(mode=mode, dim=dim, batch_size=batch_size, **summary))
+
+    print(f"{'mode':>10} {'dim':>6} {'batch':>7} {'rows/s':>12} {'MB/s':>8} {'p50 ms':>8} {'p99 ms':>8}")
+    for r in results:
+        print(f"{r['mode']:>10} {r['dim']:>6} {r['batch_size']:>7} {r['rows_per_sec']:>12} "
+              f"{r['mb_per_sec']:>8} {r['latency_p50']:>8} {r['latency_p99']:>8}")
+    return results
+
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("-c", "--collection", type=str, required=True, help="collection name")
     parser.add_argument("-d", "--dim", type=int, default=128, help="dimension of the vectors")
     parser.add_argument("-n", "--new", action="store_true", help="Whether to create a new collection or use the existing one")
+    parser.add_argument("-t", "--total", type=int, default=100_000, help="number of entities to insert")
+    parser.add_argument("-b", "--batch", type=int, default=5000, help="number of entities per insert batch")
+    parser.add_argument("-w", "--workers", type=int, default=12, help="number of insert threads")
+    parser.add_argument("-a", "--adaptive", action="store_true", help="Tune batch size and concurrency while inserting")
+    parser.add_argument("-p", "--processes", action="store_true", help="Insert with a process pool instead of threads")
+    parser.add_argument("--benchmark", action="store_true", help="Compare threads and processes over several dims and batch sizes")
 
     flags = parser.parse_args()
     uri = "http://localhost:19530"
 
+    if flags.benchmark:
+        benchmark_insert_modes(uri, flags.collection, total_count=flags.total, workers=flags.workers)
+        exit(0)
+
     prepare_collection(flags.collection, flags.dim, recreate_if_exist=flags.new)
 
-    mp_insert = MilvusMultiThreadingInsert(flags.collection, 100_000, 5000, flags.dim)
+    insert_cls = MilvusMultiProcessingInsert if flags.processes else MilvusMultiThreadingInsert
+    mp_insert = insert_cls(
+        flags.collection, flags.total, flags.batch, flags.dim,
+        max_workers=flags.workers, adaptive=flags.adaptive,
+    )
     mp_insert.connect(uri)
     mp_insert.run()
 
@@ -0,0 +1,801 @@
+"""In-process stand-in for the subset of the pymilvus ORM API the scripts use.
+
+Collections live in NumPy arrays, search is brute force (or a simple IVF for
+IVF_* indexes) and filters are evaluated on the columns. Select it for any script
+with `MILVUS_BACKEND=local`, see milvus_backend.py.
+
+State is per process. A collection is pickled to `MILVUS_LOCAL_DIR` (default
+/tmp/local_milvus) when it is created, flushed or loaded, so worker processes
+opening the same collection see the same data. Saves hold a file lock and merge
+with the snapshot on disk: rows inserted by several processes are all kept, while
+any other change (delete, compaction, index, partitions) made over a snapshot
+which another process saved meanwhile raises instead of overwriting it.
+"""
+
+import ast
+import contextlib
+import fcntl
+import io
+import os
+import pickle
+import threading
+import tokenize
+import uuid
+from pathlib import Path
+
+import numpy as np
+from pymilvus import CollectionSchema, DataType
+
+from fake_services import FakeImportService
+
+LOCAL_DIR = Path(os.environ.get("MILVUS_LOCAL_DIR", "/tmp/local_milvus"))
+
+VECTOR_TYPES = (DataType.FLOAT_VECTOR, DataType.BINARY_VECTOR, DataType.FLOAT16_VECTOR,
+                DataType.BFLOAT16_VECTOR, DataType.SPARSE_FLOAT_VECTOR)
+NUMPY_DTYPES = {
+    DataType.BOOL: np.bool_,
+    DataType.INT8: np.int8,
+    DataType.INT16: np.int16,
+    DataType.INT32: np.int32,
+    DataType.INT64: np.int64,
+    DataType.FLOAT: np.float32,
+    DataType.DOUBLE: np.float64,
+    DataType.FLOAT_VECTOR: np.float32,
+    DataType.FLOAT16_VECTOR: np.float32,
+    DataType.BFLOAT16_VECTOR: np.float32,
+    DataType.BINARY_VECTOR: np.uint8,
+}
+
+_lock = threading.RLock()
+_collections = {}
+
+
+class MilvusLocalException(Exception):
+    pass
+
+
+# ---------------------------------------------------------------- expressions
+
+_COMPARE = {
+    ast.Eq: np.equal,
+    ast.NotEq: np.not_equal,
+    ast.Lt: np.less,
+    ast.LtE: np.less_equal,
+    ast.Gt: np.greater,
+    ast.GtE: np.greater_equal,
+}
+
+
+def eval_expr(expr: str, columns: dict, num_rows: int) -> np.ndarray:
+    """Evaluate a Milvus boolean expression on columns, return the row mask
+
+    Supports comparisons (chained too), in / not in, and / or / not (also && || !),
+    arithmetic on fields and JSON paths like meta["key"].
+    """
+    if not expr or not expr.strip():
+        return np.ones(num_rows, dtype=bool)
+    try:
+        tree = ast.parse(_to_python(expr.strip()), mode="eval")
+    except (SyntaxError, tokenize.TokenError) as e:
+        raise MilvusLocalException(f"cannot parse expression: {expr}") from e
+    mask = _eval_node(tree.body, columns)
+    return np.broadcast_to(np.asarray(mask, dtype=bool), (num_rows,)).copy()
+
+
+_OPERATORS = {"&&": "and", "||": "or", "!": "not"}
+_LITERALS = {"true": "True", "false": "False"}
+
+
+def _to_python(expr: str) -> str:
+    """Rewrite the Milvus operators and literals token by token, string literals
+    and field names like is_true are kept as they are
+    """
+    out, prev = [], None
+    for tok in tokenize.generate_tokens(io.StringIO(expr).readline):
+        if tok.type in (tokenize.NEWLINE, tokenize.NL, tokenize.ENDMARKER) or not tok.string.strip():
+            continue
+        text = tok.string
+        if tok.type == tokenize.NAME:
+            text = _LITERALS.get(text, text)
+        elif tok.type != tokenize.STRING:
+            # && and || come as two adjacent & or | tokens
+            if prev is not None and text in "&|" and prev.string == text and prev.end == tok.start:
+                out[-1] = _OPERATORS[text * 2]
+                prev = None
+                continue
+            text = _OPERATORS.get(text, text)
+        out.append(text)
+        prev = tok
+    return " ".join(out)
+
+
+def _eval_node(node, columns: dict):
+    if isinstance(node, ast.BoolOp):
+        values = [np.asarray(_eval_node(v, columns), dtype=bool) for v in node.values]
+        op = np.logical_and if isinstance(node.op, ast.And) else np.logical_or
+        return op.reduce(values)
+    if isinstance(node, ast.UnaryOp):
+        value = _eval_node(node.operand, columns)
+        if isinstance(node.op, ast.Not):
+            return ~np.asarray(value, dtype=bool)
+        if isinstance(node.op, ast.USub):
+            return -value
+        return value
+    if isinstance(node, ast.Compare):
+        left = _eval_node(node.left, columns)
+        result = True
+        for op, comparator in zip(node.ops, node.comparators):
+            right = _eval_node(comparator, columns)
+            if isinstance(op, (ast.In, ast.NotIn)):
+                value = np.isin(left, np.asarray(right, dtype=left.dtype if isinstance(left, np.ndarray) and left.dtype != object else None))
+                if isinstance(op, ast.NotIn):
+                    value = ~value
+            elif type(op) in _COMPARE:
+                value = _compare(_COMPARE[type(op)], left, right)
+            else:
+                raise MilvusLocalException(f"unsupported operator: {type(op).__name__}")
+            result = np.logical_and(result, value)
+            left = right
+        return result
+    if isinstance(node, ast.BinOp):
+        left, right = _eval_node(node.left, columns), _eval_node(node.right, columns)
+        ops = {ast.Add: np.add, ast.Sub: np.subtract, ast.Mult: np.multiply, ast.Div: np.divide, ast.Mod: np.mod}
+        if type(node.op) not in ops:
+            raise MilvusLocalException(f"unsupported operator: {type(node.op).__name__}")
+        return ops[type(node.op)](left, right)
+    if isinstance(node, ast.Name):
+        if node.id not in columns:
+            raise MilvusLocalException(f"field {node.id} does not exist")
+        return columns[node.id]
+    if isinstance(node, ast.Subscript):
+        # JSON path: meta["a"]["b"]
+        base = _eval_node(node.value, columns)
+        key = _eval_node(node.slice, columns)
+        return np.array([v.get(key) if isinstance(v, dict) else None for v in base], dtype=object)
+    if isinstance(node, ast.Constant):
+        return node.value
+    if isinstance(node, (ast.List, ast.Tuple)):
+        return [_eval_node(e, columns) for e in node.elts]
+    raise MilvusLocalException(f"unsupported expression: {ast.dump(node)}")
+
+
+def _compare(op, left, right):
+    if isinstance(left, np.ndarray) and left.dtype == object:
+        # JSON values may be missing or of mixed types, which never match
+        out = np.zeros(len(left), dtype=bool)
+        for i, v in enumerate(left):
+            try:
+                out[i] = v is not None and bool(op(v, right))
+            except TypeError:
+                pass
+        return out
+    return op(left, right)
+
+
+# ---------------------------------------------------------------- results
+
+class LocalEntity:
+    def __init__(self, fields: dict):
+        self.fields = fields
+
+    def get(self, name: str):
+        return self.fields.get(name)
+
+    def __getitem__(self, name: str):
+        return self.fields[name]
+
+
+class LocalHit:
+    def __init__(self, id, distance: float, fields: dict):
+        self.id = id
+        self.pk = id
+        self.distance = distance
+        self.score = distance
+        self.entity = LocalEntity(fields)
+
+    def get(self, name: str):
+        return self.entity.get(name)
+
+    def __repr__(self):
+        return f"id: {self.id}, distance: {self.distance}, entity: {self.entity.fields}"
+
+
+class LocalMutationResult:
+    def __init__(self, primary_keys: list = None, delete_count: int = 0):
+        self.primary_keys = primary_keys or []
+        self.insert_count = len(self.primary_keys)
+        self.upsert_count = len(self.primary_keys)
+        self.delete_count = delete_count
+
+
+class LocalSegmentInfo:
+    def __init__(self, segmentID: int, partition: str, num_rows: int, mem_size: int):
+        self.segmentID = segmentID
+        self.partitionID = partition
+        self.num_rows = num_rows
+        self.mem_size = mem_size
+        self.state = "Sealed"
+
+
+# ---------------------------------------------------------------- storage
+
+class _CollectionData:
+    """Column store of one collection, rows are appended in chunks"""
+
+    def __init__(self, name: str, schema: CollectionSchema):
+        self.name = name
+        self.schema_dict = schema.to_dict()
+        self.chunks = []  # [(columns dict, partition name)]
+        self.columns = None
+        self.partitions = {"_default"}
+        self.indexes = {}  # field -> (index_name, params)
+        self.ivf = {}  # field -> (centroids, assignment)
+        self.next_auto_id = 1
+        self.version = 0
+        # disk snapshot this state derives from: its id, row count and our version then
+        self.snapshot = None
+        self.saved_rows = 0
+        self.saved_version = 0
+        # whether anything but appending rows changed since the snapshot
+        self.rewritten = False
+        self.lock = threading.RLock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["lock"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(snapshot=None, saved_rows=0, saved_version=0, rewritten=False)
+        self.__dict__.update(state)
+        self.lock = threading.RLock()
+
+    @property
+    def schema(self) -> CollectionSchema:
+        return CollectionSchema.construct_from_dict(self.schema_dict)
+
+    def consolidated(self) -> dict:
+        """All rows as one array per field, plus `$partition` and `$deleted`"""
+        if self.columns is None:
+            if not self.chunks:
+                self.columns = {fs.name: _empty_column(fs) for fs in self.schema.fields}
+                self.columns["$partition"] = np.array([], dtype=object)
+                self.columns["$deleted"] = np.array([], dtype=bool)
+            else:
+                self.columns = {
+                    name: np.concatenate([chunk[name] for chunk in self.chunks])
+                    for name in self.chunks[0]
+                }
+            self.chunks = [self.columns]
+        return self.columns
+
+    def append(self, columns: dict):
+        self.chunks.append(columns)
+        self.columns = None
+        self.ivf = {}
+        self.version += 1
+
+    def rewrite(self):
+        """Record a change other than appending rows, it cannot be merged on save"""
+        self.ivf = {}
+        self.version += 1
+        self.rewritten = True
+
+    def num_rows(self) -> int:
+        return sum(len(chunk["$deleted"]) for chunk in self.chunks)
+
+    def dirty(self) -> bool:
+        return self.snapshot is None or self.version != self.saved_version
+
+    def save(self):
+        """Write the collection, merged with the snapshot another process saved since ours"""
+        path = LOCAL_DIR / f"{self.name}.pkl"
+        with self.lock, _file_lock(self.name):
+            disk = _read_snapshot(path)
+            if disk is not None and self.snapshot is not None and disk.snapshot != self.snapshot:
+                self._merge_into(disk)
+            self.consolidated()
+            self.snapshot = uuid.uuid4().hex
+            self.saved_rows = self.num_rows()
+            self.saved_version = self.version
+            self.rewritten = False
+            tmp = LOCAL_DIR / f"{self.name}.pkl.tmp"
+            tmp.write_bytes(pickle.dumps(self))
+            tmp.replace(path)
+
+    def _merge_into(self, disk: "_CollectionData"):
+        """Append the rows inserted since our snapshot to `disk`, then take its state"""
+        if self.rewritten:
+            raise MilvusLocalException(
+                f"collection {self.name} was saved by another process, only inserts can be merged with it"
+            )
+        columns = self.consolidated()
+        pending = {name: column[self.saved_rows:] for name, column in columns.items()}
+        if len(pending["$deleted"]):
+            pk = next(fs for fs in self.schema.fields if fs.is_primary)
+            if pk.auto_id:
+                if np.isin(pending[pk.name], disk.consolidated()[pk.name]).any():
+                    raise MilvusLocalException(
+                        f"auto_id primary keys of {self.name} collide with rows inserted by another process"
+                    )
+                disk.next_auto_id = max(disk.next_auto_id, self.next_auto_id)
+            disk.append(pending)
+        lock = self.lock
+        self.__dict__.update(disk.__dict__)
+        self.lock = lock
+
+
+def _empty_column(fs) -> np.ndarray:
+    if fs.dtype in (DataType.FLOAT_VECTOR, DataType.FLOAT16_VECTOR, DataType.BFLOAT16_VECTOR):
+        return np.empty((0, fs.dim), dtype=np.float32)
+    if fs.dtype == DataType.BINARY_VECTOR:
+        return np.empty((0, fs.dim // 8), dtype=np.uint8)
+    return np.array([], dtype=NUMPY_DTYPES.get(fs.dtype, object))
+
+
+def _to_column(fs, values, count: int) -> np.ndarray:
+    if fs.dtype in (DataType.FLOAT_VECTOR, DataType.FLOAT16_VECTOR, DataType.BFLOAT16_VECTOR):
+        return np.asarray(values, dtype=np.float32).reshape(count, fs.dim)
+    if fs.dtype == DataType.BINARY_VECTOR:
+        if len(values) and isinstance(values[0], (bytes, bytearray)):
+            values = np.frombuffer(b"".join(values), dtype=np.uint8)
+        return np.asarray(values, dtype=np.uint8).reshape(count, fs.dim // 8)
+    if fs.dtype in NUMPY_DTYPES:
+        return np.asarray(values, dtype=NUMPY_DTYPES[fs.dtype])
+    column = np.empty(count, dtype=object)
+    if hasattr(values, "tocsr"):
+        # scipy sparse matrix: one row matrix per entity
+        values = [values.getrow(i) for i in range(count)]
+    column[:] = [v for v in values]
+    return column
+
+
+@contextlib.contextmanager
+def _file_lock(name: str):
+    """Exclusive lock of a collection snapshot across processes"""
+    LOCAL_DIR.mkdir(parents=True, exist_ok=True)
+    with open(LOCAL_DIR / f"{name}.lock", "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _read_snapshot(path: Path):
+    return pickle.loads(path.read_bytes()) if path.exists() else None
+
+
+def _get_data(name: str) -> _CollectionData:
+    with _lock:
+        data = _collections.get(name)
+        if data is None:
+            data = _read_snapshot(LOCAL_DIR / f"{name}.pkl")
+            if data is not None:
+                _collections[name] = data
+        return data
+
+
+def _sync(name: str):
+    """Publish the unsaved changes of a collection, or pick up the snapshot on disk
+
+    Called on flush() and load(), so worker processes which open and load a
+    collection see the rows inserted by the processes which flushed it before.
+    """
+    with _lock:
+        current = _collections.get(name)
+        if current is not None and current.dirty():
+            current.save()
+            return
+        data = _read_snapshot(LOCAL_DIR / f"{name}.pkl")
+        if data is not None and (current is None or data.snapshot != current.snapshot):
+            _collections[name] = data
+
+
+# ---------------------------------------------------------------- ORM API
+
+class _Connections:
+    def connect(self, alias: str = "default", **kwargs):
+        pass
+
+    def disconnect(self, alias: str = "default"):
+        pass
+
+    def has_connection(self, alias: str = "default") -> bool:
+        return True
+
+
+connections = _Connections()
+
+
+class Collection:
+    def __init__(self, name: str, schema: CollectionSchema = None, **kwargs):
+        self._name = name
+        data = _get_data(name)
+        if data is None:
+            if schema is None:
+                raise MilvusLocalException(f"Collection {name} does not exist")
+            with _lock:
+                _collections[name] = _CollectionData(name, schema)
+                _collections[name].save()
+
+    @property
+    def _data(self) -> _CollectionData:
+        data = _get_data(self._name)
+        if data is None:
+            raise MilvusLocalException(f"Collection {self._name} does not exist")
+        return data
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def schema(self) -> CollectionSchema:
+        return self._data.schema
+
+    @property
+    def primary_field(self):
+        return next(fs for fs in self.schema.fields if fs.is_primary)
+
+    @property
+    def num_entities(self) -> int:
+        return self._data.num_rows()
+
+    # ---- partitions
+
+    def partition(self, partition_name: str):
+        if not self.has_partition(partition_name):
+            return None
+        return Partition(self, partition_name)
+
+    def has_partition(self, partition_name: str) -> bool:
+        return partition_name in self._data.partitions
+
+    def create_partition(self, partition_name: str, **kwargs):
+        data = self._data
+        with data.lock:
+            data.partitions.add(partition_name)
+            data.rewrite()
+        return Partition(self, partition_name)
+
+    def drop_partition(self, partition_name: str, **kwargs):
+        data = self._data
+        with data.lock:
+            columns = data.consolidated()
+            keep = columns["$partition"] != partition_name
+            data.columns = None
+            data.chunks = [{k: v[keep] for k, v in columns.items()}]
+            data.partitions.discard(partition_name)
+            data.rewrite()
+
+    # ---- writes
+
+    def _rows_to_columns(self, data) -> tuple:
+        fields = [fs for fs in self.schema.fields if not (fs.is_primary and fs.auto_id)]
+        if isinstance(data, dict):
+            data = [data]
+        if len(data) and isinstance(data[0], dict):
+            count = len(data)
+            values = {fs.name: [row.get(fs.name) for row in data] for fs in fields}
+        else:
+            if len(data) != len(fields):
+                raise MilvusLocalException(f"expected {len(fields)} columns, got {len(data)}")
+            values = {fs.name: column for fs, column in zip(fields, data)}
+            first = data[0]
+            count = first.shape[0] if hasattr(first, "shape") else len(first)
+        return values, count
+
+    def insert(self, data, partition_name: str = None, **kwargs) -> LocalMutationResult:
+        values, count = self._rows_to_columns(data)
+        store = self._data
+        with store.lock:
+            columns = {}
+            for fs in self.schema.fields:
+                if fs.is_primary and fs.auto_id:
+                    values[fs.name] = np.arange(store.next_auto_id, store.next_auto_id + count, dtype=np.int64)
+                    store.next_auto_id += count
+                columns[fs.name] = _to_column(fs, values[fs.name], count)
+            columns["$partition"] = np.full(count, partition_name or "_default", dtype=object)
+            columns["$deleted"] = np.zeros(count, dtype=bool)
+            store.append(columns)
+        return LocalMutationResult(primary_keys=columns[self.primary_field.name].tolist())
+
+    def delete(self, expr: str, partition_name: str = None, **kwargs) -> LocalMutationResult:
+        store = self._data
+        with store.lock:
+            columns = store.consolidated()
+            mask = eval_expr(expr, columns, len(columns["$deleted"])) & ~columns["$deleted"]
+            if partition_name:
+                mask &= columns["$partition"] == partition_name
+            columns["$deleted"] = columns["$deleted"] | mask
+            store.rewrite()
+        return LocalMutationResult(delete_count=int(mask.sum()))
+
+    def upsert(self, data, partition_name: str = None, **kwargs) -> LocalMutationResult:
+        values, _ = self._rows_to_columns(data)
+        pk = self.primary_field.name
+        pks = np.asarray(values[pk])
+        store = self._data
+        with store.lock:
+            columns = store.consolidated()
+            columns["$deleted"] = columns["$deleted"] | np.isin(columns[pk], pks)
+            store.rewrite()
+            return self.insert(data, partition_name)
+
+    def flush(self, **kwargs):
+        _sync(self._data.name)
+
+    def compact(self, **kwargs):
+        store = self._data
+        with store.lock:
+            columns = store.consolidated()
+            keep = ~columns["$deleted"]
+            store.columns = None
+            store.chunks = [{k: v[keep] for k, v in columns.items()}]
+            store.rewrite()
+
+    def wait_for_compaction_completed(self, **kwargs):
+        pass
+
+    # ---- index and load
+
+    def create_index(self, field_name: str, index_params: dict = None, index_name: str = None, **kwargs):
+        params = dict(index_params or {})
+        params.setdefault("metric_type", params.get("params", {}).get("metric_type", "L2"))
+        data = self._data
+        with data.lock:
+            data.indexes[field_name] = (index_name or field_name, params)
+            data.rewrite()
+
+    def has_index(self, **kwargs) -> bool:
+        return bool(self._data.indexes)
+
+    def drop_index(self, index_name: str = None, **kwargs):
+        data = self._data
+        with data.lock:
+            for field, (name, _) in list(data.indexes.items()):
+                if index_name is None or name == index_name:
+                    del data.indexes[field]
+                    data.rewrite()
+
+    def load(self, **kwargs):
+        _sync(self._name)
+
+    def release(self, **kwargs):
+        pass
+
+    # ---- reads
+
+    def query(self, expr: str = "", output_fields: list = None, partition_names: list = None, limit: int = None, **kwargs) -> list:
+        store = self._data
+        with store.lock:
+            columns = store.consolidated()
+            mask = self._filter(columns, expr, partition_names)
+            if output_fields and "count(*)" in output_fields:
+                return [{"count(*)": int(mask.sum())}]
+            rows = np.flatnonzero(mask)[:limit] if limit else np.flatnonzero(mask)
+            return [self._fields_of(columns, row, output_fields, include_pk=True) for row in rows]
+
+    def search(
+        self,
+        data,
+        anns_field: str,
+        param: dict = None,
+        limit: int = 10,
+        expr: str = None,
+        partition_names: list = None,
+        output_fields: list = None,
+        **kwargs,
+    ) -> list:
+        param = param or {}
+        store = self._data
+        with store.lock:
+            columns = store.consolidated()
+            mask = self._filter(columns, kwargs.get("filter", expr), partition_names)
+            _, index_params = store.indexes.get(anns_field, (None, {}))
+            metric = param.get("metric_type") or index_params.get("metric_type", "L2")
+            vectors = columns[anns_field]
+            if vectors.dtype == object:
+                raise MilvusLocalException(f"search on {anns_field} is not supported by the local backend")
+            queries = np.asarray(data, dtype=np.float32).reshape(-1, vectors.shape[1])
+
+            results = []
+            for q, candidates in zip(queries, self._candidates(store, anns_field, index_params, param, queries, mask)):
+                if len(candidates) == 0:
+                    results.append([])
+                    continue
+                distances = _distances(q[None, :], vectors[candidates], metric)[0]
+                order = np.argsort(distances)[:limit]
+                if metric in ("IP", "COSINE"):
+                    distances = -distances
+                pk = self.primary_field.name
+                results.append([
+                    LocalHit(
+                        columns[pk][candidates[i]].item(),
+                        float(distances[i]),
+                        self._fields_of(columns, candidates[i], output_fields),
+                    )
+                    for i in order
+                ])
+            return results
+
+    def _filter(self, columns: dict, expr: str, partition_names: list = None) -> np.ndarray:
+        mask = eval_expr(expr, columns, len(columns["$deleted"])) & ~columns["$deleted"]
+        if partition_names:
+            mask &= np.isin(columns["$partition"], partition_names)
+        return mask
+
+    def _candidates(self, store: _CollectionData, field: str, index_params: dict, param: dict, queries: np.ndarray, mask: np.ndarray) -> list:
+        index_type = index_params.get("index_type", "FLAT")
+        if not index_type.startswith("IVF"):
+            return [np.flatnonzero(mask)] * len(queries)
+
+        if field not in store.ivf:
+            nlist = index_params.get("params", {}).get("nlist", 128)
+            store.ivf[field] = _build_ivf(store.consolidated()[field], nlist, index_params.get("metric_type", "L2"))
+        centroids, assignment = store.ivf[field]
+        nprobe = param.get("params", {}).get("nprobe", 8)
+        nearest = np.argsort(_distances(queries, centroids, index_params.get("metric_type", "L2")), axis=1)[:, :nprobe]
+        return [np.flatnonzero(mask & np.isin(assignment, lists)) for lists in nearest]
+
+    def _fields_of(self, columns: dict, row: int, output_fields: list, include_pk: bool = False) -> dict:
+        names = []
+        if include_pk:
+            names.append(self.primary_field.name)
+        if output_fields:
+            if "*" in output_fields:
+                names += [fs.name for fs in self.schema.fields]
+            else:
+                names += list(output_fields)
+        out = {}
+        for name in dict.fromkeys(names):
+            value = columns[name][row]
+            out[name] = value.tolist() if hasattr(value, "tolist") else value
+        return out
+
+
+class Partition:
+    def __init__(self, collection, name: str, **kwargs):
+        if isinstance(collection, str):
+            collection = Collection(collection)
+        self._collection = collection
+        self._name = name
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def num_entities(self) -> int:
+        columns = self._collection._data.consolidated()
+        return int((columns["$partition"] == self._name).sum())
+
+    def insert(self, data, **kwargs) -> LocalMutationResult:
+        return self._collection.insert(data, partition_name=self._name)
+
+    def delete(self, expr: str, **kwargs) -> LocalMutationResult:
+        return self._collection.delete(expr, partition_name=self._name)
+
+    def upsert(self, data, **kwargs) -> LocalMutationResult:
+        return self._collection.upsert(data, partition_name=self._name)
+
+    def search(self, *args, **kwargs) -> list:
+        return self._collection.search(*args, partition_names=[self._name], **kwargs)
+
+    def query(self, *args, **kwargs) -> list:
+        return self._collection.query(*args, partition_names=[self._name], **kwargs)
+
+    def flush(self, **kwargs):
+        self._collection.flush()
+
+    def load(self, **kwargs):
+        self._collection.load()
+
+    def release(self, **kwargs):
+        pass
+
+    def drop(self, **kwargs):
+        self._collection.drop_partition(self._name)
+
+
+def _distances(queries: np.ndarray, base: np.ndarray, metric: str) -> np.ndarray:
+    """Distances where smaller is closer, IP and COSINE are negated"""
+    if metric == "COSINE":
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        base = base / np.maximum(np.linalg.norm(base, axis=1, keepdims=True), 1e-12)
+        return -(queries @ base.T)
+    if metric == "IP":
+        return -(queries @ base.T)
+    return (queries * queries).sum(axis=1)[:, None] - 2 * queries @ base.T + (base * base).sum(axis=1)[None, :]
+
+
+def _build_ivf(vectors: np.ndarray, nlist: int, metric: str, iterations: int = 5) -> tuple:
+    """Coarse quantizer: a few rounds of k-means on the vectors"""
+    rng = np.random.default_rng(0)
+    nlist = max(1, min(nlist, len(vectors)))
+    centroids = vectors[rng.choice(len(vectors), size=nlist, replace=False)].astype(np.float32)
+    for _ in range(iterations):
+        assignment = np.argmin(_distances(vectors, centroids, metric), axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, vectors)
+        counts = np.bincount(assignment, minlength=nlist)[:, None]
+        centroids = np.where(counts > 0, sums / np.maximum(counts, 1), centroids)
+    assignment = np.argmin(_distances(vectors, centroids, metric), axis=1)
+    return centroids, assignment
+
+
+class _Utility:
+    def has_collection(self, collection_name: str, **kwargs) -> bool:
+        return _get_data(collection_name) is not None
+
+    def drop_collection(self, collection_name: str, **kwargs):
+        with _lock, _file_lock(collection_name):
+            _collections.pop(collection_name, None)
+            (LOCAL_DIR / f"{collection_name}.pkl").unlink(missing_ok=True)
+
+    def list_collections(self, **kwargs) -> list:
+        names = set(_collections)
+        if LOCAL_DIR.exists():
+            names.update(p.stem for p in LOCAL_DIR.glob("*.pkl"))
+        return sorted(names)
+
+    def get_server_version(self, **kwargs) -> str:
+        return "local"
+
+    def wait_for_index_building_complete(self, collection_name: str, **kwargs):
+        pass
+
+    def index_building_progress(self, collection_name: str, **kwargs) -> dict:
+        rows = Collection(collection_name).num_entities
+        return {"total_rows": rows, "indexed_rows": rows, "pending_index_rows": 0}
+
+    def get_query_segment_info(self, collection_name: str, **kwargs) -> list:
+        """One pseudo segment per partition, sized by the bytes of its live rows"""
+        store = Collection(collection_name)._data
+        columns = store.consolidated()
+        segments = []
+        for i, partition in enumerate(sorted(store.partitions)):
+            rows = (columns["$partition"] == partition) & ~columns["$deleted"]
+            num_rows = int(rows.sum())
+            mem_size = 0
+            for fs in store.schema.fields:
+                column = columns[fs.name][rows]
+                if column.dtype == object:
+                    mem_size += sum(len(str(v)) for v in column)
+                else:
+                    mem_size += column.nbytes
+            if num_rows:
+                segments.append(LocalSegmentInfo(i, partition, num_rows, mem_size))
+        return segments
+
+
+utility = _Utility()
+
+
+class LocalImportService(FakeImportService):
+    """Fake import job lifecycle which really loads the files into local collections
+
+    Files are read from the FakeMinio store under `root` when a job completes.
+    """
+
+    def _refresh(self, job: dict) -> dict:
+        was_done = job["state"] in ("Completed", "Failed")
+        job = super()._refresh(job)
+        if not was_done and job["state"] == "Completed":
+            self._load_files(job)
+        return job
+
+    def _load_files(self, job: dict):
+        import pyarrow.parquet as pq
+
+        c = Collection(job["collectionName"])
+        for group in job["files"] or []:
+            for object_name in group:
+                path = os.path.join(self.root, "minio", self.bucket_name, object_name.lstrip("/"))
+                table = pq.read_table(path)
+                fields = [fs for fs in c.schema.fields if not (fs.is_primary and fs.auto_id)]
+                c.insert([table.column(fs.name).to_numpy(zero_copy_only=False) if fs.dtype not in VECTOR_TYPES
+                          else np.stack(table.column(fs.name).to_numpy(zero_copy_only=False))
+                          for fs in fields])
+        c.flush()
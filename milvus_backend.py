@@ -0,0 +1,40 @@
+"""Pick the Milvus client the scripts talk to.
+
+    MILVUS_BACKEND=milvus  pymilvus against a live server (default)
+    MILVUS_BACKEND=local   local_milvus, in-process NumPy collections, plus the
+                           fake MinIO / bulk import services under MILVUS_LOCAL_DIR
+
+Scripts import `Collection`, `Partition`, `connections` and `utility` from here
+instead of pymilvus; schema classes still come from pymilvus.
+"""
+
+import os
+
+BACKEND = os.environ.get("MILVUS_BACKEND", "milvus")
+
+if BACKEND == "local":
+    from local_milvus import Collection, Partition, connections, utility, LOCAL_DIR, LocalImportService
+    from fake_services import FakeMinio
+elif BACKEND == "milvus":
+    from pymilvus import Collection, Partition, connections, utility
+else:
+    raise ValueError(f"unknown MILVUS_BACKEND: {BACKEND}")
+
+
+def is_local() -> bool:
+    return BACKEND == "local"
+
+
+def get_import_api():
+    """Module or object with bulk_import / get_import_progress / list_import_jobs"""
+    if is_local():
+        return LocalImportService(str(LOCAL_DIR))
+    from pymilvus import bulk_writer
+    return bulk_writer
+
+
+def get_minio_client():
+    """FakeMinio for the local backend, None to let the caller build a real client"""
+    if is_local():
+        return FakeMinio(str(LOCAL_DIR))
+    return None
@@ -4,7 +4,11 @@ import numpy as np
 from pymilvus.bulk_writer import bulk_import, list_import_jobs, RemoteBulkWriter, BulkFileType, LocalBulkWriter
 import json, time
 import os
+import argparse
+import concurrent.futures
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
 import pyarrow.parquet as pq
 
 from minio import Minio 
@@ -65,9 +69,266 @@ def process_parquet_files(parquet_dir: str = "/home/zilliz/data", output_dir: st
         logging.error(f"Processing failed: {str(e)}", exc_info=True)
         raise
 
+
+EMB_DIM = 1024
+STRING_FIELDS = ["_id", "url", "title", "text"]
+
+# Output schema of the streaming path, same layout LocalBulkWriter produces for the
+# collection schema above so the shards are accepted by bulk_import as-is.
+OUTPUT_SCHEMA = pa.schema(
+    [pa.field(name, pa.string()) for name in STRING_FIELDS]
+    + [pa.field("emb", pa.list_(pa.float32()))]
+)
+
+
+def rewrite_batch(batch: pa.RecordBatch, dim: int = EMB_DIM) -> pa.RecordBatch:
+    """Convert one source record batch to the import layout without leaving Arrow"""
+    columns = [pc.cast(batch.column(name), pa.string()) for name in STRING_FIELDS]
+
+    # list<double> -> fixed_size_list<float, dim> validates the dimension of every row,
+    # then drop back to a plain list which is what the importer expects
+    emb = batch.column("emb")
+    emb = pc.cast(emb, pa.list_(pa.float32(), dim))
+    emb = pc.cast(emb, pa.list_(pa.float32()))
+    columns.append(emb)
+
+    return pa.RecordBatch.from_arrays(columns, schema=OUTPUT_SCHEMA)
+
+
+class ShardWriter:
+    """Roll output parquet files over once `segment_size` bytes have been written"""
+
+    def __init__(self, output_dir: str, segment_size: int, prefix: str = "shard"):
+        self.output_dir = output_dir
+        self.segment_size = segment_size
+        self.prefix = prefix
+        self.shards = []  # [(path, num_rows)]
+        self._writer = None
+        self._path = None
+        self._rows = 0
+        self._bytes = 0
+
+    def _open(self):
+        self._path = os.path.join(self.output_dir, f"{self.prefix}-{len(self.shards):05d}.parquet")
+        self._writer = pq.ParquetWriter(self._path, OUTPUT_SCHEMA)
+        self._rows = 0
+        self._bytes = 0
+
+    def _close(self):
+        if self._writer is None:
+            return
+        self._writer.close()
+        self.shards.append((self._path, self._rows))
+        logging.info(f"Sealed {self._path}: {self._rows} rows, {self._bytes/1024/1024:.1f}MB")
+        self._writer = None
+
+    def write(self, batch: pa.RecordBatch):
+        if self._writer is None:
+            self._open()
+        self._writer.write_batch(batch)
+        self._rows += batch.num_rows
+        self._bytes += batch.nbytes
+        if self._bytes >= self.segment_size:
+            self._close()
+
+    def close(self):
+        self._close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def list_parquet_files(parquet_dir: str) -> list:
+    return sorted(
+        os.path.join(parquet_dir, filename)
+        for filename in os.listdir(parquet_dir)
+        if filename.endswith('.parquet')
+    )
+
+
+MANIFEST_FILE = "manifest.json"
+
+
+def write_manifest(output_dir: str, shards: list):
+    """Record the rewritten shards and their row counts next to the shards"""
+    manifest = {
+        "total_rows": sum(num_rows for _, num_rows in shards),
+        "shards": [{"path": path, "num_rows": num_rows} for path, num_rows in shards],
+    }
+    with open(os.path.join(output_dir, MANIFEST_FILE), "w") as f:
+        json.dump(manifest, f, indent=2)
+    logging.info(f"Manifest written: {len(shards)} shards, {manifest['total_rows']} rows")
+
+
+def load_manifest(output_dir: str) -> list:
+    """Return the shard list of a rewrite in the `files` format of bulk_import"""
+    with open(os.path.join(output_dir, MANIFEST_FILE)) as f:
+        manifest = json.load(f)
+    return [[shard["path"]] for shard in manifest["shards"]]
+
+
+def split_tasks(file_paths: list, workers: int) -> list:
+    """Split input into (file_path, row_groups) units of work
+
+    Whole files are the unit of work, unless there are fewer files than workers, then
+    the row groups of each file are split in ranges so every worker gets something.
+    """
+    if not file_paths or len(file_paths) >= workers:
+        return [(file_path, None) for file_path in file_paths]
+
+    tasks = []
+    ranges_per_file = -(-workers // len(file_paths))
+    for file_path in file_paths:
+        num_row_groups = pq.ParquetFile(file_path).num_row_groups
+        step = max(1, -(-num_row_groups // ranges_per_file))
+        for start in range(0, num_row_groups, step):
+            tasks.append((file_path, list(range(start, min(start + step, num_row_groups)))))
+    return tasks
+
+
+def rewrite_task(
+    task_id: int,
+    file_path: str,
+    row_groups: list,
+    output_dir: str,
+    segment_size: int,
+    batch_size: int,
+) -> tuple:
+    """Rewrite one unit of work into its own shards, runs inside the process pool
+
+    return: shards [(path, num_rows)], bytes written
+    """
+    num_bytes = 0
+    pf = pq.ParquetFile(file_path)
+    with ShardWriter(output_dir, segment_size, prefix=f"task{task_id:05d}") as writer:
+        for batch in pf.iter_batches(batch_size=batch_size, row_groups=row_groups, columns=STRING_FIELDS + ["emb"]):
+            out = rewrite_batch(batch)
+            writer.write(out)
+            num_bytes += out.nbytes
+    return writer.shards, num_bytes
+
+
+def process_parquet_files_parallel(
+    parquet_dir: str = "/home/zilliz/data",
+    output_dir: str = "/home/zilliz/rewrite_data",
+    workers: int = os.cpu_count(),
+    segment_size: int = 512*1024*1024,
+    batch_size: int = 8192,
+) -> list:
+    """Fan files (or row group ranges of them) out to a process pool
+
+    Each worker writes its own shards, a manifest of all shards is written to
+    `output_dir`. Returns the shard list in the `files` format of bulk_import.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    tasks = split_tasks(list_parquet_files(parquet_dir), workers)
+    logging.info(f"Rewriting {len(tasks)} tasks with {workers} workers")
+
+    shards = []
+    total_rows = 0
+    total_bytes = 0
+    start_time = time.perf_counter()
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(rewrite_task, task_id, file_path, row_groups, output_dir, segment_size, batch_size): file_path
+            for task_id, (file_path, row_groups) in enumerate(tasks)
+        }
+        for done, future in enumerate(concurrent.futures.as_completed(futures), start=1):
+            task_shards, num_bytes = future.result()
+            shards.extend(task_shards)
+            total_rows += sum(num_rows for _, num_rows in task_shards)
+            total_bytes += num_bytes
+
+            cost = time.perf_counter() - start_time
+            logging.info(
+                f"[{done}/{len(tasks)}] finished {os.path.basename(futures[future])}, "
+                f"total {total_rows} rows, {total_rows/cost:.0f} rows/s, {total_bytes/1024/1024/cost:.1f} MB/s"
+            )
+
+    shards.sort()
+    write_manifest(output_dir, shards)
+    cost = time.perf_counter() - start_time
+    logging.info(
+        f"Rewrote {total_rows} rows into {len(shards)} files in {cost:.2f}s, "
+        f"{total_rows/cost:.0f} rows/s, {total_bytes/1024/1024/cost:.1f} MB/s"
+    )
+    return [[path] for path, _ in shards]
+
+
+def process_parquet_files_streaming(
+    parquet_dir: str = "/home/zilliz/data",
+    output_dir: str = "/home/zilliz/rewrite_data",
+    segment_size: int = 512*1024*1024,
+    batch_size: int = 8192,
+) -> list:
+    """Stream all parquet files in directory batch by batch into import-ready shards
+
+    Memory is bounded by one record batch. Returns the shard list in the `files`
+    format of bulk_import, e.g. [[path1], [path2]].
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    total_rows = 0
+    total_bytes = 0
+    start_time = time.perf_counter()
+
+    with ShardWriter(output_dir, segment_size) as writer:
+        for file_path in list_parquet_files(parquet_dir):
+            pf = pq.ParquetFile(file_path)
+            file_rows = 0
+            for batch in pf.iter_batches(batch_size=batch_size, columns=STRING_FIELDS + ["emb"]):
+                out = rewrite_batch(batch)
+                writer.write(out)
+                file_rows += out.num_rows
+                total_bytes += out.nbytes
+
+            total_rows += file_rows
+            cost = time.perf_counter() - start_time
+            logging.info(
+                f"Processed {file_rows} rows from {os.path.basename(file_path)}, "
+                f"{total_rows/cost:.0f} rows/s, {total_bytes/1024/1024/cost:.1f} MB/s"
+            )
+
+    cost = time.perf_counter() - start_time
+    logging.info(
+        f"Rewrote {total_rows} rows into {len(writer.shards)} files in {cost:.2f}s, "
+        f"{total_rows/cost:.0f} rows/s, {total_bytes/1024/1024/cost:.1f} MB/s"
+    )
+    write_manifest(output_dir, writer.shards)
+    return [[path] for path, _ in writer.shards]
+
+
 def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-i", "--input", type=str, default="/home/zilliz/data", help="directory of source parquet files")
+    parser.add_argument("-o", "--output", type=str, default="/home/zilliz/rewrite_data", help="directory to write rewritten files")
+    parser.add_argument("--stream", action="store_true", help="Use the streaming Arrow batch rewrite instead of LocalBulkWriter")
+    parser.add_argument("--segment-size", type=int, default=512, help="target size of each output file in MB")
+    parser.add_argument("--batch-size", type=int, default=8192, help="rows per record batch in streaming mode")
+    parser.add_argument("-w", "--workers", type=int, default=1, help="number of rewrite processes, implies --stream when > 1")
+    flags = parser.parse_args()
+
     logging.info("Starting parquet processing...")
-    process_parquet_files()
+    if flags.workers > 1:
+        process_parquet_files_parallel(
+            flags.input,
+            flags.output,
+            workers=flags.workers,
+            segment_size=flags.segment_size*1024*1024,
+            batch_size=flags.batch_size,
+        )
+    elif flags.stream:
+        process_parquet_files_streaming(
+            flags.input,
+            flags.output,
+            segment_size=flags.segment_size*1024*1024,
+            batch_size=flags.batch_size,
+        )
+    else:
+        process_parquet_files(flags.input, flags.output)
     logging.info("Processing completed successfully")
 
 if __name__ == "__main__":
@@ -1,2 +1,3 @@
 export MILVUS_HOST=10.100.32.66
-export MINIO_ENDPOINT=10.100.32.66:9000
\ No newline at end of file
+export MINIO_ENDPOINT=10.100.32.66:9000
+# export MILVUS_BACKEND=local  # run the scripts against local_milvus, no server needed
@@ -1,8 +1,9 @@
-from pymilvus import connections, Collection
+from milvus_backend import connections, Collection
 import os
 from  pathlib import Path
 
 # local
+from delete_engine import DeleteEngine, DeletePlan, FlushPolicy
 from load_data import prepare_collection
 from generate_segment import generate_segments, SegmentDistribution, Unit
 
@@ -23,7 +24,7 @@ def generate_n_segments(name: str, n: int = 20):
     return generate_segments(dist)
 
 
-def delete_n_percent(name: str, all_pks: list[list] = None, n: int = 20):
+def delete_n_percent(name: str, all_pks: list[list] = None, n: int = 20, flush_policy: FlushPolicy = None):
     import numpy as np
     connections.connect()
     c = Collection(name)
@@ -32,28 +33,26 @@ def delete_n_percent(name: str, all_pks: list[list] = None, n: int = 20):
     if not isinstance(all_pks, list):
         raise TypeError(f"pks should be a list, but got {type(all_pks)}")
 
+    engine = DeleteEngine(c, flush_policy=flush_policy)
     for i, pks in enumerate(all_pks):
         sample_pks = np.random.choice(pks, size=int(n*0.01*len(pks)), replace=False)
-        expr = f"pk in {sample_pks.tolist()}"
-        c.delete(expr)
+        engine.delete(sample_pks, flush=False)
         print(f"sampled pk counts: {len(sample_pks)} and delete done")
-        c.flush()
+    engine.flush()
 
 
-def delete_n_percent_to_files(name: str, all_pks: list[list] = None, n: int = 20):
+def delete_n_percent_to_files(name: str, all_pks: list[list] = None, n: int = 20, plan_dir: str = "delete_plan", seed: int = None):
     import numpy as np
-    connections.connect()
-    c = Collection(name)
-    c.load()
 
     if not isinstance(all_pks, list):
         raise TypeError(f"pks should be a list, but got {type(all_pks)}")
 
-    for i, pks in enumerate(all_pks):
-        sample_pks = np.random.choice(pks, size=int(n*0.01*len(pks)), replace=False)
-        with Path(f"pks_{i}.txt").open("w") as f:
-            for pk in sample_pks:
-                f.write(f"{pk}\n")
+    if seed is None:
+        seed = int(np.random.default_rng().integers(1 << 31))
+    rng = np.random.default_rng(seed)
+    samples = [rng.choice(pks, size=int(n*0.01*len(pks)), replace=False) for pks in all_pks]
+    plan = DeletePlan.write(plan_dir, samples, collection=name, seed=seed)
+    print(f"delete plan written to {plan_dir}, seed: {seed}, files: {len(samples)}, pk counts: {plan.header['num_pks']}")
 
 
 def delete_all(name):
@@ -65,20 +64,17 @@ def delete_all(name):
     print(f"delete counts: {ret.delete_count}")
 
 
-def delete_by_files(name: str):
+def delete_by_files(name: str, plan_dir: str = "delete_plan", flush_policy: FlushPolicy = None):
+    plan = DeletePlan.load(plan_dir)
+    if plan.header["collection"] != name:
+        raise ValueError(f"delete plan is for collection {plan.header['collection']}, not {name}")
+
     connections.connect()
     c = Collection(name)
     c.load()
-    del_count = 0
-
-    for i in range(20):
-        with Path(f"pks_{i}.txt").open("r") as f:
-            pks = [int(line.strip()) for line in f.readlines()]
-        expr = f"pk in {pks}"
-        ret = c.delete(expr)
-        print(f"sampled pk counts: {len(pks)} and delete done")
-        del_count += ret.delete_count
-        c.flush()
+
+    engine = DeleteEngine(c, pk_field=plan.header["pk_field"], flush_policy=flush_policy)
+    del_count = engine.replay(plan)
 
     print(f"delete counts: {del_count}")
 
@@ -1,9 +1,13 @@
-from pymilvus import connections, Collection, CollectionSchema, FieldSchema, DataType, utility
+from pymilvus import CollectionSchema, FieldSchema, DataType
+from milvus_backend import connections, Collection, utility
 import numpy as np
 import time
 import threading
 from concurrent.futures import ThreadPoolExecutor
 
+from delete_engine import DeleteEngine, FlushPolicy
+from latency_histogram import LatencyHistogram
+
 def connect_to_milvus():
     """连接到Milvus服务器"""
     connections.connect(
@@ -39,21 +43,21 @@ def create_collection():
     return collection
 
 def insert_data(collection, num_entities=100000):
-    """插入数据"""
+    """插入数据，返回主键和向量（用于计算暴力检索的ground truth）"""
     # 生成随机数据
     ids = np.arange(num_entities)
-    vectors = np.random.random((num_entities, 128))  # 128维向量
+    vectors = np.random.random((num_entities, 128)).astype(np.float32)  # 128维向量
     
     # 准备插入的数据
     entities = [
         ids.tolist(),
-        vectors.tolist()
+        vectors
     ]
     
     # 插入数据
     insert_result = collection.insert(entities)
     print(f"Successfully inserted {num_entities} entities")
-    return ids.tolist()
+    return ids, vectors
 
 def create_index(collection):
     """创建索引"""
@@ -65,52 +69,167 @@ def create_index(collection):
     collection.create_index(field_name="vector", index_params=index_params)
     print("Successfully created index")
 
-def search_data(collection):
-    """执行查询操作"""
-    search_count = 0
-    while True:
-        try:
-            # 随机生成一个查询向量
-            search_vectors = np.random.random((1, 128))
-            search_param = {
-                "metric_type": "L2",
-                "params": {"nprobe": 10},
-            }
-            results = collection.search(
-                data=[search_vectors[0].tolist()],
-                anns_field="vector",
-                param=search_param,
-                limit=10
-            )
-            
-            # 验证查询结果
-            hits = results[0]  # 获取第一个查询向量的结果
-            num_hits = len(hits)
-            search_count += 1
-            
-            print(f"Search #{search_count}: Found {num_hits} results, distances: "
-                  f"[{hits[0].distance:.4f} - {hits[-1].distance:.4f}]")
-            
-            time.sleep(1)  # 避免查询太频繁
-        except Exception as e:
-            print(f"Search error: {e}")
-            break
-
-def delete_entities(collection, ids):
-    """分批删除实体并定期执行flush"""
-    batch_size = 2000
-    total_batches = len(ids) // batch_size + (1 if len(ids) % batch_size != 0 else 0)
-    
-    for i in range(0, len(ids), batch_size):
-        batch_ids = ids[i:i + batch_size]
-        expr = f"id in {batch_ids}"
-        try:
-            collection.delete(expr)
-            collection.flush()  # 每删除一批数据后执行flush
-            print(f"Successfully deleted and flushed batch {i//batch_size + 1}/{total_batches} ({len(batch_ids)} entities)")
-            time.sleep(2)  # 每批删除后暂停2秒
-        except Exception as e:
-            print(f"Delete error in batch {i//batch_size + 1}: {e}")
+def delete_entities(collection, ids, flush_policy=None):
+    """批量删除实体，按flush_policy执行flush"""
+    engine = DeleteEngine(collection, pk_field="id", flush_policy=flush_policy)
+    try:
+        engine.delete(np.asarray(ids))
+        print(f"Successfully deleted {engine.delete_count} entities, flushed {engine.flush_count} times")
+    except Exception as e:
+        print(f"Delete error: {e}")
+
+def brute_force_topk(vectors, alive, queries, k):
+    """L2精确检索，返回alive中的向量下标 (nq, k)"""
+    candidates = np.flatnonzero(alive)
+    base = vectors[candidates]
+    # ||q - v||^2 = ||q||^2 - 2 q·v + ||v||^2，||q||^2对排序无影响
+    dist = (base * base).sum(axis=1)[None, :] - 2 * queries @ base.T
+    top = np.argpartition(dist, k, axis=1)[:, :k]
+    order = np.take_along_axis(dist, top, axis=1).argsort(axis=1)
+    return candidates[np.take_along_axis(top, order, axis=1)]
+
+
+def run_interference_benchmark(
+    collection,
+    ids,
+    vectors,
+    search_workers=4,
+    target_qps=None,
+    write_mode="delete",
+    write_ratio=0.2,
+    write_batch=2000,
+    write_interval=0.5,
+    flush_policy=None,
+    before_seconds=10,
+    after_seconds=10,
+    window_seconds=1.0,
+    nq=100,
+    k=10,
+):
+    """删除/upsert对检索延迟和召回率的干扰测试
+
+    search_workers个线程持续检索，target_qps不为空时按固定速率发送（开环），
+    延迟从计划发送时间开始计算；否则每个线程闭环发送。
+    写入阶段每write_interval秒delete或upsert write_batch个实体，共write_ratio比例，
+    flush由flush_policy控制。
+
+    返回: 前/中/后三个阶段的延迟分位数和召回率，以及每个时间窗口的延迟
+    """
+    ids = np.asarray(ids)
+    rng = np.random.default_rng(0)
+    queries = rng.random((nq, vectors.shape[1]), dtype=np.float32)
+    search_param = {"metric_type": "L2", "params": {"nprobe": 10}}
+
+    stop = threading.Event()
+    state = {"phase": "before"}
+    start_time = time.perf_counter()
+    worker_results = [
+        dict(windows={}, phases={name: LatencyHistogram() for name in ("before", "during", "after")}, samples=[])
+        for _ in range(search_workers)
+    ]
+
+    def search_worker(worker_id):
+        result = worker_results[worker_id]
+        interval = search_workers / target_qps if target_qps else 0
+        next_send = time.perf_counter() + interval * worker_id / search_workers
+        i = worker_id
+        while not stop.is_set():
+            if target_qps:
+                sleep = next_send - time.perf_counter()
+                if sleep > 0:
+                    time.sleep(sleep)
+                scheduled = next_send
+                next_send += interval
+            else:
+                scheduled = time.perf_counter()
+            phase = state["phase"]
+
+            q = i % nq
+            i += search_workers
+            try:
+                res = collection.search(
+                    data=[queries[q]], anns_field="vector", param=search_param, limit=k
+                )
+            except Exception as e:
+                print(f"Search error: {e}")
+                continue
+            latency = (time.perf_counter() - scheduled) * 1000
+            window = int((scheduled - start_time) / window_seconds)
+            result["windows"].setdefault(window, LatencyHistogram()).record(latency)
+            result["phases"][phase].record(latency)
+            # 只保留召回率需要的结果，延迟只记录在直方图中
+            result["samples"].append((scheduled - start_time, phase, q, [hit.id for hit in res[0]]))
+
+    threads = [threading.Thread(target=search_worker, args=(w,), daemon=True) for w in range(search_workers)]
+    for t in threads:
+        t.start()
+
+    # 写入前
+    time.sleep(before_seconds)
+
+    # 写入阶段：记录每批写入完成的时间，用于计算各时刻的ground truth
+    state["phase"] = "during"
+    write_ops = []
+    engine = DeleteEngine(collection, pk_field="id", flush_policy=flush_policy)
+    targets = rng.choice(len(ids), size=int(len(ids) * write_ratio), replace=False)
+    for i in range(0, len(targets), write_batch):
+        batch = targets[i:i + write_batch]
+        if write_mode == "upsert":
+            new_vectors = rng.random((len(batch), vectors.shape[1]), dtype=np.float32)
+            collection.upsert([ids[batch].tolist(), new_vectors])
+        else:
+            new_vectors = None
+            engine.delete(ids[batch], flush=False)
+        write_ops.append((time.perf_counter() - start_time, batch, new_vectors))
+        time.sleep(write_interval)
+    if engine.flush_policy.at_end:
+        engine.flush()
+    state["phase"] = "after"
+
+    # 写入后
+    time.sleep(after_seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+
+    # 合并各线程每个时间窗口和每个阶段的直方图
+    windows = {}
+    phases = {name: LatencyHistogram() for name in ("before", "during", "after")}
+    for result in worker_results:
+        for window, hist in result["windows"].items():
+            windows.setdefault(window, LatencyHistogram()).merge(hist)
+        for name, hist in result["phases"].items():
+            phases[name].merge(hist)
+    samples = sorted(s for result in worker_results for s in result["samples"])
+
+    # 召回率：每个检索对比发出时已完成写入之后的暴力检索结果
+    op_times = [op[0] for op in write_ops]
+    current = vectors.copy()
+    alive = np.ones(len(ids), dtype=bool)
+    applied = 0
+    gt = brute_force_topk(current, alive, queries, k)
+    recalls = {name: [] for name in phases}
+    for t, phase, q, result_ids in samples:
+        epoch = int(np.searchsorted(op_times, t, side="right"))
+        if epoch != applied:
+            for _, batch, new_vectors in write_ops[applied:epoch]:
+                if new_vectors is None:
+                    alive[batch] = False
+                else:
+                    current[batch] = new_vectors
+            applied = epoch
+            gt = brute_force_topk(current, alive, queries, k)
+        recalls[phase].append(len(set(result_ids) & set(ids[gt[q]].tolist())) / k)
+
+    report = {}
+    for name, hist in phases.items():
+        report[name] = dict(**hist.summary(), recall=round(float(np.mean(recalls[name])), 4) if recalls[name] else None)
+        print(f"{name:>7}: {report[name]}")
+    report["timeline"] = {
+        round(window * window_seconds, 3): windows[window].summary() for window in sorted(windows)
+    }
+    return report
+
 
 def main():
     # 1. 连接到Milvus
@@ -121,7 +240,7 @@ def main():
     
     # 3. 插入数据
     start_time = time.time()
-    ids = insert_data(collection)
+    ids, vectors = insert_data(collection)
     print(f"Insertion time: {time.time() - start_time:.2f} seconds")
     
     # 4. 创建索引
@@ -133,18 +252,10 @@ def main():
     collection.load()
     print("Successfully loaded collection")
     
-    # 6. 并发执行删除和查询
+    # 6. 并发执行删除和查询，统计写入前/中/后的检索延迟和召回率
     start_time = time.time()
-    
-    # 创建一个线程来执行查询
-    search_thread = threading.Thread(target=search_data, args=(collection,))
-    search_thread.daemon = True  # 设置为守护线程，这样主程序结束时会自动终止
-    search_thread.start()
-    
-    # 执行删除操作
-    delete_entities(collection, ids)
-    
-    print(f"Deletion time: {time.time() - start_time:.2f} seconds")
+    run_interference_benchmark(collection, ids, vectors)
+    print(f"Benchmark time: {time.time() - start_time:.2f} seconds")
     
     # 释放集合
     collection.release()
@@ -1,4 +1,4 @@
-from pymilvus import connections, Collection
+from milvus_backend import connections, Collection
 
 # local
 from load_data import prepare_collection
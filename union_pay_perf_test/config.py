@@ -9,6 +9,7 @@ collection_name = "union_pay_test"
 pk_field = "pk"
 vector_field = "vector"
 num_insert_batch = 500
+insert_read_batch = 50_000  # rows read from parquet at once by insert_test
 vector_index_name = "vector_idx"
 dim = 1024
 
@@ -17,10 +18,62 @@ M = 16
 efConstruction = 200
 ef_list = [10, 20, 40, 60, 80, 100, 120, 160, 200, 300, 400, 500]
 
+metric_type = "COSINE"
+
+# index matrix config, every build params of every index type is built on the same
+# data and searched with every value of its search knob
+index_matrix = [
+    dict(index_type="FLAT", build=[{}], knob=None, values=[None]),
+    dict(
+        index_type="HNSW",
+        build=[dict(M=16, efConstruction=200), dict(M=24, efConstruction=200), dict(M=32, efConstruction=360)],
+        knob="ef",
+        values=[10, 20, 40, 80, 160, 320],
+    ),
+    dict(
+        index_type="IVF_FLAT",
+        build=[dict(nlist=1024), dict(nlist=4096)],
+        knob="nprobe",
+        values=[8, 16, 32, 64, 128],
+    ),
+    dict(index_type="IVF_SQ8", build=[dict(nlist=1024)], knob="nprobe", values=[8, 16, 32, 64, 128]),
+    dict(
+        index_type="IVF_PQ",
+        build=[dict(nlist=512, m=16, nbits=8), dict(nlist=1024, m=32, nbits=8)],
+        knob="nprobe",
+        values=[8, 16, 32, 64, 128],
+    ),
+    dict(
+        index_type="HNSW_PQ",
+        build=[dict(M=24, efConstruction=200, m=16, nbits=8)],
+        knob="ef",
+        values=[20, 40, 80, 160, 320],
+    ),
+    dict(index_type="DISKANN", build=[{}], knob="search_list", values=[20, 50, 100, 200]),
+]
+index_bench_conc = 20
+index_bench_file = "index_bench.json"
+
 # conc test config
 k = 10
+recall_ks = [1, 5, 10]  # recall and NDCG are reported at every k <= k
 conc_list = [1, 5, 10, 15, 20, 40, 60, 80]
 conc_duration = 30
+nq = 1  # queries per search request in the search test
+
+# nq sweep config, serial and concurrent search with every batch size
+nq_sweep = False  # run the nq sweep after the search test
+nq_list = [1, 2, 5, 10, 20, 50, 100]
+nq_sweep_ef = 100
+nq_sweep_conc = 10
+
+# open-loop test config, offered load is swept in order until the server saturates
+open_loop_ef_list = []  # ef values of search_test to sweep, e.g. [100], empty to skip
+open_loop_qps_list = [100, 200, 400, 800, 1200, 1600, 2400, 3200]
+open_loop_arrival = "poisson"  # or "constant"
+open_loop_workers = 8
+open_loop_max_inflight = 64  # concurrent requests per worker process
+open_loop_duration = 30
 
 # dataset config
 train_dir = ""
@@ -30,25 +83,67 @@ train_files.sort()
 train_vector_col_name = "emb"
 query_vectors_file = ""
 query_vector_col_name = "emb"
+query_vectors_npy = ""  # converted copy of query_vectors_file, next to it if empty
+
 
+def get_query_vectors():
+    """QueryStore handle of the query vectors, random ones without query_vectors_file"""
+    from utils import QueryStore
 
-def get_query_vectors() -> list[list[float]]:
-    return np.random.rand(1000, 1024).tolist()
-    df = pl.read_parquet(query_vectors_file)
-    return df[query_vector_col_name].to_list()
+    if not query_vectors_file:
+        return QueryStore.from_array(
+            np.random.default_rng(0).random((1000, dim), dtype=np.float32)
+        )
+    return QueryStore.from_parquet(
+        query_vectors_file, query_vector_col_name, query_vectors_npy or None
+    )
 
 
 exprs = ["", f"{pk_field} > 2000", f"{pk_field} > 10000", f"{pk_field} > 18000"]
 groudtruth_dir = ""
 groudtruth_col_name = "neighbors_id"
-groudtruth_files = []
+groudtruth_distance_col_name = "distances"
+# one file per expr, as written by groundtruth.py
+groudtruth_files = [f"neighbors_{i}.parquet" for i in range(len(exprs))]
 
 
 def get_groundtruth(expr: str) -> list[list[int]]:
-    return np.random.randint(1, 100, size=(1000, 10))
     gt_file = groudtruth_files[exprs.index(expr)]
     df = pl.read_parquet(Path(groudtruth_dir, gt_file))
     return df[groudtruth_col_name].to_list()
 
 
+def get_groundtruth_distances(expr: str) -> list[list[float]]:
+    """None for ground truth files without distances"""
+    gt_file = groudtruth_files[exprs.index(expr)]
+    df = pl.read_parquet(Path(groudtruth_dir, gt_file))
+    if groudtruth_distance_col_name not in df.columns:
+        return None
+    return df[groudtruth_distance_col_name].to_list()
+
+
 results_file = "results.json"
+results_db = "results.db"  # every run is appended, see results_store.py
+
+# filter selectivity benchmark config, see filter_bench.py
+filter_collection_name = "union_pay_filter_test"
+filter_selectivities = [0.5, 0.1, 0.01, 0.001]
+filter_attributes = ["int", "varchar", "bool", "json"]
+filter_num_categories = 1000  # varchar labels, with Zipf frequencies
+filter_zipf_a = 1.1
+filter_bool_ratio = 0.5
+filter_seed = 0
+filter_ef = 100
+# built for the second pass, an index which fails to build is skipped
+filter_scalar_indexes = {
+    "int_attr": dict(index_type="STL_SORT"),
+    "str_attr": dict(index_type="INVERTED"),
+    "bool_attr": dict(index_type="INVERTED"),
+    # JSON path index, Milvus 2.5.11+
+    "meta": dict(index_type="INVERTED", params=dict(json_path='meta["score"]', json_cast_type="double")),
+}
+# performance falls off when recall drops by filter_recall_drop below the unfiltered
+# recall, or latency p99 grows past filter_latency_growth times the unfiltered p99
+filter_recall_drop = 0.05
+filter_latency_growth = 3.0
+filter_bench_file = "filter_bench.json"
@@ -0,0 +1,341 @@
+"""Filtered search benchmark, recall and latency against filter selectivity.
+
+    python filter_bench.py [-a int json] [--skip-insert]
+
+Inserts the train vectors into filter_collection_name together with scalar
+attributes drawn from fixed distributions (seeded by filter_seed):
+    int_attr   int64, uniform over [0, 1_000_000)
+    str_attr   varchar, one of filter_num_categories labels with Zipf frequencies
+    bool_attr  bool, true with probability filter_bool_ratio
+    meta       JSON, {"score": uniform over [0, 1), "tier": str_attr's label rank}
+
+For every attribute type and every target of filter_selectivities a predicate is
+derived from the generated values, e.g. `int_attr < 100000` or
+`str_attr in ["c0", "c7"]`; bool predicates below filter_bool_ratio are anded
+with an int range. The measured selectivity is reported next to the target.
+Exact filtered ground truth of every predicate is built in one pass over the
+train files with groundtruth.build_groundtruth.
+
+Every predicate is searched serially at filter_ef twice, without and then with
+filter_scalar_indexes. Each pass is appended to the results store as its own run,
+the table is written to filter_bench_file, and for every attribute type the
+largest selectivity where recall or latency falls off is logged.
+"""
+
+import argparse
+import json
+
+import numpy as np
+import pyarrow.parquet as pq
+from loguru import logger
+from pymilvus import CollectionSchema, DataType, FieldSchema
+
+from config import (
+    pk_field,
+    vector_field,
+    vector_index_name,
+    dim,
+    M,
+    efConstruction,
+    metric_type,
+    num_insert_batch,
+    insert_read_batch,
+    train_dir,
+    train_file_paths,
+    get_query_vectors,
+    k,
+    results_db,
+    filter_collection_name,
+    filter_selectivities,
+    filter_attributes,
+    filter_num_categories,
+    filter_zipf_a,
+    filter_bool_ratio,
+    filter_seed,
+    filter_ef,
+    filter_scalar_indexes,
+    filter_recall_drop,
+    filter_latency_growth,
+    filter_bench_file,
+)
+from utils import connect, server_version  # also puts the repo root on sys.path
+from milvus_backend import Collection, utility
+from local_milvus import eval_expr
+from groundtruth import build_groundtruth, iter_train_blocks
+from results_store import record_run
+from test import serial_search_test
+
+INT_RANGE = 1_000_000
+
+
+def generate_attributes(num_rows: int, seed: int = filter_seed) -> dict:
+    """scalar attributes of every row as compact numpy columns, row i is pk i + 1
+
+    str_attr is kept as label ranks and meta as its score, materialize_rows builds
+    the strings and dicts one insert batch at a time.
+    """
+    rng = np.random.default_rng(seed)
+    weights = 1.0 / np.arange(1, filter_num_categories + 1) ** filter_zipf_a
+    return dict(
+        int_attr=rng.integers(0, INT_RANGE, num_rows, dtype=np.int64),
+        str_attr=rng.choice(filter_num_categories, num_rows, p=weights / weights.sum()),
+        bool_attr=rng.random(num_rows) < filter_bool_ratio,
+        score=rng.random(num_rows),
+    )
+
+
+def materialize_rows(attrs: dict, rows: slice) -> dict:
+    """the field values of `rows` as inserted"""
+    labels = attrs["str_attr"][rows]
+    return dict(
+        int_attr=attrs["int_attr"][rows],
+        str_attr=[f"c{c}" for c in labels],
+        bool_attr=attrs["bool_attr"][rows],
+        meta=[{"score": float(s), "tier": int(c)} for s, c in zip(attrs["score"][rows], labels)],
+    )
+
+
+def int_threshold(values: np.ndarray, selectivity: float) -> int:
+    """smallest t with about `selectivity` of `values` below it"""
+    if len(values) == 0:
+        return 0
+    idx = min(int(round(selectivity * len(values))), len(values) - 1)
+    return int(np.partition(values, idx)[idx])
+
+
+def derive_predicates(attrs: dict, attribute: str, selectivity: float) -> tuple[str, np.ndarray]:
+    """expr of `attribute` type selecting about `selectivity` of the rows, and its row mask"""
+    if attribute == "int":
+        t = int_threshold(attrs["int_attr"], selectivity)
+        return f"int_attr < {t}", attrs["int_attr"] < t
+    if attribute == "varchar":
+        # most frequent labels first while they fit, the Zipf tail fills the rest
+        counts = np.bincount(attrs["str_attr"], minlength=filter_num_categories)
+        target, total, chosen = selectivity * len(attrs["str_attr"]), 0, []
+        for c in np.argsort(-counts, kind="stable"):
+            if counts[c] and total + counts[c] <= target:
+                chosen.append(int(c))
+                total += counts[c]
+        labels = ", ".join(f'"c{c}"' for c in sorted(chosen))
+        return f"str_attr in [{labels}]", np.isin(attrs["str_attr"], chosen)
+    if attribute == "bool":
+        if selectivity >= filter_bool_ratio:
+            return "bool_attr == true", attrs["bool_attr"].copy()
+        t = int_threshold(attrs["int_attr"][attrs["bool_attr"]], selectivity / filter_bool_ratio)
+        return f"bool_attr == true and int_attr < {t}", attrs["bool_attr"] & (attrs["int_attr"] < t)
+    if attribute == "json":
+        x = float(np.quantile(attrs["score"], selectivity))
+        return f'meta["score"] < {x!r}', attrs["score"] < x
+    raise ValueError(f"unknown filter attribute: {attribute}")
+
+
+def check_predicates(attrs: dict, predicates: list[dict], num_rows: int = 10_000):
+    """the row masks have to agree with the exprs sent to Milvus"""
+    rows = slice(0, min(num_rows, len(attrs["int_attr"])))
+    columns = materialize_rows(attrs, rows)
+    columns = {
+        name: np.asarray(values, dtype=object) if isinstance(values, list) else values
+        for name, values in columns.items()
+    }
+    for p in predicates:
+        mask = eval_expr(p["expr"], columns, rows.stop)
+        if not np.array_equal(mask, p["mask"][rows]):
+            raise ValueError(f"row mask of {p['expr']} does not match the expression")
+
+
+def create_filter_collection():
+    logger.info(f"create_collection - {filter_collection_name}")
+    if utility.has_collection(filter_collection_name):
+        utility.drop_collection(filter_collection_name)
+    fields = [
+        FieldSchema(pk_field, DataType.INT64, is_primary=True),
+        FieldSchema(vector_field, DataType.FLOAT_VECTOR, dim=dim),
+        FieldSchema("int_attr", DataType.INT64),
+        FieldSchema("str_attr", DataType.VARCHAR, max_length=16),
+        FieldSchema("bool_attr", DataType.BOOL),
+        FieldSchema("meta", DataType.JSON),
+    ]
+    col = Collection(name=filter_collection_name, schema=CollectionSchema(fields))
+    index_params = {
+        "metric_type": metric_type,
+        "index_type": "HNSW",
+        "params": {"M": M, "efConstruction": efConstruction},
+    }
+    col.create_index(vector_field, index_params, index_name=vector_index_name)
+    return col
+
+
+def insert_filter_data(attrs: dict):
+    col = create_filter_collection()
+    num_rows = 0
+    for pks, vectors in iter_train_blocks(insert_read_batch):
+        for i in range(0, len(pks), num_insert_batch):
+            batch_pks = pks[i : i + num_insert_batch]
+            rows = slice(batch_pks[0] - 1, batch_pks[-1])
+            values = materialize_rows(attrs, rows)
+            col.insert(
+                [
+                    batch_pks,
+                    vectors[i : i + num_insert_batch],
+                    values["int_attr"],
+                    values["str_attr"],
+                    values["bool_attr"],
+                    values["meta"],
+                ]
+            )
+        num_rows += len(pks)
+        logger.info(f"inserted {num_rows} rows into {filter_collection_name}")
+    col.flush()
+    utility.wait_for_index_building_complete(filter_collection_name)
+
+
+def set_scalar_indexes(enabled: bool):
+    """build or drop filter_scalar_indexes, then reload the collection"""
+    col = Collection(filter_collection_name)
+    col.release()
+    for field, index_params in filter_scalar_indexes.items():
+        index_name = f"{field}_idx"
+        try:
+            if enabled:
+                col.create_index(field, index_params, index_name=index_name)
+            elif col.has_index(index_name=index_name):
+                col.drop_index(index_name=index_name)
+        except Exception as e:
+            logger.warning(f"skip {'create' if enabled else 'drop'} index {index_name}, reason={e}")
+    if enabled:
+        utility.wait_for_index_building_complete(filter_collection_name)
+    col.load()
+
+
+def bench_pass(queries, predicates: list[dict], scalar_index: bool) -> list[dict]:
+    set_scalar_indexes(scalar_index)
+    rows = []
+    for p in predicates:
+        logger.info(f"filtered search, scalar_index={scalar_index}, expr: {p['expr'][:120]}")
+        recall, latency_p99, latency_avg, metrics = serial_search_test(
+            queries=queries,
+            gts=p["gts"],
+            expr=p["expr"],
+            ef=filter_ef,
+            k=k,
+            gt_distances=p["gt_distances"],
+            collection=filter_collection_name,
+        )
+        rows.append(
+            dict(
+                attribute=p["attribute"],
+                target=p["target"],
+                selectivity=p["selectivity"],
+                scalar_index=scalar_index,
+                expr=p["expr"],
+                ef=filter_ef,
+                recall=recall,
+                latency_p99=latency_p99,
+                latency_avg=latency_avg,
+                **metrics,
+            )
+        )
+
+    run_meta = dict(
+        server_version=server_version(),
+        index_type="HNSW",
+        index_params=dict(
+            M=M,
+            efConstruction=efConstruction,
+            scalar_indexes=filter_scalar_indexes if scalar_index else {},
+        ),
+        metric_type=metric_type,
+        dataset=f"{train_dir} (filter attributes, seed {filter_seed})",
+    )
+    record_run(results_db, run_meta, None, None, rows)
+    return rows
+
+
+def find_falloff(rows: list[dict], attributes: list[str]) -> list[dict]:
+    """largest selectivity per (attribute, scalar_index) which falls off the unfiltered run"""
+    falloffs = []
+    for scalar_index in (False, True):
+        base = next(r for r in rows if r["attribute"] is None and r["scalar_index"] == scalar_index)
+        for attribute in attributes:
+            cells = [r for r in rows if r["attribute"] == attribute and r["scalar_index"] == scalar_index]
+            fell = [
+                r
+                for r in cells
+                if r["recall"] < base["recall"] - filter_recall_drop
+                or r["latency_p99"] > base["latency_p99"] * filter_latency_growth
+            ]
+            falloff = max(fell, key=lambda r: r["selectivity"]) if fell else None
+            falloffs.append(
+                dict(
+                    attribute=attribute,
+                    scalar_index=scalar_index,
+                    selectivity=falloff["selectivity"] if falloff else None,
+                    recall=falloff["recall"] if falloff else None,
+                    latency_p99=falloff["latency_p99"] if falloff else None,
+                )
+            )
+            logger.info(
+                f"{attribute}, scalar_index={scalar_index}: "
+                + (
+                    f"falls off at selectivity {falloff['selectivity']}, recall {falloff['recall']}, "
+                    f"latency_p99 {falloff['latency_p99']}ms"
+                    if falloff
+                    else "no fall-off down to the smallest selectivity"
+                )
+            )
+    return falloffs
+
+
+def log_table(rows: list[dict]):
+    columns = ["attribute", "target", "selectivity", "scalar_index", "recall", "latency_p99", "latency_avg"]
+    cells = [[str(r[c]) for c in columns] for r in rows]
+    widths = [max(len(c), *(len(row[i]) for row in cells)) for i, c in enumerate(columns)]
+    lines = ["  ".join(c.ljust(w) for c, w in zip(columns, widths))]
+    lines += ["  ".join(v.ljust(w) for v, w in zip(row, widths)) for row in cells]
+    logger.info("filtered search by selectivity:\n" + "\n".join(lines))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="benchmark filtered search against filter selectivity")
+    parser.add_argument("-a", "--attributes", nargs="*", default=filter_attributes, choices=filter_attributes)
+    parser.add_argument("--skip-insert", action="store_true", help="reuse the inserted filter collection")
+    args = parser.parse_args()
+
+    connect()
+    num_rows = sum(pq.ParquetFile(f).metadata.num_rows for f in train_file_paths)
+    attrs = generate_attributes(num_rows)
+    if not args.skip_insert:
+        insert_filter_data(attrs)
+
+    predicates = [dict(attribute=None, target=1.0, expr="", mask=np.ones(num_rows, dtype=bool))]
+    for attribute in args.attributes:
+        for target in filter_selectivities:
+            expr, mask = derive_predicates(attrs, attribute, target)
+            predicates.append(dict(attribute=attribute, target=target, expr=expr, mask=mask))
+    check_predicates(attrs, predicates)
+    for p in predicates:
+        p["selectivity"] = round(float(p["mask"].mean()), 6)
+        logger.info(f"{p['attribute']} target {p['target']}: selectivity {p['selectivity']}")
+
+    queries = get_query_vectors()
+    results = build_groundtruth(
+        queries,
+        k=k,
+        exprs=[p["expr"] for p in predicates],
+        row_masks=[p.pop("mask") for p in predicates],
+    )
+    for p, (ids, distances) in zip(predicates, results):
+        p["gts"], p["gt_distances"] = ids, distances
+
+    rows = bench_pass(queries, predicates, scalar_index=False)
+    rows += bench_pass(queries, predicates, scalar_index=True)
+    queries.close()
+
+    log_table(rows)
+    falloffs = find_falloff(rows, args.attributes)
+    with open(filter_bench_file, "w") as f:
+        json.dump(dict(results=rows, falloff=falloffs), f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""Build exact ground truth for every expr of config.exprs.
+
+    python groundtruth.py -k 100 -w 8
+
+Streams the train parquet files in the order insert_test inserts them, so the pk
+of a row is 1 + its global row index, evaluates every expr on the pks as a mask
+and keeps a running exact top-k per query with blocked matrix multiplication.
+Memory is bounded by one block of train vectors plus, per worker, the scores of
+one query chunk against it.
+
+Writes `groudtruth_dir/groudtruth_files[i]` for exprs[i], one row per query:
+    id: query index, neighbors_id: top-k pks, distances: Milvus style distances
+Queries with fewer than k rows passing the filter are padded with -1 / nan.
+"""
+
+import argparse
+import concurrent.futures
+import time
+from pathlib import Path
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from loguru import logger
+
+from config import (
+    pk_field,
+    metric_type,
+    train_file_paths,
+    train_vector_col_name,
+    query_vectors_file,
+    get_query_vectors,
+    exprs,
+    groudtruth_dir,
+    groudtruth_col_name,
+    groudtruth_files,
+)
+from utils import iter_parquet_vectors  # also puts the repo root on sys.path
+from local_milvus import eval_expr
+
+
+def iter_train_blocks(block_size: int):
+    """yield (pks, float32 vectors) blocks of the train files, pks start at 1"""
+    cur_idx = 1
+    for file in train_file_paths:
+        for vectors in iter_parquet_vectors(file, train_vector_col_name, block_size):
+            yield np.arange(cur_idx, cur_idx + len(vectors), dtype=np.int64), vectors
+            cur_idx += len(vectors)
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+class TopK:
+    """running exact top-k of a chunk of queries, larger scores are closer"""
+
+    def __init__(self, nq: int, k: int):
+        self.k = k
+        self.scores = np.full((nq, k), -np.inf, dtype=np.float32)
+        self.ids = np.full((nq, k), -1, dtype=np.int64)
+
+    def update(self, scores: np.ndarray, ids: np.ndarray):
+        """scores: (nq, m) against the rows of `ids` (m,)"""
+        if scores.shape[1] > self.k:
+            top = np.argpartition(-scores, self.k - 1, axis=1)[:, : self.k]
+            scores = np.take_along_axis(scores, top, axis=1)
+            ids = ids[top]
+        else:
+            ids = np.broadcast_to(ids, scores.shape)
+        all_scores = np.concatenate([self.scores, scores], axis=1)
+        all_ids = np.concatenate([self.ids, ids], axis=1)
+        top = np.argpartition(-all_scores, self.k - 1, axis=1)[:, : self.k]
+        self.scores = np.take_along_axis(all_scores, top, axis=1)
+        self.ids = np.take_along_axis(all_ids, top, axis=1)
+
+    def result(self) -> tuple[np.ndarray, np.ndarray]:
+        """ids and scores sorted from the closest"""
+        order = np.argsort(-self.scores, axis=1, kind="stable")
+        ids = np.take_along_axis(self.ids, order, axis=1)
+        scores = np.take_along_axis(self.scores, order, axis=1)
+        return np.where(np.isfinite(scores), ids, -1), scores
+
+
+def build_groundtruth(
+    queries: np.ndarray,
+    k: int = 100,
+    metric: str = metric_type,
+    block_size: int = 65536,
+    query_chunk: int = 1024,
+    workers: int = 8,
+    exprs: list[str] = exprs,
+    row_masks: list[np.ndarray] = None,
+) -> list[tuple[np.ndarray, np.ndarray]]:
+    """exact top-k of every expr of `exprs`
+
+    row_masks: precomputed masks of the exprs over all rows, row i is pk i + 1,
+        for exprs on fields other than the pk
+    return: [(ids (nq, k), distances (nq, k))] in the order of exprs
+    """
+    queries = np.asarray(queries, dtype=np.float32)
+    if metric == "COSINE":
+        queries = normalize(queries)
+    chunks = [slice(s, min(s + query_chunk, len(queries))) for s in range(0, len(queries), query_chunk)]
+    topks = [[TopK(c.stop - c.start, k) for c in chunks] for _ in exprs]
+
+    def process(chunk_idx: int, vectors: np.ndarray, sq_norms: np.ndarray, masks: list, pks: np.ndarray):
+        scores = queries[chunks[chunk_idx]] @ vectors.T
+        if metric == "L2":
+            # -|q-v|^2 up to |q|^2, which does not change the order
+            scores = 2 * scores - sq_norms[None, :]
+        for topk, mask in zip(topks, masks):
+            if mask.all():
+                topk[chunk_idx].update(scores, pks)
+            elif mask.any():
+                topk[chunk_idx].update(scores[:, mask], pks[mask])
+
+    start_time = time.perf_counter()
+    rows = 0
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        for pks, vectors in iter_train_blocks(block_size):
+            if metric == "COSINE":
+                vectors = normalize(vectors)
+            sq_norms = (vectors * vectors).sum(axis=1) if metric == "L2" else None
+            if row_masks is None:
+                masks = [eval_expr(expr, {pk_field: pks}, len(pks)) for expr in exprs]
+            else:
+                masks = [row_mask[pks - 1] for row_mask in row_masks]
+            # numpy releases the GIL in matmul and partition, so threads scale
+            list(executor.map(lambda i: process(i, vectors, sq_norms, masks, pks), range(len(chunks))))
+            rows += len(pks)
+            cost = time.perf_counter() - start_time
+            logger.info(f"processed {rows} rows, {rows / cost:.0f} rows/s")
+
+    results = []
+    q_sq_norms = (queries * queries).sum(axis=1)
+    for expr_topks in topks:
+        ids = np.concatenate([t.result()[0] for t in expr_topks])
+        scores = np.concatenate([t.result()[1] for t in expr_topks])
+        if metric == "L2":
+            distances = q_sq_norms[:, None] - scores
+        else:
+            distances = scores
+        distances = np.where(ids >= 0, distances, np.nan).astype(np.float32)
+        results.append((ids, distances))
+    return results
+
+
+def write_groundtruth(path: Path, ids: np.ndarray, distances: np.ndarray):
+    nq, k = ids.shape
+    table = pa.table(
+        {
+            "id": pa.array(np.arange(nq, dtype=np.int64)),
+            groudtruth_col_name: pa.FixedSizeListArray.from_arrays(pa.array(ids.ravel()), k).cast(
+                pa.list_(pa.int64())
+            ),
+            "distances": pa.FixedSizeListArray.from_arrays(pa.array(distances.ravel()), k).cast(
+                pa.list_(pa.float32())
+            ),
+        }
+    )
+    path.parent.mkdir(parents=True, exist_ok=True)
+    pq.write_table(table, path)
+    logger.info(f"wrote ground truth {path}, nq={nq}, k={k}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="build exact ground truth of config.exprs")
+    parser.add_argument("-k", type=int, default=100, help="neighbors per query")
+    parser.add_argument("-m", "--metric", default=metric_type, choices=["COSINE", "L2", "IP"])
+    parser.add_argument("-b", "--block-size", type=int, default=65536, help="train rows per block")
+    parser.add_argument("-q", "--query-chunk", type=int, default=1024, help="queries per worker task")
+    parser.add_argument("-w", "--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    if not query_vectors_file:
+        logger.warning("query_vectors_file is not set, building ground truth of the seeded random queries")
+    queries = get_query_vectors()
+    results = build_groundtruth(
+        queries,
+        k=args.k,
+        metric=args.metric,
+        block_size=args.block_size,
+        query_chunk=args.query_chunk,
+        workers=args.workers,
+    )
+    for (ids, distances), gt_file in zip(results, groudtruth_files):
+        write_groundtruth(Path(groudtruth_dir, gt_file), ids, distances)
+    queries.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+"""Index type matrix benchmark over config.index_matrix.
+
+    python index_bench.py [-t HNSW IVF_PQ]
+
+Runs on the collection inserted by test.py. For every index type and build params
+it rebuilds the vector index, loads it, then for every value of the search knob
+(ef / nprobe / search_list) runs the serial pass, for recall, and a closed loop
+with index_bench_conc workers, for qps. Build time, load time and load_memory_mb
+are recorded per build. load_memory_mb is the mem_size of the loaded query
+segments, raw data and index together; it is not the index size, which the SDK
+does not expose.
+
+Each build is appended to the results store as its own run, so builds can be
+compared and plotted with results_store.py, and the whole matrix is written to
+index_bench_file as one recall-vs-qps table. The HNSW index of test.py is
+restored at the end, also when the matrix fails.
+"""
+
+import argparse
+import json
+
+from loguru import logger
+
+from config import (
+    exprs,
+    get_groundtruth,
+    get_groundtruth_distances,
+    get_query_vectors,
+    index_matrix,
+    index_bench_conc,
+    index_bench_file,
+    conc_duration,
+    k,
+    metric_type,
+    results_db,
+    train_dir,
+)
+from utils import (
+    SearchWorkerPool,
+    build_index,
+    connect,
+    create_index,
+    drop_index,
+    get_collection,
+    load_index,
+    load_stats,
+    optimize,
+    release_collection,
+    server_version,
+)
+from results_store import record_run
+from test import serial_search_test
+
+
+def bench_build(
+    pool: SearchWorkerPool,
+    queries,
+    gts: list,
+    gt_distances: list,
+    index_type: str,
+    build_params: dict,
+    knob: str,
+    values: list,
+) -> list[dict]:
+    """one build of one index type, return a row per knob value"""
+    build_time = build_index(index_type, build_params)
+    load_time, load_memory_mb = load_stats()
+    logger.info(
+        f"{index_type} {build_params}: build {build_time}s, load {load_time}s, "
+        f"loaded memory {load_memory_mb}MB"
+    )
+
+    rows, search_results = [], []
+    expr = exprs[0]
+    for value in values:
+        params = {knob: value} if knob else {}
+        recall, latency_p99, latency_avg, metrics = serial_search_test(
+            queries=queries, gts=gts, expr=expr, ef=params, k=k, gt_distances=gt_distances
+        )
+        conc_res = pool.conc_search(
+            conc=index_bench_conc, duration=conc_duration, ef=params, k=k, expr=expr
+        )
+        rows.append(
+            dict(
+                index_type=index_type,
+                build_params=build_params,
+                build_time=build_time,
+                load_time=load_time,
+                load_memory_mb=load_memory_mb,
+                knob=knob,
+                value=value,
+                recall=recall,
+                latency_p99=latency_p99,
+                latency_avg=latency_avg,
+                qps=conc_res["qps"] if conc_res else None,
+                conc_latency_p99=conc_res["latency_p99"] if conc_res else None,
+            )
+        )
+        search_results.append(
+            dict(
+                expr=expr,
+                ef=value,
+                recall=recall,
+                latency_p99=latency_p99,
+                latency_avg=latency_avg,
+                **metrics,
+                qps=conc_res["qps"] if conc_res else None,
+                conc=[conc_res] if conc_res else [],
+            )
+        )
+
+    run_meta = dict(
+        server_version=server_version(),
+        index_type=index_type,
+        index_params=dict(build_params, search_knob=knob),
+        metric_type=metric_type,
+        dataset=train_dir,
+        build_time=build_time,
+        load_time=load_time,
+        load_memory_mb=load_memory_mb,
+    )
+    record_run(results_db, run_meta, None, None, search_results)
+    return rows
+
+
+def restore_index():
+    """put back the HNSW index test.py searches with"""
+    release_collection()
+    if get_collection().has_index():
+        drop_index()
+    create_index()
+    optimize()
+    load_index()
+
+
+def log_table(rows: list[dict]):
+    columns = [
+        "index_type", "build_params", "knob", "value", "recall", "qps",
+        "latency_p99", "build_time", "load_time", "load_memory_mb",
+    ]
+    cells = [[str(r[c]) for c in columns] for r in rows]
+    widths = [max(len(c), *(len(row[i]) for row in cells)) for i, c in enumerate(columns)]
+    lines = ["  ".join(c.ljust(w) for c, w in zip(columns, widths))]
+    lines += ["  ".join(v.ljust(w) for v, w in zip(row, widths)) for row in cells]
+    logger.info("index matrix, sorted by recall:\n" + "\n".join(lines))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="benchmark every index type of config.index_matrix")
+    parser.add_argument("-t", "--types", nargs="*", help="only these index types")
+    args = parser.parse_args()
+
+    connect()
+    queries = get_query_vectors()
+    gts = get_groundtruth(exprs[0])
+    gt_distances = get_groundtruth_distances(exprs[0])
+
+    rows = []
+    try:
+        with SearchWorkerPool(queries, index_bench_conc) as pool:
+            for entry in index_matrix:
+                if args.types and entry["index_type"] not in args.types:
+                    continue
+                for build_params in entry["build"]:
+                    try:
+                        rows += bench_build(
+                            pool,
+                            queries,
+                            gts,
+                            gt_distances,
+                            entry["index_type"],
+                            build_params,
+                            entry["knob"],
+                            entry["values"],
+                        )
+                    except Exception as e:
+                        logger.warning(f"skip {entry['index_type']} {build_params}, reason={e}")
+    finally:
+        queries.close()
+        restore_index()
+
+    rows.sort(key=lambda r: (r["recall"], r["qps"] or 0))
+    log_table(rows)
+    with open(index_bench_file, "w") as f:
+        json.dump(rows, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,382 @@
+"""Append-only SQLite store of test results, and run comparison.
+
+    python results_store.py list
+    python results_store.py compare <base run id> <new run id> [-a 0.05] [-p pareto.png]
+
+Every run of test.py appends one `runs` row (git commit, server version, index
+config, dataset) and one `results` row per measured cell:
+    kind=serial    (expr, ef, nq), recall and latency of the serial pass
+    kind=conc      (expr, ef, nq, conc), closed loop qps and latency
+    kind=open_loop (expr, ef, offered qps), open loop latency and error rate
+    kind=nq_sweep  (ef, nq, conc)
+Per-second qps and p99 of the concurrent cells are kept as samples, so compare
+can tell a significant change from noise; it exits 1 on significant regressions
+only, changes of unsampled cells are logged for information.
+"""
+
+import argparse
+import json
+import math
+import sqlite3
+import subprocess
+import time
+import uuid
+from contextlib import closing
+from pathlib import Path
+
+from loguru import logger
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    created_at TEXT,
+    git_commit TEXT,
+    server_version TEXT,
+    index_type TEXT,
+    index_params TEXT,
+    metric_type TEXT,
+    dataset TEXT,
+    insert_time REAL,
+    optimize_time REAL,
+    build_time REAL,
+    load_time REAL,
+    load_memory_mb REAL
+);
+CREATE TABLE IF NOT EXISTS results (
+    run_id TEXT REFERENCES runs(run_id),
+    kind TEXT,
+    expr TEXT,
+    ef INTEGER,
+    nq INTEGER,
+    conc INTEGER,
+    offered_qps REAL,
+    qps REAL,
+    recall REAL,
+    latency_avg REAL,
+    latency_p50 REAL,
+    latency_p95 REAL,
+    latency_p99 REAL,
+    latency_max REAL,
+    error_rate REAL,
+    metrics TEXT,
+    samples TEXT
+);
+"""
+
+RESULT_COLUMNS = [
+    "kind",
+    "expr",
+    "ef",
+    "nq",
+    "conc",
+    "offered_qps",
+    "qps",
+    "recall",
+    "latency_avg",
+    "latency_p50",
+    "latency_p95",
+    "latency_p99",
+    "latency_max",
+    "error_rate",
+    "metrics",
+    "samples",
+]
+KEY_COLUMNS = ["kind", "expr", "ef", "nq", "conc", "offered_qps"]
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=Path(__file__).parent,
+        ).stdout.strip()
+    except Exception:
+        return ""
+
+
+RUN_STATS_COLUMNS = ["build_time", "load_time", "load_memory_mb"]
+
+
+def connect_db(db_path: str) -> sqlite3.Connection:
+    """open the store, the caller closes it: `with conn` only commits or rolls back"""
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    conn.executescript(SCHEMA)
+    # stores created before the index stats columns existed
+    columns = {row["name"] for row in conn.execute("PRAGMA table_info(runs)")}
+    for column in RUN_STATS_COLUMNS:
+        if column not in columns:
+            conn.execute(f"ALTER TABLE runs ADD COLUMN {column} REAL")
+    return conn
+
+
+def _timeline_samples(res: dict) -> dict:
+    timeline = res.get("timeline") or []
+    return dict(
+        qps=[t["requests"] * res.get("nq", 1) for t in timeline],
+        latency_p99=[t["latency_p99"] for t in timeline if t["requests"]],
+    )
+
+
+def result_rows(search_results: list[dict], nq_results: list[dict] = None) -> list[dict]:
+    """flatten the results of search_test and nq_sweep_test to one row per cell"""
+    rows = []
+    for res in search_results:
+        expr, ef, nq = res["expr"], res["ef"], res.get("nq", 1)
+        scalars = {"expr", "ef", "nq", "recall", "latency_p99", "latency_avg", "qps", "conc", "knee_qps", "open_loop"}
+        rows.append(
+            dict(
+                kind="serial",
+                expr=expr,
+                ef=ef,
+                nq=nq,
+                conc=1,
+                recall=res["recall"],
+                latency_avg=res["latency_avg"],
+                latency_p99=res["latency_p99"],
+                metrics=json.dumps({k: v for k, v in res.items() if k not in scalars}),
+            )
+        )
+        for conc_res in res.get("conc") or []:
+            rows.append(
+                dict(
+                    kind="conc",
+                    expr=expr,
+                    ef=ef,
+                    nq=conc_res["nq"],
+                    conc=conc_res["conc"],
+                    qps=conc_res["qps"],
+                    recall=res["recall"],
+                    latency_p50=conc_res["latency_p50"],
+                    latency_p95=conc_res["latency_p95"],
+                    latency_p99=conc_res["latency_p99"],
+                    latency_max=conc_res["latency_max"],
+                    samples=json.dumps(_timeline_samples(conc_res)),
+                )
+            )
+        for step in res.get("open_loop") or []:
+            rows.append(
+                dict(
+                    kind="open_loop",
+                    expr=expr,
+                    ef=ef,
+                    nq=1,
+                    offered_qps=step["offered_qps"],
+                    qps=step["achieved_qps"],
+                    latency_p50=step["latency_p50"],
+                    latency_p99=step["latency_p99"],
+                    error_rate=step["error_rate"],
+                    metrics=json.dumps(step),
+                )
+            )
+    for res in nq_results or []:
+        rows.append(
+            dict(
+                kind="nq_sweep",
+                expr="",
+                ef=res["ef"],
+                nq=res["nq"],
+                conc=res["conc"],
+                qps=res["qps"],
+                recall=res["recall"],
+                latency_avg=res["latency_avg"],
+                latency_p99=res["latency_p99"],
+                metrics=json.dumps(res),
+            )
+        )
+    return rows
+
+
+def record_run(
+    db_path: str,
+    run_meta: dict,
+    insert_time: float,
+    optimize_time: float,
+    search_results: list[dict],
+    nq_results: list[dict] = None,
+) -> str:
+    """append a run and its results, return the run id
+
+    run_meta: server_version, index_type, index_params (dict), metric_type, dataset,
+        optionally build_time, load_time, load_memory_mb
+    """
+    run_id = time.strftime("%Y%m%d-%H%M%S-") + uuid.uuid4().hex[:6]
+    with closing(connect_db(db_path)) as conn, conn:
+        conn.execute(
+            "INSERT INTO runs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                run_id,
+                time.strftime("%Y-%m-%d %H:%M:%S"),
+                git_commit(),
+                run_meta.get("server_version", ""),
+                run_meta.get("index_type", ""),
+                json.dumps(run_meta.get("index_params", {})),
+                run_meta.get("metric_type", ""),
+                run_meta.get("dataset", ""),
+                insert_time,
+                optimize_time,
+                *[run_meta.get(c) for c in RUN_STATS_COLUMNS],
+            ),
+        )
+        rows = result_rows(search_results, nq_results)
+        conn.executemany(
+            f"INSERT INTO results VALUES (?, {', '.join('?' * len(RESULT_COLUMNS))})",
+            [(run_id, *[row.get(c) for c in RESULT_COLUMNS]) for row in rows],
+        )
+    logger.info(f"recorded run {run_id} with {len(rows)} results in {db_path}")
+    return run_id
+
+
+def load_results(conn: sqlite3.Connection, run_id: str) -> dict:
+    """{cell key: row} of a run"""
+    rows = conn.execute("SELECT * FROM results WHERE run_id = ?", (run_id,)).fetchall()
+    if not rows:
+        raise ValueError(f"run {run_id} not found")
+    return {tuple(row[c] for c in KEY_COLUMNS): dict(row) for row in rows}
+
+
+def welch_p_value(a: list[float], b: list[float]) -> float:
+    """two sided p-value of Welch's t-test, normal approximation of the t distribution"""
+    if len(a) < 2 or len(b) < 2:
+        return float("nan")
+    mean_a, mean_b = sum(a) / len(a), sum(b) / len(b)
+    var_a = sum((x - mean_a) ** 2 for x in a) / (len(a) - 1)
+    var_b = sum((x - mean_b) ** 2 for x in b) / (len(b) - 1)
+    se = math.sqrt(var_a / len(a) + var_b / len(b))
+    if se == 0:
+        return 0.0 if mean_a != mean_b else 1.0
+    t = abs(mean_a - mean_b) / se
+    return math.erfc(t / math.sqrt(2))
+
+
+def compare_runs(
+    db_path: str,
+    base_run: str,
+    new_run: str,
+    alpha: float = 0.05,
+    min_change: float = 0.02,
+    recall_tolerance: float = 0.005,
+) -> list[dict]:
+    """changes of `new_run` against `base_run`, cell by cell
+
+    qps and latency need a relative change over `min_change` which is significant
+    at `alpha` on the per-second samples. Cells without samples (serial, open loop,
+    nq sweep) cannot be tested, their changes over `min_change` are reported with
+    significant=False, for information only. Recall needs a drop over
+    `recall_tolerance`, the queries being the same in both runs.
+    """
+    with closing(connect_db(db_path)) as conn, conn:
+        base, new = load_results(conn, base_run), load_results(conn, new_run)
+
+    regressions = []
+    for key in sorted(base.keys() & new.keys(), key=str):
+        b, n = base[key], new[key]
+        b_samples = json.loads(b["samples"]) if b["samples"] else {}
+        n_samples = json.loads(n["samples"]) if n["samples"] else {}
+        checks = [("qps", -1), ("latency_p99", 1)]
+        for metric, worse in checks:
+            if b[metric] is None or n[metric] is None or not b[metric]:
+                continue
+            change = (n[metric] - b[metric]) / b[metric]
+            if change * worse <= min_change:
+                continue
+            p = welch_p_value(b_samples.get(metric, []), n_samples.get(metric, []))
+            if math.isnan(p) or p < alpha:
+                regressions.append(
+                    dict(zip(KEY_COLUMNS, key), metric=metric, base=b[metric], new=n[metric],
+                         change=round(change, 4), p_value=None if math.isnan(p) else round(p, 6),
+                         significant=not math.isnan(p))
+                )
+        # conc cells repeat the recall of their serial cell
+        if (
+            b["kind"] != "conc"
+            and b["recall"] is not None
+            and n["recall"] is not None
+            and b["recall"] - n["recall"] > recall_tolerance
+        ):
+            regressions.append(
+                dict(zip(KEY_COLUMNS, key), metric="recall", base=b["recall"], new=n["recall"],
+                     change=round(n["recall"] - b["recall"], 4), p_value=None, significant=True)
+            )
+    return regressions
+
+
+def pareto_frontier(points: list[tuple[float, float]]) -> list[tuple[float, float]]:
+    """(recall, qps) points no other point beats on both, by increasing recall"""
+    frontier = []
+    for recall, qps in sorted(points, key=lambda p: (-p[0], -p[1])):
+        if not frontier or qps > frontier[-1][1]:
+            frontier.append((recall, qps))
+    return frontier[::-1]
+
+
+def plot_pareto(db_path: str, run_ids: list[str], output: str):
+    """recall vs max qps over conc, one frontier per (run, expr), needs matplotlib"""
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    with closing(connect_db(db_path)) as conn, conn:
+        exprs = sorted({r["expr"] for r in conn.execute("SELECT DISTINCT expr FROM results WHERE kind = 'conc'")})
+        fig, axes = plt.subplots(1, len(exprs), figsize=(6 * len(exprs), 5), squeeze=False)
+        for ax, expr in zip(axes[0], exprs):
+            for run_id in run_ids:
+                points = conn.execute(
+                    "SELECT recall, MAX(qps) FROM results WHERE run_id = ? AND kind = 'conc' AND expr = ? "
+                    "GROUP BY ef, nq",
+                    (run_id, expr),
+                ).fetchall()
+                frontier = pareto_frontier([(r, q) for r, q in points if r is not None and q is not None])
+                if frontier:
+                    ax.plot(*zip(*frontier), marker="o", label=run_id)
+            ax.set_title(f"expr='{expr}'")
+            ax.set_xlabel("recall")
+            ax.set_ylabel("qps")
+            ax.legend()
+        fig.tight_layout()
+        fig.savefig(output)
+    logger.info(f"pareto frontiers saved to {output}")
+
+
+def main():
+    from config import results_db
+
+    parser = argparse.ArgumentParser(description="list and compare recorded test runs")
+    parser.add_argument("-d", "--db", default=results_db)
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list")
+    compare = sub.add_parser("compare")
+    compare.add_argument("base")
+    compare.add_argument("new")
+    compare.add_argument("-a", "--alpha", type=float, default=0.05)
+    compare.add_argument("-m", "--min-change", type=float, default=0.02)
+    compare.add_argument("-r", "--recall-tolerance", type=float, default=0.005)
+    compare.add_argument("-p", "--plot", help="save recall vs qps pareto frontiers to this file")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        with closing(connect_db(args.db)) as conn, conn:
+            for row in conn.execute("SELECT * FROM runs ORDER BY created_at"):
+                print(dict(row))
+        return
+
+    changes = compare_runs(args.db, args.base, args.new, args.alpha, args.min_change, args.recall_tolerance)
+    regressions = [c for c in changes if c["significant"]]
+    for c in changes:
+        if c["significant"]:
+            logger.warning(f"regression: {c}")
+        else:
+            logger.info(f"change without samples, not tested: {c}")
+    logger.info(f"{len(regressions)} regressions of {args.new} against {args.base}")
+    if args.plot:
+        plot_pareto(args.db, [args.base, args.new], args.plot)
+    if regressions:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
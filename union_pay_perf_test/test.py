@@ -4,30 +4,56 @@ import numpy as np
 import polars as pl
 from tqdm import tqdm
 from config import (
+    collection_name,
     get_groundtruth,
+    get_groundtruth_distances,
     get_query_vectors,
     train_file_paths,
     train_vector_col_name,
+    insert_read_batch,
     exprs,
     ef_list,
     k,
+    recall_ks,
+    metric_type,
     conc_list,
     conc_duration,
+    nq,
+    nq_sweep,
+    nq_list,
+    nq_sweep_ef,
+    nq_sweep_conc,
+    open_loop_ef_list,
+    open_loop_qps_list,
+    open_loop_arrival,
+    open_loop_workers,
+    open_loop_max_inflight,
+    open_loop_duration,
     results_file,
+    results_db,
+    train_dir,
+    M,
+    efConstruction,
 )
 from utils import (
-    compute_recall,
-    conc_search,
+    QueryStore,
+    SearchWorkerPool,
     connect,
     create_collection,
     create_index,
     drop_collection_if_existed,
+    find_saturation_knee,
     get_collection,
     insert_data,
+    iter_parquet_vectors,
     load_index,
     optimize,
-    search,
+    peak_rss_mb,
+    recall_metrics,
+    search_batch,
+    server_version,
 )
+from results_store import record_run
 import time
 
 
@@ -44,11 +70,18 @@ def insert_test() -> float:
         logger.info(
             f"[{i+1}/{len(train_file_paths)}] read and insert embeddings from {file}"
         )
-        df = pl.read_parquet(file)
-        embs: list[list[float]] = df[train_vector_col_name].to_list()
-        cur_idx = insert_data(embs, cur_idx)
+        file_start, file_idx = time.perf_counter(), cur_idx
+        for embs in tqdm(iter_parquet_vectors(file, train_vector_col_name, insert_read_batch)):
+            cur_idx = insert_data(embs, cur_idx)
+        file_cost = time.perf_counter() - file_start
+        logger.info(
+            f"inserted {cur_idx - file_idx} rows from {file}, "
+            f"{(cur_idx - file_idx) / file_cost:.0f} rows/s, peak rss {peak_rss_mb()}MB"
+        )
     cost = round(time.perf_counter() - start_time, 4)
-    logger.info(f"insert finished. cost {cost}s")
+    logger.info(
+        f"insert finished. cost {cost}s, {(cur_idx - 1) / cost:.0f} rows/s, peak rss {peak_rss_mb()}MB"
+    )
     return cost
 
 
@@ -61,93 +94,237 @@ def optimize_test() -> float:
 
 
 def serial_search_test(
-    queries: list[list[float]], gts: list[list[int]], expr: str, ef: int, k: int
-) -> tuple[float, float, float]:
+    queries: QueryStore,
+    gts: np.ndarray,
+    expr: str,
+    ef: int,
+    k: int,
+    nq: int = 1,
+    gt_distances: np.ndarray = None,
+    collection: str = collection_name,
+) -> tuple[float, float, float, dict]:
     """
-    return: recall, latency_p99, latency_avg
+    nq: queries per request, the last request may be smaller
+    collection: the collection searched, filter_bench.py has its own
+    return: recall, latency_p99, latency_avg of the requests, metrics
+
+    metrics: recall@k and ndcg@k of every k of recall_ks (tie_recall@k as well
+    with gt_distances), latency_per_query_avg
     """
     connect()
-    col = get_collection()
+    col = get_collection(collection)
 
-    logger.info("start serial search test")
+    logger.info(f"start serial search test, nq={nq}")
     latencies = []
-    recalls = []
-    for i, q in tqdm(enumerate(queries), total=len(queries)):
+    query_latencies = []
+    ids = np.full((len(queries), k), -1, dtype=np.int64)
+    distances = np.full((len(queries), k), np.nan, dtype=np.float32)
+    for start in tqdm(range(0, len(queries), nq), total=-(-len(queries) // nq)):
+        batch = queries[start : start + nq]
         start_time = time.perf_counter()
-        ids = search(col, q, ef, k, expr)
-        latencies.append((time.perf_counter() - start_time) * 1000)
-        recall = compute_recall(ids[:k], gts[i][:k])
-        recalls.append(recall)
+        batch_ids, batch_distances = search_batch(
+            col, batch, ef, k, expr, with_distances=True
+        )
+        latency = (time.perf_counter() - start_time) * 1000
+        latencies.append(latency)
+        query_latencies.append(latency / len(batch))
+        ids[start : start + len(batch)] = batch_ids
+        distances[start : start + len(batch)] = batch_distances
 
-    recall = round(np.mean(recalls), 4)
+    # recall in bulk, out of the timed loop
+    metrics = recall_metrics(
+        ids,
+        np.asarray(gts)[:, :k],
+        [rk for rk in recall_ks if rk <= k],
+        distances=distances,
+        gt_distances=None if gt_distances is None else np.asarray(gt_distances)[:, :k],
+        larger_is_closer=metric_type in ("IP", "COSINE"),
+    )
+    recall = metrics[f"recall@{k}"]
     latency_p99 = round(np.percentile(latencies, 99), 4)
     latency_avg = round(np.mean(latencies), 4)
+    metrics["latency_per_query_avg"] = round(np.mean(query_latencies), 4)
 
     logger.info(
-        f"finish serial search test. recall={recall}, latency_p99={latency_p99}ms, latency_avg={latency_avg}ms"
+        f"finish serial search test. recall={recall}, latency_p99={latency_p99}ms, latency_avg={latency_avg}ms, "
+        f"{metrics}"
     )
-    return recall, latency_p99, latency_avg
+    return recall, latency_p99, latency_avg, metrics
 
 
-def conc_search_test(queries: list[list[float]], expr: str, ef: int, k: int):
+def conc_search_test(
+    pool: SearchWorkerPool, expr: str, ef: int, k: int
+) -> tuple[float, list[dict]]:
+    """
+    return: max qps, results of every concurrency level
+    """
     max_conc_qps = 0
+    conc_results = []
     for conc in conc_list:
-        conc_qps = conc_search(
+        conc_res = pool.conc_search(
             conc=conc,
-            queries=queries,
-            conc_duration=conc_duration,
+            duration=conc_duration,
             ef=ef,
             k=k,
             expr=expr,
+            nq=nq,
         )
-        max_conc_qps = max(max_conc_qps, conc_qps)
-    return max_conc_qps
+        if conc_res is None:
+            continue
+        conc_results.append(conc_res)
+        max_conc_qps = max(max_conc_qps, conc_res["qps"])
+    return max_conc_qps, conc_results
 
 
-def search_test():
-    logger.info("read query vectors")
-    queries = get_query_vectors()
+def open_loop_search_test(
+    pool: SearchWorkerPool, expr: str, ef: int, k: int
+) -> tuple[list[dict], float]:
+    """
+    return: results of every offered qps step, saturation knee qps
+    """
+    steps = []
+    for qps in open_loop_qps_list:
+        steps.append(
+            pool.open_loop_search(
+                qps=qps,
+                workers=open_loop_workers,
+                duration=open_loop_duration,
+                ef=ef,
+                k=k,
+                expr=expr,
+                arrival=open_loop_arrival,
+                max_inflight=open_loop_max_inflight,
+            )
+        )
+        if find_saturation_knee(steps) < qps:
+            logger.info(f"saturated at offered qps={qps}, stop the sweep")
+            break
+    knee_qps = find_saturation_knee(steps)
+    logger.info(f"open loop saturation knee: {knee_qps} qps")
+    return steps, knee_qps
 
+
+def search_test(queries: QueryStore, pool: SearchWorkerPool):
     search_results = []
     for expr in exprs:
         logger.info(f"read groundtruth for expr: {expr}")
         gts = get_groundtruth(expr)
+        gt_distances = get_groundtruth_distances(expr)
 
         for ef in ef_list:
             logger.info(f"search test with expr='{expr}', ef={ef}")
-            max_conc_qps = conc_search_test(queries=queries, expr=expr, ef=ef, k=k)
-            recall, latency_p99, latency_avg = serial_search_test(
-                queries=queries, gts=gts, expr=expr, ef=ef, k=k
+            max_conc_qps, conc_results = conc_search_test(
+                pool=pool, expr=expr, ef=ef, k=k
+            )
+            open_loop_steps, knee_qps = [], None
+            if ef in open_loop_ef_list:
+                open_loop_steps, knee_qps = open_loop_search_test(
+                    pool=pool, expr=expr, ef=ef, k=k
+                )
+            recall, latency_p99, latency_avg, metrics = serial_search_test(
+                queries=queries,
+                gts=gts,
+                expr=expr,
+                ef=ef,
+                k=k,
+                nq=nq,
+                gt_distances=gt_distances,
             )
             search_results.append(
                 dict(
                     expr=expr,
                     ef=ef,
+                    nq=nq,
                     recall=recall,
                     latency_p99=latency_p99,
                     latency_avg=latency_avg,
+                    **metrics,
                     qps=max_conc_qps,
+                    conc=conc_results,
+                    knee_qps=knee_qps,
+                    open_loop=open_loop_steps,
                 )
             )
     return search_results
 
 
-def save_results(insert_time: float, optimize_time: float, search_results: list[dict]):
+def nq_sweep_test(queries: QueryStore, pool: SearchWorkerPool) -> list[dict]:
+    """serial and concurrent search with every nq of nq_list, without filter.
+
+    qps counts queries, so the most efficient batch size is the one with the
+    highest qps at an acceptable latency.
+    """
+    expr = exprs[0]
+    gts = get_groundtruth(expr)
+
+    nq_results = []
+    for batch_nq in nq_list:
+        logger.info(f"nq sweep with nq={batch_nq}, ef={nq_sweep_ef}")
+        recall, latency_p99, latency_avg, metrics = serial_search_test(
+            queries=queries, gts=gts, expr=expr, ef=nq_sweep_ef, k=k, nq=batch_nq
+        )
+        conc_res = pool.conc_search(
+            conc=nq_sweep_conc,
+            duration=conc_duration,
+            ef=nq_sweep_ef,
+            k=k,
+            expr=expr,
+            nq=batch_nq,
+        )
+        nq_results.append(
+            dict(
+                nq=batch_nq,
+                ef=nq_sweep_ef,
+                recall=recall,
+                latency_p99=latency_p99,
+                latency_avg=latency_avg,
+                latency_per_query_avg=metrics["latency_per_query_avg"],
+                conc=nq_sweep_conc,
+                qps=conc_res["qps"] if conc_res else None,
+                conc_latency_p99=conc_res["latency_p99"] if conc_res else None,
+            )
+        )
+    best = max(nq_results, key=lambda r: r["qps"] or 0)
+    logger.info(f"most efficient batch size: nq={best['nq']}, qps={best['qps']}")
+    return nq_results
+
+
+def save_results(
+    insert_time: float,
+    optimize_time: float,
+    search_results: list[dict],
+    nq_results: list[dict] = None,
+):
     logger.info("====> all test results:")
     logger.info(f"insert cost {insert_time}")
     logger.info(f"optimize cost {optimize_time}")
     for search_res in search_results:
         logger.info(search_res)
+    for nq_res in nq_results or []:
+        logger.info(nq_res)
     with open(results_file, "w") as f:
         json.dump(
             dict(
                 insert_time=insert_time,
                 optimize_time=optimize_time,
-                search_res=search_res,
+                search_res=search_results,
+                nq_res=nq_results,
             ),
             f,
         )
 
+    run_meta = dict(
+        server_version=server_version(),
+        index_type="HNSW",
+        index_params=dict(M=M, efConstruction=efConstruction),
+        metric_type=metric_type,
+        dataset=f"{train_dir} ({len(train_file_paths)} files)",
+    )
+    run_id = record_run(
+        results_db, run_meta, insert_time, optimize_time, search_results, nq_results
+    )
+    logger.info(f"run id: {run_id}, compare with: python results_store.py compare <base> {run_id}")
+
 
 def main():
     # insert
@@ -156,11 +333,22 @@ def main():
     # compact
     optimize_time = optimize_test()
 
-    # search (including filter)
-    search_results = search_test()
+    logger.info("read query vectors")
+    queries = get_query_vectors()
+    workers = max(
+        conc_list
+        + [open_loop_workers if open_loop_ef_list else 0, nq_sweep_conc if nq_sweep else 0]
+    )
+    with SearchWorkerPool(queries, workers) as pool:
+        # search (including filter)
+        search_results = search_test(queries, pool)
+
+        # batch size
+        nq_results = nq_sweep_test(queries, pool) if nq_sweep else None
+    queries.close()
 
     # output results
-    save_results(insert_time, optimize_time, search_results)
+    save_results(insert_time, optimize_time, search_results, nq_results)
 
 
 if __name__ == "__main__":
@@ -1,14 +1,20 @@
+import queue
+import sys
+import threading
 import time
 import traceback
+from pathlib import Path
 import numpy as np
 from pymilvus import (
-    Collection,
-    utility,
-    connections,
     CollectionSchema,
     DataType,
     FieldSchema,
 )
+
+# milvus_backend lives in the repo root, MILVUS_BACKEND=local runs without a server
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from milvus_backend import Collection, utility, connections
+from latency_histogram import LatencyHistogram
 from config import (
     milvus_uri,
     collection_name,
@@ -19,20 +25,24 @@ from config import (
     num_insert_batch,
     vector_index_name,
     dim,
+    metric_type,
 )
 import polars as pl
+import pyarrow as pa
+import pyarrow.parquet as pq
 from tqdm import tqdm
 from loguru import logger
 import concurrent
 import multiprocessing as mp
+from multiprocessing import shared_memory
 
 
 def connect():
     connections.connect(uri=milvus_uri, timeout=30)
 
 
-def get_collection():
-    return Collection(collection_name)
+def get_collection(name: str = collection_name):
+    return Collection(name)
 
 
 def drop_collection_if_existed():
@@ -70,14 +80,14 @@ def drop_index():
     col.drop_index(index_name=vector_index_name)
 
 
-def create_flat_index(metric_type: str = "COSINE"):
+def create_flat_index(metric_type: str = metric_type):
     logger.info("create FLAT index")
     col = Collection(collection_name)
     index_params = {"metric_type": metric_type, "index_type": "FLAT"}
     col.create_index(vector_field, index_params, index_name=vector_index_name)
 
 
-def create_index(metric_type: str = "COSINE"):
+def create_index(metric_type: str = metric_type):
     logger.info("create index")
     col = Collection(collection_name)
     index_params = {
@@ -91,6 +101,31 @@ def create_index(metric_type: str = "COSINE"):
     col.create_index(vector_field, index_params, index_name=vector_index_name)
 
 
+def build_index(index_type: str, params: dict, metric_type: str = metric_type):
+    """replace the vector index, return the build time in seconds."""
+    logger.info(f"build {index_type} index, params={params}")
+    col = Collection(collection_name)
+    col.release()
+    if col.has_index():
+        col.drop_index(index_name=vector_index_name)
+    start_time = time.perf_counter()
+    index_params = {"metric_type": metric_type, "index_type": index_type, "params": params}
+    col.create_index(vector_field, index_params, index_name=vector_index_name)
+    utility.wait_for_index_building_complete(collection_name)
+    return round(time.perf_counter() - start_time, 4)
+
+
+def load_stats() -> tuple[float, float]:
+    """load the collection, return the load time in seconds and loaded memory in MB."""
+    col = Collection(collection_name)
+    start_time = time.perf_counter()
+    col.load()
+    load_time = round(time.perf_counter() - start_time, 4)
+    segments = utility.get_query_segment_info(collection_name)
+    memory = round(sum(s.mem_size for s in segments) / 1024 / 1024, 2)
+    return load_time, memory
+
+
 def optimize():
     logger.info("optimizing. it may take some time, please wait ...")
     col = Collection(collection_name)
@@ -109,26 +144,239 @@ def optimize():
     wait_index()
 
 
+def server_version() -> str:
+    try:
+        return utility.get_server_version()
+    except Exception:
+        return ""
+
+
 def load_index():
     logger.info("load index")
     col = Collection(collection_name)
     col.load()
 
 
-def insert_data(embs: list[list[float]], cur_idx: int) -> int:
+def insert_data(embs: np.ndarray, cur_idx: int) -> int:
+    """insert (n, dim) float32 embeddings with pks from `cur_idx`, return the next pk.
+
+    batches are slices of `embs` and an arange of pks, no per-element python objects.
+    """
     col = Collection(collection_name)
+    embs = np.asarray(embs, dtype=np.float32)
     num_rows = len(embs)
-    for i in tqdm(range(0, num_rows, num_insert_batch)):
+    for i in range(0, num_rows, num_insert_batch):
         vector_data = embs[i : i + num_insert_batch]
         new_idx = cur_idx + len(vector_data)
-        pk_data = list(range(cur_idx, new_idx))
+        pk_data = np.arange(cur_idx, new_idx, dtype=np.int64)
         cur_idx = new_idx
         col.insert([pk_data, vector_data])
     return cur_idx
 
 
-def compute_recall(ids: list[int], gt: list[int]):
-    return sum([id in gt for id in ids]) / len(ids)
+def iter_parquet_vectors(file, column: str, batch_size: int = 65536):
+    """yield (n, dim) float32 arrays of a list<float> column, batch by batch.
+
+    the values buffer of each batch is viewed without copy when it is float32
+    already, so the whole file is never materialized.
+    """
+    pf = pq.ParquetFile(file)
+    for batch in pf.iter_batches(batch_size=batch_size, columns=[column]):
+        array = batch.column(0)
+        if isinstance(array, pa.ChunkedArray):
+            array = array.combine_chunks()
+        values = array.flatten().to_numpy(zero_copy_only=False)
+        yield values.astype(np.float32, copy=False).reshape(len(batch), -1)
+
+
+# shared memory blocks by name, kept until QueryStore.close(): numpy views of a block
+# outlive the handle that mapped it, and a collected SharedMemory unmaps the block
+_shm_blocks: dict = {}
+
+
+def _shm_view(shm: shared_memory.SharedMemory, shape: tuple) -> np.ndarray:
+    """float32 view of `shm`, it holds a buffer export so the block cannot be closed under it"""
+    count = int(np.prod(shape))
+    return np.frombuffer(shm.buf, dtype=np.float32, count=count).reshape(shape)
+
+
+class QueryStore:
+    """float32 (nq, dim) query vectors which processes attach to without a copy.
+
+    backed by a shared memory block or a memory mapped .npy file. The handle
+    pickles as the block name or file path only, so passing it to 80 workers costs
+    nothing and they all map the same pages. Indexing and len() go to the array.
+    """
+
+    def __init__(self, shape: tuple, shm_name: str = None, path: str = None):
+        self.shape = tuple(shape)
+        self.shm_name = shm_name
+        self.path = path
+        self._shm = None
+        self._array = None
+        self._owner = False
+
+    @classmethod
+    def from_array(cls, array) -> "QueryStore":
+        """copy `array` into a new shared memory block owned by this handle"""
+        array = np.asarray(array, dtype=np.float32)
+        shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        store = cls(array.shape, shm_name=shm.name)
+        store._shm, store._owner = shm, True
+        _shm_blocks[shm.name] = shm
+        store._array = _shm_view(shm, array.shape)
+        store._array[:] = array
+        return store
+
+    @classmethod
+    def from_npy(cls, path) -> "QueryStore":
+        shape = np.load(path, mmap_mode="r").shape
+        return cls(shape, path=str(path))
+
+    @classmethod
+    def from_parquet(cls, file, column: str, npy_path=None) -> "QueryStore":
+        """convert a list<float> parquet column to .npy once, then map that"""
+        npy_path = Path(npy_path or Path(file).with_suffix(".npy"))
+        if not npy_path.exists() or npy_path.stat().st_mtime < Path(file).stat().st_mtime:
+            num_rows = pq.ParquetFile(file).metadata.num_rows
+            out = None
+            cur = 0
+            for vectors in iter_parquet_vectors(file, column):
+                if out is None:
+                    tmp_path = npy_path.with_suffix(".tmp.npy")
+                    out = np.lib.format.open_memmap(
+                        tmp_path, mode="w+", dtype=np.float32, shape=(num_rows, vectors.shape[1])
+                    )
+                out[cur : cur + len(vectors)] = vectors
+                cur += len(vectors)
+            out.flush()
+            del out
+            tmp_path.replace(npy_path)
+            logger.info(f"converted {num_rows} query vectors from {file} to {npy_path}")
+        return cls.from_npy(npy_path)
+
+    @property
+    def array(self) -> np.ndarray:
+        if self._array is None:
+            if self.path is not None:
+                self._array = np.load(self.path, mmap_mode="r")
+            else:
+                # spawned workers share the parent's resource tracker, which unlinks the block
+                if self.shm_name not in _shm_blocks:
+                    _shm_blocks[self.shm_name] = shared_memory.SharedMemory(name=self.shm_name)
+                self._shm = _shm_blocks[self.shm_name]
+                self._array = _shm_view(self._shm, self.shape)
+        return self._array
+
+    def __len__(self) -> int:
+        return self.shape[0]
+
+    def __getitem__(self, idx):
+        return self.array[idx]
+
+    def __array__(self, dtype=None, copy=None):
+        return self.array if dtype is None else self.array.astype(dtype, copy=False)
+
+    def __getstate__(self):
+        return dict(shape=self.shape, shm_name=self.shm_name, path=self.path)
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def close(self):
+        """drop the view and close the block, free it if this handle created it.
+
+        views of the array still held elsewhere keep the block open: close() then
+        raises BufferError, release them first.
+        """
+        self._array = None
+        if self._shm is not None:
+            if self._owner:
+                self._shm.unlink()
+                self._owner = False
+            self._shm.close()
+            _shm_blocks.pop(self._shm.name, None)
+            self._shm = None
+
+
+def peak_rss_mb() -> float:
+    """peak resident set size of this process"""
+    import resource
+
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 2)
+
+
+def match_ranks(ids: np.ndarray, gt: np.ndarray) -> np.ndarray:
+    """rank of every result id in the ground truth row of its query.
+
+    ids: (nq, k) result ids, gt: (nq, k_gt) ground truth ids, both padded with -1
+    return: (nq, k) ranks, k_gt where the id is not in the ground truth
+    """
+    ids, gt = np.asarray(ids, dtype=np.int64), np.asarray(gt, dtype=np.int64)
+    nq, k_gt = gt.shape
+    # dense codes keep (query, id) keys within int64 whatever the pk range
+    _, codes = np.unique(np.concatenate([ids.ravel(), gt.ravel()]), return_inverse=True)
+    n_codes = int(codes.max()) + 1 if len(codes) else 1
+    rows = np.arange(nq, dtype=np.int64)[:, None]
+    id_keys = (rows * n_codes + codes[: ids.size].reshape(ids.shape)).ravel()
+    gt_keys = (rows * n_codes + codes[ids.size :].reshape(gt.shape)).ravel()
+
+    order = np.argsort(gt_keys)
+    sorted_keys = gt_keys[order]
+    pos = np.minimum(np.searchsorted(sorted_keys, id_keys), len(sorted_keys) - 1)
+    found = (sorted_keys[pos] == id_keys) & (ids.ravel() >= 0)
+    return np.where(found, order[pos] % k_gt, k_gt).reshape(ids.shape)
+
+
+def recall_metrics(
+    ids: np.ndarray,
+    gt: np.ndarray,
+    ks: list[int],
+    distances: np.ndarray = None,
+    gt_distances: np.ndarray = None,
+    larger_is_closer: bool = True,
+) -> dict:
+    """recall@k, NDCG@k and, given distances, tie-aware recall@k for every k of `ks`.
+
+    ids / distances: (nq, k) search results, gt / gt_distances: (nq, k_gt) ground
+    truth, both padded with -1 ids. A result counts for tie-aware recall@k when its
+    distance is at least as close as the k-th ground truth distance, so ids which
+    tie with the ground truth are not counted as misses.
+    """
+    ids, gt = np.asarray(ids, dtype=np.int64), np.asarray(gt, dtype=np.int64)
+    ranks = match_ranks(ids, gt)
+    positions = np.arange(ids.shape[1])
+    discounts = 1 / np.log2(positions + 2)
+
+    metrics = {}
+    for k in ks:
+        # queries of selective filters may have fewer than k true neighbors
+        expected = np.maximum((gt[:, :k] >= 0).sum(axis=1), 1)
+        hits = ranks[:, :k] < k
+        metrics[f"recall@{k}"] = round(float(np.mean(hits.sum(axis=1) / expected)), 4)
+
+        dcg = (hits * discounts[:k]).sum(axis=1)
+        idcg = np.cumsum(discounts[:k])[np.minimum(expected, k) - 1]
+        metrics[f"ndcg@{k}"] = round(float(np.mean(dcg / idcg)), 4)
+
+        if distances is not None and gt_distances is not None:
+            kth = np.asarray(gt_distances)[np.arange(len(gt)), np.minimum(expected, k) - 1]
+            dist = np.asarray(distances)[:, :k]
+            eps = 1e-6 * np.maximum(np.abs(kth), 1)
+            if larger_is_closer:
+                close = dist >= (kth - eps)[:, None]
+            else:
+                close = dist <= (kth + eps)[:, None]
+            tie_hits = np.minimum((close & (ids[:, :k] >= 0)).sum(axis=1), expected)
+            metrics[f"tie_recall@{k}"] = round(float(np.mean(tie_hits / expected)), 4)
+    return metrics
+
+
+def search_params(ef) -> dict:
+    """ef of HNSW, or a dict of the search params of any index type"""
+    if isinstance(ef, dict):
+        return dict(params=ef)
+    return dict(params=dict(ef=ef))
 
 
 def search(
@@ -141,85 +389,448 @@ def search(
     res = col.search(
         data=[query],
         anns_field=vector_field,
-        param=dict(params=dict(ef=ef)),
+        param=search_params(ef),
         limit=k,
         expr=expr,
     )
     return [r.id for r in res[0]]
 
 
-def search_by_dur(
+def search_batch(
+    col: Collection,
     queries: list[list[float]],
+    ef: int,
+    k: int,
+    expr: str = "",
+    with_distances: bool = False,
+):
+    """send all `queries` in one request, return the ids of every query.
+
+    with_distances: return (ids, distances) as (nq, k) arrays padded with -1 / nan
+    """
+    res = col.search(
+        data=queries,
+        anns_field=vector_field,
+        param=search_params(ef),
+        limit=k,
+        expr=expr,
+    )
+    if not with_distances:
+        return [[r.id for r in hits] for hits in res]
+    ids = np.full((len(queries), k), -1, dtype=np.int64)
+    distances = np.full((len(queries), k), np.nan, dtype=np.float32)
+    for i, hits in enumerate(res):
+        for j, r in enumerate(hits):
+            ids[i, j] = r.id
+            distances[i, j] = r.distance
+    return ids, distances
+
+
+def take_batch(queries, idx: int, nq: int):
+    """`nq` queries from `idx` on, wrapping around the end."""
+    batch = queries[idx : idx + nq]
+    if len(batch) < nq:
+        if isinstance(batch, np.ndarray):
+            batch = np.concatenate([batch, queries[: nq - len(batch)]])
+        else:
+            batch = batch + queries[: nq - len(batch)]
+    return batch
+
+
+class LatencyTimeline:
+    """one LatencyHistogram row per second since the start, mergeable.
+
+    requests finishing after `duration` fall into the last second.
+    """
+
+    def __init__(self, duration: int):
+        self.counts = np.zeros(
+            (max(int(np.ceil(duration)), 1), LatencyHistogram.NUM_BUCKETS), dtype=np.int64
+        )
+        self.max = np.zeros(len(self.counts))
+
+    def record(self, offset: float, latency_ms: float):
+        """offset: seconds since the start"""
+        second = min(int(offset), len(self.counts) - 1)
+        self.counts[second, LatencyHistogram.bucket(latency_ms)] += 1
+        self.max[second] = max(self.max[second], latency_ms)
+
+    def merge(self, other: "LatencyTimeline") -> "LatencyTimeline":
+        self.counts += other.counts
+        self.max = np.maximum(self.max, other.max)
+        return self
+
+    def second(self, i: int) -> LatencyHistogram:
+        hist = LatencyHistogram()
+        hist.counts = self.counts[i].copy()
+        hist.max = float(self.max[i])
+        return hist
+
+    def total(self) -> LatencyHistogram:
+        hist = LatencyHistogram()
+        hist.counts = self.counts.sum(axis=0)
+        hist.max = float(self.max.max())
+        return hist
+
+    def per_second(self) -> list[dict]:
+        """requests and latency percentiles of every second"""
+        timeline = []
+        for i in range(len(self.counts)):
+            hist = self.second(i)
+            timeline.append(
+                dict(
+                    second=i,
+                    requests=hist.count,
+                    latency_p50=round(hist.percentile(50), 4),
+                    latency_p99=round(hist.percentile(99), 4),
+                    latency_max=round(hist.max, 4),
+                )
+            )
+        return timeline
+
+
+def closed_loop(
+    col: Collection,
+    queries,
+    start_time: float,
     duration: int,
     ef: int,
     k: int,
     expr: str,
-    q: mp.Queue,
-    cond: mp.Condition,  # type: ignore
-) -> float:
-    """return the number of finished search requests."""
-    connect()
-    col = get_collection()
-
-    count = 0
+    nq: int = 1,
+) -> LatencyTimeline:
+    """search back to back from `start_time` (perf_counter) for `duration` seconds."""
+    timeline = LatencyTimeline(duration)
     query_len = len(queries)
     idx = np.random.randint(query_len)
-
-    # sync all process
-    q.put(1)
-    with cond:
-        cond.wait()
-    start_time = time.perf_counter()
     while time.perf_counter() < start_time + duration:
-        search(col, queries[idx], ef=ef, k=k, expr=expr)
-        count += 1
-        if idx >= query_len - 1:
-            idx = 0
+        req_start = time.perf_counter()
+        if nq == 1:
+            search(col, queries[idx], ef=ef, k=k, expr=expr)
         else:
-            idx += 1
-    return count
-
-
-def conc_search(
-    conc: int,
-    queries: list[list[float]],
-    conc_duration: int,
+            search_batch(col, take_batch(queries, idx, nq), ef=ef, k=k, expr=expr)
+        timeline.record(req_start - start_time, (time.perf_counter() - req_start) * 1000)
+        idx = (idx + nq) % query_len
+    return timeline
+
+
+def summarize_closed_loop(
+    timelines: list[LatencyTimeline], conc: int, duration: int, nq: int
+) -> dict:
+    timeline = LatencyTimeline(duration)
+    for t in timelines:
+        timeline.merge(t)
+    hist = timeline.total()
+    rps = round(hist.count / duration, 4)
+    qps = round(hist.count * nq / duration, 4)
+    res = dict(conc=conc, nq=nq, qps=qps, rps=rps, **hist.summary())
+    logger.info(f"test done, {res}")
+    res["timeline"] = timeline.per_second()
+    return res
+
+
+def arrival_schedule(
+    qps: float, duration: float, arrival: str = "poisson", seed: int = None
+) -> np.ndarray:
+    """send offsets in seconds from the start, `poisson` or `constant` arrivals."""
+    if arrival == "constant":
+        return np.arange(0, duration, 1 / qps)
+    rng = np.random.default_rng(seed)
+    # draw a few more gaps than expected, then cut at the duration
+    gaps = rng.exponential(1 / qps, size=int(qps * duration * 1.2) + 16)
+    offsets = np.cumsum(gaps)
+    while offsets[-1] < duration:
+        offsets = np.concatenate(
+            [offsets, offsets[-1] + np.cumsum(rng.exponential(1 / qps, size=len(gaps)))]
+        )
+    return offsets[offsets < duration]
+
+
+def open_loop(
+    col: Collection,
+    queries,
+    start_time: float,
+    schedule: np.ndarray,
     ef: int,
     k: int,
     expr: str,
-) -> float:
-    """return qps"""
-    logger.info(f"conc_test [start] - conc: {conc}")
-    try:
-        with mp.Manager() as m:
-            q, cond = m.Queue(), m.Condition()
-            with concurrent.futures.ProcessPoolExecutor(
-                mp_context=mp.get_context("spawn"), max_workers=conc
-            ) as executor:
-                future_iter = [
-                    executor.submit(
-                        search_by_dur, queries, conc_duration, ef, k, expr, q, cond
-                    )
-                    for _ in range(conc)
-                ]
-
-                # sync all processes
-                while q.qsize() < conc:
-                    time.sleep(10)
-
-                with cond:
-                    cond.notify_all()
-                    logger.info(
-                        f"syncing all process and start concurrency search, concurrency={conc}"
-                    )
-
-                process_counts = [r.result() for r in future_iter]
-                all_count = sum(process_counts)
-                qps = round(all_count / conc_duration, 4)
-                logger.info(
-                    f"test done, conc: {conc}, all_count={all_count}, qps={qps}"
+    max_inflight: int,
+    seed: int,
+) -> tuple[np.ndarray, np.ndarray, int]:
+    """send searches at `start_time` (perf_counter) + `schedule` offsets, whether or
+    not earlier ones finished.
+
+    latency is measured from the scheduled send time, so time spent waiting for a
+    free sender counts as well (no coordinated omission).
+
+    return: latencies of the successful requests in ms, their completion offsets
+        from the start in seconds, number of failed requests
+    """
+    query_len = len(queries)
+    idx = np.random.default_rng(seed).integers(query_len)
+
+    latencies = np.full(len(schedule), np.nan)
+    done = np.full(len(schedule), np.nan)
+    errors = 0
+    lock = threading.Lock()
+
+    def send(i: int, query: list[float], scheduled: float):
+        nonlocal errors
+        try:
+            search(col, query, ef=ef, k=k, expr=expr)
+            now = time.perf_counter()
+            latencies[i] = (now - scheduled) * 1000
+            done[i] = now - start_time
+        except Exception:
+            with lock:
+                errors += 1
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_inflight) as executor:
+        for i, offset in enumerate(schedule):
+            scheduled = start_time + offset
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            executor.submit(send, i, queries[(idx + i) % query_len], scheduled)
+    ok = ~np.isnan(latencies)
+    return latencies[ok], done[ok], errors
+
+
+def summarize_open_loop(results: list[tuple], qps: float, duration: int) -> dict:
+    latencies = np.concatenate([lat for lat, _, _ in results])
+    done = np.concatenate([d for _, d, _ in results])
+    errors = sum(err for _, _, err in results)
+    sent = len(latencies) + errors
+    res = dict(
+        offered_qps=qps,
+        sent_qps=round(sent / duration, 4),
+        achieved_qps=round(int((done <= duration).sum()) / duration, 4),
+        sent=sent,
+        errors=errors,
+        error_rate=round(errors / sent, 6) if sent else 0.0,
+    )
+    for name, p in (("p50", 50), ("p99", 99), ("p999", 99.9)):
+        res[f"latency_{name}"] = (
+            round(float(np.percentile(latencies, p)), 4) if len(latencies) else None
+        )
+    logger.info(f"open_loop_test done, {res}")
+    return res
+
+
+def _pool_worker(
+    worker_id: int,
+    store: QueryStore,
+    commands: mp.Queue,
+    results: mp.Queue,
+):
+    """worker of SearchWorkerPool: connect once, then run commands until None.
+
+    replies are (worker_id, command seq, status, result)
+    """
+    queries = store.array
+    connect()
+    col = get_collection()
+    results.put((worker_id, None, "ready", None))
+
+    while True:
+        cmd = commands.get()
+        if cmd is None:
+            break
+        try:
+            delay = cmd["start_at"] - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            start_time = time.perf_counter()
+            if cmd["mode"] == "closed":
+                res = closed_loop(
+                    col, queries, start_time, cmd["duration"], cmd["ef"], cmd["k"], cmd["expr"], cmd["nq"]
+                )
+            else:
+                seed = cmd["seed"] + worker_id
+                schedule = arrival_schedule(cmd["qps"], cmd["duration"], cmd["arrival"], seed)
+                res = open_loop(
+                    col, queries, start_time, schedule, cmd["ef"], cmd["k"], cmd["expr"], cmd["max_inflight"], seed
                 )
-                return qps
-    except Exception as e:
-        logger.warning(f"Fail to search all concurrencies: {conc}, reason={e}")
-        traceback.print_exc()
+            results.put((worker_id, cmd["seq"], "done", res))
+        except Exception as e:
+            results.put((worker_id, cmd["seq"], "error", repr(e)))
+    del queries
+    store.close()
+
+
+class SearchWorkerPool:
+    """search processes spawned once and reused for every (expr, ef, conc) cell.
+
+    queries live in a QueryStore which every worker maps, commands go
+    to per-worker queues and carry a wall clock start time a fraction of a second
+    ahead, which serves as the start barrier; the stop barrier is the end of the
+    duration. A sweep then costs about the sum of its measurement windows.
+
+        with SearchWorkerPool(queries, workers=80) as pool:
+            pool.conc_search(conc=10, duration=30, ef=100, k=10, expr="")
+    """
+
+    def __init__(
+        self,
+        queries,
+        workers: int,
+        start_delay: float = 0.2,
+        ready_timeout: float = 300,
+        result_timeout: float = 60,
+    ):
+        """result_timeout: seconds a command may run past its duration"""
+        self.owns_store = not isinstance(queries, QueryStore)
+        self.store = QueryStore.from_array(queries) if self.owns_store else queries
+        self.workers = workers
+        self.start_delay = start_delay
+        self.result_timeout = result_timeout
+        self.seq = 0
+
+        ctx = mp.get_context("spawn")
+        self.results = ctx.Queue()
+        self.commands = [ctx.Queue() for _ in range(workers)]
+        self.processes = [
+            ctx.Process(
+                target=_pool_worker,
+                args=(i, self.store, self.commands[i], self.results),
+                daemon=True,
+            )
+            for i in range(workers)
+        ]
+        start_time = time.perf_counter()
+        for p in self.processes:
+            p.start()
+        for _ in range(workers):
+            self.results.get(timeout=ready_timeout)
+        logger.info(
+            f"search worker pool ready, workers={workers}, cost {time.perf_counter() - start_time:.2f}s"
+        )
+
+    def _run(self, n: int, cmd: dict) -> list:
+        if n > self.workers:
+            raise ValueError(f"the pool has {self.workers} workers, {n} requested")
+        self.seq += 1
+        cmd = dict(cmd, seq=self.seq, start_at=time.time() + self.start_delay)
+        for i in range(n):
+            self.commands[i].put(cmd)
+
+        # wait for every worker, so no reply of this command is left for the next one
+        deadline = cmd["start_at"] + cmd["duration"] + self.result_timeout
+        pending, outputs, errors = set(range(n)), [], []
+        while pending:
+            try:
+                worker_id, seq, status, res = self.results.get(timeout=1)
+            except queue.Empty:
+                for i in sorted(i for i in pending if not self.processes[i].is_alive()):
+                    pending.discard(i)
+                    errors.append(f"worker {i}: exited")
+                if pending and time.time() > deadline:
+                    raise TimeoutError(f"search workers {sorted(pending)} did not reply in time")
+                continue
+            if seq != self.seq:
+                # late reply of a command which timed out
+                continue
+            pending.discard(worker_id)
+            if status == "error":
+                errors.append(f"worker {worker_id}: {res}")
+            else:
+                outputs.append(res)
+        if errors:
+            raise RuntimeError(f"search workers failed: {'; '.join(errors)}")
+        return outputs
+
+    def conc_search(
+        self, conc: int, duration: int, ef: int, k: int, expr: str, nq: int = 1
+    ) -> dict:
+        """closed loop search with `conc` workers.
+
+        return: dict(conc, nq, qps, rps, count, latency_p50/p95/p99/max in ms, timeline),
+            qps counts queries and rps requests of `nq` queries, latencies are per
+            request. timeline: requests and latency of every second, merged over all
+            workers. None if the search failed.
+        """
+        logger.info(f"conc_test [start] - conc: {conc}")
+        try:
+            timelines = self._run(
+                conc, dict(mode="closed", duration=duration, ef=ef, k=k, expr=expr, nq=nq)
+            )
+            return summarize_closed_loop(timelines, conc, duration, nq)
+        except Exception as e:
+            logger.warning(f"Fail to search all concurrencies: {conc}, reason={e}")
+            traceback.print_exc()
+
+    def open_loop_search(
+        self,
+        qps: float,
+        workers: int,
+        duration: int,
+        ef: int,
+        k: int,
+        expr: str,
+        arrival: str = "poisson",
+        max_inflight: int = 64,
+        seed: int = 0,
+    ) -> dict:
+        """offer `qps` split over `workers` workers for `duration` seconds.
+
+        return: dict(offered_qps, sent_qps, achieved_qps, sent, errors, error_rate,
+            latency_p50/p99/p999 in ms), achieved_qps counts the requests finished
+            within the duration
+        """
+        logger.info(f"open_loop_test [start] - qps: {qps}, arrival: {arrival}")
+        results = self._run(
+            workers,
+            dict(
+                mode="open",
+                qps=qps / workers,
+                duration=duration,
+                ef=ef,
+                k=k,
+                expr=expr,
+                arrival=arrival,
+                max_inflight=max_inflight,
+                seed=seed,
+            ),
+        )
+        return summarize_open_loop(results, qps, duration)
+
+    def close(self):
+        for q in self.commands:
+            q.put(None)
+        for p in self.processes:
+            p.join(timeout=10)
+        if self.owns_store:
+            self.store.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def find_saturation_knee(
+    steps: list[dict],
+    min_ratio: float = 0.95,
+    max_p99_growth: float = 5.0,
+    max_error_rate: float = 0.01,
+) -> float:
+    """highest offered qps the server still keeps up with.
+
+    a step is saturated once it serves less than `min_ratio` of the load actually
+    sent, its p99 grows over `max_p99_growth` times the p99 of the lightest step,
+    or more than `max_error_rate` of its requests fail.
+    """
+    knee = 0
+    base_p99 = steps[0]["latency_p99"] if steps else None
+    for step in steps:
+        p99 = step["latency_p99"]
+        if (
+            p99 is None
+            or step["achieved_qps"] < min_ratio * step["sent_qps"]
+            or step["error_rate"] > max_error_rate
+            or (base_p99 and p99 > max_p99_growth * base_p99)
+        ):
+            break
+        knee = step["offered_qps"]
+    return knee